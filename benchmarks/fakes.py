@@ -0,0 +1,256 @@
+"""Upstream và Firestore giả để chạy benchmark hoàn toàn offline
+
+- FakeTransport: requests transport adapter trả lời từ các response đã ghi
+  trong benchmarks/fixtures (CoinGecko, Yahoo, exchangerate-api, Product Hunt),
+  nhân bản ra đủ số symbol cần đo.
+- FakeFirestore: Firestore client trong bộ nhớ, đủ API mà các script dùng
+  (collection/document/get/set/update/delete, batch, list_documents, stream).
+"""
+import copy
+import json
+import os
+import re
+import threading
+import uuid
+from urllib.parse import parse_qs, urlparse
+
+import requests
+from requests.adapters import BaseAdapter
+from requests.structures import CaseInsensitiveDict
+
+FIXTURES_DIR = os.path.join(os.path.dirname(os.path.abspath(__file__)), 'fixtures')
+
+
+def load_fixture(name, mode='r'):
+    with open(os.path.join(FIXTURES_DIR, name), mode, **({} if 'b' in mode else {'encoding': 'utf-8'})) as f:
+        return f.read()
+
+
+class FakeTransport(BaseAdapter):
+    """Trả response đã ghi theo host/path; mount lên session của HttpClient
+
+    Coin thứ i (i >= số coin đã ghi) được sinh từ coin đã ghi theo vòng,
+    với id/symbol mới để mỗi symbol vẫn là một request riêng.
+    """
+
+    def __init__(self, leaderboard_fixture='leaderboard_2025-7-15.html'):
+        super().__init__()
+        self.markets = json.loads(load_fixture('coingecko_markets.json'))
+        self.chart = json.loads(load_fixture('yahoo_chart_BTC-USD.json'))
+        self.quote = json.loads(load_fixture('yahoo_quote.json'))['quoteResponse']['result'][0]
+        self.fx = load_fixture('exchangerate_usd.json', 'rb')
+        self.leaderboard = load_fixture(leaderboard_fixture, 'rb')
+        self.requests = 0
+        self.bytes = 0
+        self._lock = threading.Lock()
+
+    def market(self, index):
+        coin = dict(self.markets[index % len(self.markets)])
+        if index >= len(self.markets):
+            coin.update({
+                'id': f"coin-{index:04d}",
+                'symbol': f"c{index:04d}",
+                'name': f"Coin {index:04d}",
+                'market_cap_rank': index + 1
+            })
+        return coin
+
+    def chart_for(self, symbol):
+        chart = copy.deepcopy(self.chart)
+        chart['chart']['result'][0]['meta']['symbol'] = symbol
+        return chart
+
+    def quote_for(self, symbol):
+        return {**self.quote, 'symbol': symbol}
+
+    def route(self, url):
+        """(status, body bytes, content type) cho một URL"""
+        parsed = urlparse(url)
+        query = parse_qs(parsed.query)
+        path = parsed.path
+
+        if path.endswith('/coins/markets'):
+            per_page = int(query.get('per_page', ['10'])[0])
+            page = int(query.get('page', ['1'])[0])
+            start = (page - 1) * per_page
+            body = [self.market(index) for index in range(start, start + per_page)]
+            return 200, json.dumps(body).encode('utf-8'), 'application/json'
+        if '/v8/finance/chart/' in path:
+            symbol = path.rsplit('/', 1)[-1]
+            return 200, json.dumps(self.chart_for(symbol)).encode('utf-8'), 'application/json'
+        if path.endswith('/v7/finance/quote'):
+            symbols = query.get('symbols', [''])[0].split(',')
+            body = {'quoteResponse': {'result': [self.quote_for(symbol) for symbol in symbols if symbol], 'error': None}}
+            return 200, json.dumps(body).encode('utf-8'), 'application/json'
+        if '/latest/' in path:
+            return 200, self.fx, 'application/json'
+        if re.search(r'/leaderboard/daily/\d+/\d+/\d+', path):
+            return 200, self.leaderboard, 'text/html; charset=utf-8'
+        return 404, b'{"error": "not found"}', 'application/json'
+
+    def send(self, request, **kwargs):
+        status, body, content_type = self.route(request.url)
+        with self._lock:
+            self.requests += 1
+            self.bytes += len(body)
+
+        response = requests.Response()
+        response.status_code = status
+        response.reason = 'OK' if status == 200 else 'Not Found'
+        response.headers = CaseInsensitiveDict({'Content-Type': content_type, 'Content-Length': str(len(body))})
+        response._content = body
+        response.encoding = 'utf-8'
+        response.url = request.url
+        response.request = request
+        return response
+
+    def close(self):
+        pass
+
+    def install(self, http_client):
+        """Mount transport lên HttpClient (thay cho mạng thật)"""
+        http_client.session.mount('https://', self)
+        http_client.session.mount('http://', self)
+        return self
+
+
+class FakeSnapshot:
+    def __init__(self, reference, data):
+        self.reference = reference
+        self.id = reference.id
+        self._data = data
+
+    @property
+    def exists(self):
+        return self._data is not None
+
+    def to_dict(self):
+        return copy.deepcopy(self._data) if self._data is not None else None
+
+
+class FakeDocument:
+    def __init__(self, db, path):
+        self._db = db
+        self.path = path
+        self.id = path.rsplit('/', 1)[-1]
+
+    def collection(self, name):
+        return FakeCollection(self._db, f"{self.path}/{name}")
+
+    def collections(self):
+        """Subcollection có ít nhất một document (giống Firestore)"""
+        prefix = f"{self.path}/"
+        names = sorted({path[len(prefix):].split('/', 1)[0] for path in self._db.documents if path.startswith(prefix)})
+        return [self.collection(name) for name in names]
+
+    def get(self):
+        self._db.reads += 1
+        return FakeSnapshot(self, self._db.documents.get(self.path))
+
+    def set(self, data, merge=False):
+        self._db.apply('set', self, data, merge)
+
+    def update(self, field_updates):
+        self._db.apply('update', self, field_updates)
+
+    def delete(self):
+        self._db.apply('delete', self)
+
+
+class FakeCollection:
+    def __init__(self, db, path):
+        self._db = db
+        self.path = path
+        self.id = path.rsplit('/', 1)[-1]
+
+    def document(self, document_id=None):
+        return FakeDocument(self._db, f"{self.path}/{document_id or uuid.uuid4().hex[:20]}")
+
+    def _children(self):
+        prefix = f"{self.path}/"
+        return sorted(
+            path for path in self._db.documents
+            if path.startswith(prefix) and '/' not in path[len(prefix):]
+        )
+
+    def list_documents(self, page_size=None):
+        # Giống Firestore: gồm cả document không có dữ liệu nhưng có subcollection
+        prefix = f"{self.path}/"
+        ids = sorted({path[len(prefix):].split('/', 1)[0] for path in self._db.documents if path.startswith(prefix)})
+        return [self.document(doc_id) for doc_id in ids]
+
+    def stream(self):
+        for path in self._children():
+            self._db.reads += 1
+            yield FakeSnapshot(FakeDocument(self._db, path), self._db.documents[path])
+
+
+class FakeBatch:
+    def __init__(self, db):
+        self._db = db
+        self._ops = []
+
+    def set(self, doc_ref, data, merge=False):
+        self._ops.append(('set', doc_ref, data, merge))
+
+    def update(self, doc_ref, field_updates):
+        self._ops.append(('update', doc_ref, field_updates))
+
+    def delete(self, doc_ref):
+        self._ops.append(('delete', doc_ref))
+
+    def commit(self):
+        # Firestore từ chối WriteBatch quá 500 thao tác
+        if len(self._ops) > 500:
+            raise ValueError(f"WriteBatch có {len(self._ops)} thao tác, tối đa 500")
+        self._db.commits += 1
+        self._db.batch_sizes.append(len(self._ops))
+        for op, doc_ref, *args in self._ops:
+            self._db.apply(op, doc_ref, *args, count_commit=False)
+        self._ops = []
+
+
+class FakeFirestore:
+    """Firestore client trong bộ nhớ; payload được sao chép sâu khi ghi
+    (tương tự chi phí encode của client thật) và đếm số lần đọc/ghi/commit"""
+
+    def __init__(self):
+        self.documents = {}
+        self.reads = 0
+        self.writes = 0
+        self.commits = 0
+        self.batch_sizes = []
+        self.bytes_written = 0
+        self._lock = threading.Lock()
+
+    def collection(self, name):
+        return FakeCollection(self, name)
+
+    def batch(self):
+        return FakeBatch(self)
+
+    def get_all(self, references):
+        return [reference.get() for reference in references]
+
+    def apply(self, op, doc_ref, *args, count_commit=True):
+        with self._lock:
+            if count_commit:
+                self.commits += 1
+            self.writes += 1
+            if op == 'delete':
+                self.documents.pop(doc_ref.path, None)
+                return
+            data = args[0]
+            if op == 'set' and not (len(args) > 1 and args[1]):
+                data = copy.deepcopy(data)
+                self.documents[doc_ref.path] = data
+            else:
+                # Merge / update: field có giá trị DELETE_FIELD bị xóa khỏi document
+                from firebase_admin.firestore import DELETE_FIELD
+                removed = [key for key, value in data.items() if value is DELETE_FIELD]
+                data = copy.deepcopy({key: value for key, value in data.items() if value is not DELETE_FIELD})
+                document = self.documents.setdefault(doc_ref.path, {})
+                document.update(data)
+                for key in removed:
+                    document.pop(key, None)
+            self.bytes_written += len(json.dumps(data, default=str))
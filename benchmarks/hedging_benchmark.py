@@ -0,0 +1,126 @@
+"""Đo độ trễ đuôi (p50/p95/p99) của chart request: không hedge, hedge và hedge + deadline
+
+Chạy:
+    python benchmarks/hedging_benchmark.py [--size 250] [--repeats 3] [--base-ms 40]
+                                           [--tail-ms 2000] [--tail-ratio 0.03] [--deadline 1.5]
+
+Upstream là FakeTransport có độ trễ giả lập: mỗi chart request ngủ
+--base-ms (±50%), riêng --tail-ratio số request tới query1 ngủ --tail-ms
+(host chậm bất thường). query2 có cùng độ trễ nền nhưng không có đuôi.
+Mỗi chế độ lấy quote của --size coin qua chart API (INDICATORS=1 nên
+không dùng batch quote), cache mới mỗi lần lặp:
+  - off: mọi request chỉ gửi tới query1 (YAHOO_HEDGE=0)
+  - hedged: chưa có trả lời sau p95 độ trễ gần đây thì gửi bản sao tới query2
+  - deadline: như off nhưng RUN_DEADLINE=--deadline giây (kết quả một phần)
+Phân vị lấy từ metrics nhóm 'quote' (thời gian mỗi symbol, gồm cả hedge);
+kết quả là median qua các lần lặp, in dạng bảng và JSON.
+"""
+import argparse
+import contextlib
+import io
+import json
+import os
+import random
+import statistics
+import sys
+import tempfile
+import threading
+import time
+
+ROOT = os.path.dirname(os.path.abspath(__file__))
+sys.path.insert(0, ROOT)
+
+from pipeline_benchmark import new_tracker  # noqa: E402
+from fakes import FakeTransport  # noqa: E402
+
+MODES = ('off', 'hedged', 'deadline')
+
+
+class TailTransport(FakeTransport):
+    """FakeTransport với độ trễ nền cho chart request và đuôi chậm ở query1"""
+
+    def __init__(self, base, tail, tail_ratio, seed=0):
+        super().__init__()
+        self.base = base
+        self.tail = tail
+        self.tail_ratio = tail_ratio
+        self.random = random.Random(seed)
+        self._random_lock = threading.Lock()
+
+    def route(self, url):
+        if '/v8/finance/chart/' in url:
+            with self._random_lock:
+                delay = self.base * self.random.uniform(0.5, 1.5)
+                slow = self.random.random() < self.tail_ratio
+            if slow and 'query1.' in url:
+                delay = self.tail
+            time.sleep(delay)
+        return super().route(url)
+
+
+def run_mode(mode, args, seed):
+    with tempfile.TemporaryDirectory() as cache_dir:
+        tracker = new_tracker(cache_dir, TailTransport(args.base_ms / 1000, args.tail_ms / 1000,
+                                                       args.tail_ratio, seed))
+        tracker.indicators_enabled = True
+        if mode != 'hedged':
+            tracker.yahoo_hedge_urls = []
+        tracker.run_budget = args.deadline if mode == 'deadline' else 0
+        with contextlib.redirect_stdout(io.StringIO()):
+            yahoo_symbols, _ = tracker.get_top_cryptocurrencies(limit=args.size)
+            metrics = tracker.start_metrics('hedging_benchmark')
+            start = time.perf_counter()
+            crypto_data = tracker.get_all_crypto_data(yahoo_symbols)
+            elapsed = time.perf_counter() - start
+            hedge_stats = dict(tracker.http.hedge_stats)
+            tracker.close()
+
+    quote = metrics.item_summary().get('quote', {})
+    return {
+        'wall_ms': elapsed * 1000,
+        'p50_ms': quote.get('p50', 0) * 1000,
+        'p95_ms': quote.get('p95', 0) * 1000,
+        'p99_ms': quote.get('p99', 0) * 1000,
+        'max_ms': quote.get('max', 0) * 1000,
+        'quotes': len(crypto_data),
+        'hedged': hedge_stats['hedged'],
+        'hedge_wins': hedge_stats['hedge_wins'],
+        'partial': tracker.deadline_exceeded
+    }
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument('--size', type=int, default=250)
+    parser.add_argument('--repeats', type=int, default=3)
+    parser.add_argument('--base-ms', type=float, default=40)
+    parser.add_argument('--tail-ms', type=float, default=2000)
+    parser.add_argument('--tail-ratio', type=float, default=0.03)
+    parser.add_argument('--deadline', type=float, default=1.5, help="RUN_DEADLINE (giây) của chế độ deadline")
+    args = parser.parse_args()
+
+    results = {}
+    for mode in MODES:
+        runs = [run_mode(mode, args, seed) for seed in range(args.repeats)]
+        results[mode] = {
+            key: round(statistics.median(run[key] for run in runs), 1) if key.endswith('_ms')
+            else max(run[key] for run in runs)
+            for key in runs[0]
+        }
+
+    print(f"🪁 Chart request, {args.size} coin: nền {args.base_ms:g}ms, "
+          f"{args.tail_ratio:.0%} request tới query1 chậm {args.tail_ms:g}ms (median {args.repeats} lần)")
+    print(f"   {'mode':<10}{'wall ms':>9}{'p50 ms':>9}{'p95 ms':>9}{'p99 ms':>9}{'max ms':>9}"
+          f"{'quotes':>8}{'hedged':>8}{'wins':>6}  partial")
+    for mode, stats in results.items():
+        print(f"   {mode:<10}{stats['wall_ms']:>9.0f}{stats['p50_ms']:>9.0f}{stats['p95_ms']:>9.0f}"
+              f"{stats['p99_ms']:>9.0f}{stats['max_ms']:>9.0f}{stats['quotes']:>8}{stats['hedged']:>8}"
+              f"{stats['hedge_wins']:>6}  {'có' if stats['partial'] else 'không'}")
+
+    print(json.dumps({'size': args.size, 'base_ms': args.base_ms, 'tail_ms': args.tail_ms,
+                      'tail_ratio': args.tail_ratio, 'deadline_seconds': args.deadline, 'results': results}))
+    return 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
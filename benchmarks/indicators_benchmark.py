@@ -0,0 +1,185 @@
+"""Benchmark bước tính chỉ báo kỹ thuật (scripts/indicators.py) trên dữ liệu sinh ngẫu nhiên
+
+Chạy:
+    python benchmarks/indicators_benchmark.py [--symbols 1000] [--points 1440] [--repeats 5]
+
+Sinh series giá dạng random walk (có series ngắn hơn và điểm thiếu như
+response thật của Yahoo), rồi đo median của:
+  - build: xếp list Python thành các mảng (symbols × time)
+  - compute: tính mọi chỉ báo trên mảng 2-D
+  - total: compute_indicators (build + compute + chuyển về dict)
+và so với cách tính từng symbol bằng vòng lặp Python (đo trên --reference
+symbols rồi nhân lên), đồng thời kiểm tra hai cách cho cùng kết quả.
+"""
+import argparse
+import json
+import math
+import os
+import random
+import statistics
+import sys
+import time
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, os.path.join(ROOT, 'scripts'))
+
+import indicators  # noqa: E402
+
+
+def make_series(symbols, points, seed=42):
+    """Random walk 1 phút; khoảng 10% symbol ngắn hơn, 1% điểm bị thiếu (None)"""
+    rng = random.Random(seed)
+    start = 1752537600
+    series_list = []
+    for _ in range(symbols):
+        length = points if rng.random() > 0.1 else rng.randint(10, points)
+        price = rng.uniform(0.01, 50000)
+        closes, highs, lows = [], [], []
+        for _ in range(length):
+            price *= math.exp(rng.gauss(0, 0.002))
+            missing = rng.random() < 0.01
+            closes.append(None if missing else price)
+            highs.append(None if missing else price * (1 + abs(rng.gauss(0, 0.001))))
+            lows.append(None if missing else price * (1 - abs(rng.gauss(0, 0.001))))
+        timestamps = [start + 60 * (points - length + i) for i in range(length)]
+        series_list.append({'timestamp': timestamps, 'close': closes, 'high': highs, 'low': lows})
+    return series_list
+
+
+def reference_indicators(series):
+    """Cùng các chỉ báo, tính bằng vòng lặp Python cho một symbol (để đối chiếu)"""
+    closes = []
+    for value in series['close']:
+        if value is not None:
+            closes.append(value)
+        elif closes:
+            closes.append(closes[-1])
+    n = len(closes)
+    result = {'points': n}
+
+    for window in indicators.SMA_WINDOWS:
+        result[f'sma_{window}'] = sum(closes[-window:]) / window if n >= window else None
+
+    def ewm(values, alpha):
+        numerator = denominator = 0.0
+        for value in values:
+            numerator = numerator * (1 - alpha) + value
+            denominator = denominator * (1 - alpha) + 1
+        return numerator / denominator if denominator else None
+
+    result[f'ema_{indicators.EMA_SPAN}'] = ewm(closes, 2 / (indicators.EMA_SPAN + 1)) if n else None
+
+    window = indicators.VOLATILITY_WINDOW
+    if n > window:
+        returns = [math.log(closes[i] / closes[i - 1]) for i in range(n - window, n)]
+        result[f'volatility_{window}'] = statistics.stdev(returns) * 100
+    else:
+        result[f'volatility_{window}'] = None
+
+    deltas = [closes[i] - closes[i - 1] for i in range(1, n)]
+    if n > indicators.RSI_PERIOD:
+        alpha = 1 / indicators.RSI_PERIOD
+        gain = ewm([max(d, 0) for d in deltas], alpha)
+        loss = ewm([max(-d, 0) for d in deltas], alpha)
+        result[f'rsi_{indicators.RSI_PERIOD}'] = (100 - 100 / (1 + gain / loss) if loss > 0
+                                                  else (100.0 if gain > 0 else 50.0))
+    else:
+        result[f'rsi_{indicators.RSI_PERIOD}'] = None
+
+    peak, drawdown = -math.inf, 0.0
+    for value in closes:
+        peak = max(peak, value)
+        drawdown = min(drawdown, value / peak - 1)
+    result['max_drawdown_percent'] = drawdown * 100 if n else None
+
+    last = series['timestamp'][-1]
+    window_points = [(h, l) for t, h, l in zip(series['timestamp'], series['high'], series['low'])
+                     if t >= last - indicators.HIGH_LOW_SECONDS]
+    highs = [h for h, _ in window_points if h is not None]
+    lows = [l for _, l in window_points if l is not None]
+    result['high_24h'] = max(highs) if highs else None
+    result['low_24h'] = min(lows) if lows else None
+    return result
+
+
+def matches(vectorized, reference):
+    for name, expected in reference.items():
+        actual = vectorized.get(name)
+        if expected is None or actual is None:
+            if expected is not actual:
+                return f"{name}: {actual} != {expected}"
+        elif not math.isclose(actual, expected, rel_tol=1e-5, abs_tol=1e-6):
+            return f"{name}: {actual} != {expected}"
+    return None
+
+
+def timed(func, repeats):
+    samples = []
+    result = None
+    for _ in range(repeats):
+        start = time.perf_counter()
+        result = func()
+        samples.append(time.perf_counter() - start)
+    return statistics.median(samples) * 1000, result
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument('--symbols', type=int, default=1000)
+    parser.add_argument('--points', type=int, default=1440)
+    parser.add_argument('--repeats', type=int, default=5)
+    parser.add_argument('--reference', type=int, default=50, help="Số symbol tính bằng vòng lặp Python")
+    args = parser.parse_args()
+
+    series_list = make_series(args.symbols, args.points)
+    length = args.points
+
+    # Chạy một lần trước để import numpy không bị tính vào kết quả
+    indicators.compute_indicators(series_list[:2], points=length)
+
+    def build():
+        return [indicators.to_matrix(series_list, field, length) for field in ('close', 'high', 'low', 'timestamp')]
+
+    build_ms, matrices = timed(build, args.repeats)
+    compute_ms, _ = timed(lambda: indicators.compute_matrix(*matrices), args.repeats)
+    total_ms, results = timed(lambda: indicators.compute_indicators(series_list, points=length), args.repeats)
+
+    reference_count = min(args.reference, args.symbols)
+    reference_ms, references = timed(
+        lambda: [reference_indicators(series) for series in series_list[:reference_count]], 1
+    )
+    loop_ms = reference_ms / reference_count * args.symbols
+
+    mismatches = [
+        f"symbol {index}: {error}"
+        for index, reference in enumerate(references)
+        for error in [matches(results[index], reference)] if error
+    ]
+
+    print(f"📐 Chỉ báo kỹ thuật: {args.symbols} symbols × {args.points} điểm")
+    print(f"   build (list -> mảng 2-D)   {build_ms:>9.1f}ms")
+    print(f"   compute (NumPy)            {compute_ms:>9.1f}ms")
+    print(f"   total compute_indicators   {total_ms:>9.1f}ms")
+    print(f"   vòng lặp Python (ước tính) {loop_ms:>9.1f}ms  (đo trên {reference_count} symbols, "
+          f"nhanh hơn {loop_ms / total_ms:.1f}x)")
+    if mismatches:
+        print(f"❌ {len(mismatches)} symbol lệch so với cách tính từng symbol:")
+        for mismatch in mismatches[:10]:
+            print(f"   • {mismatch}")
+    else:
+        print(f"✅ Kết quả khớp với cách tính từng symbol ({reference_count} symbols)")
+
+    print(json.dumps({
+        'symbols': args.symbols,
+        'points': args.points,
+        'build_ms': round(build_ms, 3),
+        'compute_ms': round(compute_ms, 3),
+        'total_ms': round(total_ms, 3),
+        'python_loop_ms': round(loop_ms, 3),
+        'matches_reference': not mismatches
+    }))
+    return 1 if mismatches else 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
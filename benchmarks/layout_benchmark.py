@@ -0,0 +1,160 @@
+"""So sánh layout Firestore của dữ liệu crypto: 'single' (một document) và 'sharded'
+
+Chạy:
+    python benchmarks/layout_benchmark.py [--sizes 10,250,1000] [--repeats 3] [--changed 0.1]
+
+Dữ liệu quote được tạo offline qua FakeTransport, rồi lưu bằng
+save_all_data_to_firestore (chế độ upsert) vào FakeFirestore với từng layout:
+  - first: lần ghi đầu tiên (Firestore trống)
+  - update: lần ghi tiếp theo khi --changed (tỷ lệ) coin đổi giá
+  - read_one / read_page: số byte client phải tải để đọc một coin / một
+    trang 50 coin (single: cả document; sharded: summary + document coin)
+  - manifest: kích thước manifest hash từng field (chỉ layout sharded, đã
+    tính trong số byte ghi)
+Kích thước tính theo JSON của document (xấp xỉ kích thước Firestore tính);
+document lớn hơn 1 MiB (giới hạn của Firestore) được đánh dấu ❌. Thời gian
+đo trên Firestore giả nên chỉ phản ánh chi phí CPU (encode, diff), không
+gồm độ trễ mạng — số byte và số document ghi mới phản ánh chi phí thật.
+"""
+import argparse
+import contextlib
+import io
+import json
+import os
+import statistics
+import sys
+import tempfile
+import time
+
+ROOT = os.path.dirname(os.path.abspath(__file__))
+sys.path.insert(0, ROOT)
+
+from pipeline_benchmark import new_tracker  # noqa: E402
+from fakes import FakeFirestore  # noqa: E402
+from sharded_layout import asset_id  # noqa: E402
+
+FIRESTORE_MAX_DOCUMENT_BYTES = 1024 * 1024
+PAGE_SIZE = 50
+
+
+def document_size(data):
+    return len(json.dumps(data, ensure_ascii=False, default=str).encode('utf-8'))
+
+
+def load_quotes(size):
+    """crypto_data / coin_info / stock_indices / commodities của universe size coin"""
+    with tempfile.TemporaryDirectory() as cache_dir, contextlib.redirect_stdout(io.StringIO()):
+        tracker = new_tracker(cache_dir)
+        tracker.get_usd_to_vnd_rate()
+        yahoo_symbols, coin_info = tracker.get_top_cryptocurrencies(limit=size)
+        crypto_data, stock_indices, commodities = tracker.fetch_all_quotes(yahoo_symbols)
+        fx = tracker.fx
+        tracker.close()
+    return (crypto_data, coin_info, stock_indices, commodities), fx
+
+
+def with_changed_prices(crypto_data, ratio):
+    """Bản sao crypto_data với ratio số coin đổi giá (+0.5%)"""
+    changed = {}
+    step = max(1, round(1 / ratio)) if ratio > 0 else None
+    for index, (symbol, data) in enumerate(crypto_data.items()):
+        if step and index % step == 0:
+            price = data['current_price'] * 1.005
+            data = {**data, 'current_price': price, 'change': price - data['previous_close']}
+        changed[symbol] = data
+    return changed
+
+
+def publish(layout, quotes, fx, db, cache_dir):
+    tracker = new_tracker(cache_dir)
+    tracker.crypto_layout = layout
+    tracker.publish_mode = 'upsert'
+    tracker.db = db
+    tracker.fx = fx
+    tracker.usd_to_vnd_rate = fx.factor('USD', 'VND')
+    writes, written = db.writes, db.bytes_written
+    with contextlib.redirect_stdout(io.StringIO()):
+        start = time.perf_counter()
+        tracker.save_all_data_to_firestore(*quotes)
+        elapsed = time.perf_counter() - start
+        tracker.close()
+    return elapsed * 1000, db.writes - writes, db.bytes_written - written
+
+
+def bench_layout(layout, quotes, fx, ratio, repeats):
+    crypto_data, coin_info, stock_indices, commodities = quotes
+    updated = (with_changed_prices(crypto_data, ratio), coin_info, stock_indices, commodities)
+    first_ms, update_ms = [], []
+    for _ in range(repeats):
+        db = FakeFirestore()
+        with tempfile.TemporaryDirectory() as cache_dir:
+            ms, first_writes, first_bytes = publish(layout, quotes, fx, db, cache_dir)
+            first_ms.append(ms)
+            ms, update_writes, update_bytes = publish(layout, updated, fx, db, cache_dir)
+            update_ms.append(ms)
+
+    documents = {path: data for path, data in db.documents.items()
+                 if path.startswith('crypto & finance/cryptocurrencies')}
+    # Manifest hash từng field của layout sharded (ghi lại mỗi lần có thay đổi)
+    manifest = db.documents.get('publish_manifests/crypto & finance__cryptocurrencies_assets')
+    summary = document_size(documents['crypto & finance/cryptocurrencies'])
+    largest = max(document_size(data) for data in documents.values())
+    if layout == 'sharded':
+        assets = [path for path in documents if path != 'crypto & finance/cryptocurrencies']
+        first_symbol = asset_id(next(iter(crypto_data)))
+        read_one = document_size(documents[f'crypto & finance/cryptocurrencies/assets/{first_symbol}'])
+        read_page = summary + sum(document_size(documents[path]) for path in assets[:PAGE_SIZE])
+    else:
+        read_one = read_page = summary
+
+    return {
+        'documents': len(documents),
+        'largest_document_bytes': largest,
+        'exceeds_limit': largest > FIRESTORE_MAX_DOCUMENT_BYTES,
+        'first_ms': round(statistics.median(first_ms), 3),
+        'first_writes': first_writes,
+        'first_bytes': first_bytes,
+        'update_ms': round(statistics.median(update_ms), 3),
+        'update_writes': update_writes,
+        'update_bytes': update_bytes,
+        'read_one_bytes': read_one,
+        'read_page_bytes': read_page,
+        'manifest_bytes': document_size(manifest) if manifest else 0
+    }
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument('--sizes', default='10,250,1000')
+    parser.add_argument('--repeats', type=int, default=3)
+    parser.add_argument('--changed', type=float, default=0.1, help="Tỷ lệ coin đổi giá ở lần ghi update")
+    args = parser.parse_args()
+
+    results = {}
+    for size in [int(value) for value in args.sizes.split(',')]:
+        quotes, fx = load_quotes(size)
+        results[size] = {
+            layout: bench_layout(layout, quotes, fx, args.changed, args.repeats)
+            for layout in ('single', 'sharded')
+        }
+
+    print(f"🧩 Layout Firestore của crypto (upsert, {args.changed:.0%} coin đổi giá ở lần update)")
+    print(f"   {'coins':>6} {'layout':<8}{'docs':>6}{'max doc KiB':>13}{'first ms':>10}{'first KiB':>11}"
+          f"{'upd ms':>9}{'upd KiB':>9}{'upd docs':>9}{'1 coin KiB':>12}{'page KiB':>10}{'manifest KiB':>14}")
+    for size, layouts in results.items():
+        for layout, stats in layouts.items():
+            flag = ' ❌' if stats['exceeds_limit'] else ''
+            print(f"   {size:>6} {layout:<8}{stats['documents']:>6}"
+                  f"{stats['largest_document_bytes'] / 1024:>13.1f}{stats['first_ms']:>10.1f}"
+                  f"{stats['first_bytes'] / 1024:>11.1f}{stats['update_ms']:>9.1f}"
+                  f"{stats['update_bytes'] / 1024:>9.1f}{stats['update_writes']:>9}"
+                  f"{stats['read_one_bytes'] / 1024:>12.1f}{stats['read_page_bytes'] / 1024:>10.1f}"
+                  f"{stats['manifest_bytes'] / 1024:>14.1f}{flag}")
+    print(f"   ❌ = document vượt giới hạn {FIRESTORE_MAX_DOCUMENT_BYTES // 1024} KiB của Firestore")
+
+    print(json.dumps({'changed_ratio': args.changed, 'results': results}))
+    return 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
@@ -0,0 +1,97 @@
+"""So sánh thời gian end-to-end của full_market_overview: tuần tự và pipeline
+
+Chạy:
+    python benchmarks/overview_benchmark.py [--sizes 10,250] [--repeats 3]
+                                            [--coingecko-ms 400] [--yahoo-ms 60] [--fx-ms 300]
+
+Upstream là FakeTransport có thêm độ trễ giả lập theo host (mỗi request
+ngủ --*-ms), Firestore là FakeFirestore. Mỗi lần lặp dùng tracker, cache
+và Firestore mới (cold run), chế độ OVERVIEW_PIPELINE=0 (từng phase nối
+tiếp) và OVERVIEW_PIPELINE=1 (các nhóm tài sản chạy song song). Kết quả
+(median ms) được in dạng bảng và JSON.
+"""
+import argparse
+import contextlib
+import io
+import json
+import os
+import statistics
+import sys
+import tempfile
+import time
+
+ROOT = os.path.dirname(os.path.abspath(__file__))
+sys.path.insert(0, ROOT)
+
+from pipeline_benchmark import new_tracker  # noqa: E402
+from fakes import FakeTransport  # noqa: E402
+
+
+class SlowTransport(FakeTransport):
+    """FakeTransport với độ trễ cố định theo host"""
+
+    def __init__(self, delays):
+        super().__init__()
+        self.delays = delays
+
+    def route(self, url):
+        for host, delay in self.delays.items():
+            if host in url:
+                time.sleep(delay)
+                break
+        return super().route(url)
+
+
+def run_overview(size, pipeline, delays):
+    with tempfile.TemporaryDirectory() as cache_dir:
+        os.environ['METRICS_DIR'] = cache_dir
+        os.environ['FX_LAST_GOOD_PATH'] = os.path.join(cache_dir, 'fx_last_good.json')
+        tracker = new_tracker(cache_dir, SlowTransport(delays))
+        tracker.top_limit = size
+        tracker.pipeline_enabled = pipeline
+        with contextlib.redirect_stdout(io.StringIO()):
+            start = time.perf_counter()
+            ok = tracker.full_market_overview()
+            elapsed = time.perf_counter() - start
+            tracker.close()
+        if not ok:
+            raise RuntimeError(f"full_market_overview lỗi (size={size}, pipeline={pipeline})")
+        return elapsed * 1000
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument('--sizes', default='10,250')
+    parser.add_argument('--repeats', type=int, default=3)
+    parser.add_argument('--coingecko-ms', type=float, default=400)
+    parser.add_argument('--yahoo-ms', type=float, default=60)
+    parser.add_argument('--fx-ms', type=float, default=300)
+    args = parser.parse_args()
+
+    delays = {
+        'coingecko': args.coingecko_ms / 1000,
+        'yahoo': args.yahoo_ms / 1000,
+        'exchangerate': args.fx_ms / 1000
+    }
+    results = {}
+    for size in [int(value) for value in args.sizes.split(',')]:
+        results[size] = {
+            mode: round(statistics.median(
+                run_overview(size, mode == 'pipeline', delays) for _ in range(args.repeats)
+            ), 3)
+            for mode in ('sequential', 'pipeline')
+        }
+
+    print(f"🚦 full_market_overview end-to-end (độ trễ: CoinGecko {args.coingecko_ms:.0f}ms, "
+          f"Yahoo {args.yahoo_ms:.0f}ms, tỷ giá {args.fx_ms:.0f}ms mỗi request)")
+    print(f"   {'coins':>6}{'tuần tự':>12}{'pipeline':>12}{'nhanh hơn':>11}")
+    for size, timings in results.items():
+        print(f"   {size:>6}{timings['sequential']:>10.0f}ms{timings['pipeline']:>10.0f}ms"
+              f"{timings['sequential'] / timings['pipeline']:>10.2f}x")
+
+    print(json.dumps({'delays_ms': {host: delay * 1000 for host, delay in delays.items()}, 'results': results}))
+    return 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
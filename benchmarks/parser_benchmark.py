@@ -0,0 +1,175 @@
+"""So sánh engine parse leaderboard Product Hunt cũ và mới trên các file HTML đã lưu
+
+Chạy:
+    python benchmarks/parser_benchmark.py [--repeats 20] [fixture.html ...]
+
+Với mỗi fixture in thời gian parse (median) và bộ nhớ đỉnh (tracemalloc)
+của engine cũ (html.parser, dựng cả trang, regex find/find_all), engine DOM
+mới và đường đọc state JSON nhúng, đồng thời kiểm tra:
+  - engine DOM mới cho ra kết quả giống hệt engine cũ
+  - nếu fixture có state JSON, kết quả đường JSON khớp với DOM (rank, tên,
+    mô tả, link, ảnh) và topics của DOM là phần đầu của topics đầy đủ
+
+leaderboard_2025-7-15_nextdata.html là fixture tổng hợp (DOM của trang đã lưu +
+state Apollo dựng tay theo cấu trúc __NEXT_DATA__), không phải trang Product Hunt
+thật: nó kiểm tra cách giải mã state chứ không chứng minh trang thật có payload
+này. Trang không có state dùng được thì scraper tự chuyển sang DOM.
+"""
+import argparse
+import contextlib
+import glob
+import io
+import json
+import os
+import re
+import statistics
+import sys
+import time
+import tracemalloc
+from datetime import date
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, os.path.join(ROOT, 'scripts'))
+FIXTURES_DIR = os.path.join(os.path.dirname(os.path.abspath(__file__)), 'fixtures')
+
+from bs4 import BeautifulSoup  # noqa: E402
+
+from producthunt_scraper import ProductHuntScraper  # noqa: E402
+from run_context import RunContext  # noqa: E402
+
+
+class LegacyParser:
+    """Engine parse trước khi tối ưu (giữ nguyên để làm mốc so sánh)"""
+
+    def __init__(self, scraper):
+        self.scraper = scraper
+
+    def parse_products(self, html):
+        soup = BeautifulSoup(html, 'html.parser')
+        product_elements = soup.find_all('section', {'data-test': re.compile(r'post-item-\d+')})
+        if not product_elements:
+            product_elements = soup.find_all('section', class_=re.compile(r'.*group.*relative.*flex.*'))
+
+        products = []
+        for i, element in enumerate(product_elements[:20]):
+            product = self.extract_product_info(element, rank=i + 1)
+            if product and product['title'] != 'N/A':
+                products.append(product)
+        return products
+
+    def extract_product_info(self, element, rank):
+        product = {
+            'rank': rank,
+            'title': 'N/A',
+            'description': 'N/A',
+            'link': 'N/A',
+            'topics': [],
+            'image': 'N/A',
+            'date': self.scraper.get_yesterday_date()
+        }
+        name_link = element.find('a', {'data-test': re.compile(r'post-name-\d+')})
+        if name_link:
+            product['title'] = name_link.get_text(strip=True)
+            href = name_link.get('href')
+            if href:
+                product['link'] = f"{self.scraper.base_url}{href}" if href.startswith('/') else href
+        desc_element = element.find('a', class_=re.compile(r'.*text-secondary.*'))
+        if desc_element:
+            product['description'] = desc_element.get_text(strip=True)
+        for link in element.find_all('a', href=re.compile(r'/topics/')):
+            topic_name = link.get_text(strip=True)
+            if topic_name:
+                product['topics'].append(topic_name)
+        img_element = element.find('img')
+        if img_element:
+            product['image'] = img_element.get('src') or img_element.get('srcset', '').split(' ')[0]
+        return product
+
+
+def json_matches_dom(json_products, dom_products):
+    """Đường JSON có thể có thêm vote và topics, nhưng các field chung phải khớp DOM"""
+    fields = ('rank', 'title', 'description', 'link', 'image')
+    if len(json_products) < len(dom_products):
+        return False
+    for from_json, from_dom in zip(json_products, dom_products):
+        if any(from_json[field] != from_dom[field] for field in fields):
+            return False
+        if from_json['topics'][:len(from_dom['topics'])] != from_dom['topics']:
+            return False
+    return True
+
+
+def measure(parse, html, repeats):
+    """Trả về (kết quả, median giây, bộ nhớ đỉnh byte)"""
+    timings = []
+    result = None
+    with contextlib.redirect_stdout(io.StringIO()):
+        for _ in range(repeats):
+            start = time.perf_counter()
+            result = parse(html)
+            timings.append(time.perf_counter() - start)
+
+        tracemalloc.start()
+        parse(html)
+        _, peak = tracemalloc.get_traced_memory()
+        tracemalloc.stop()
+    return result, statistics.median(timings), peak
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument('fixtures', nargs='*', help="File HTML (mặc định: benchmarks/fixtures/*.html)")
+    parser.add_argument('--repeats', type=int, default=20)
+    args = parser.parse_args()
+
+    fixtures = args.fixtures or sorted(glob.glob(os.path.join(FIXTURES_DIR, '*.html')))
+    with contextlib.redirect_stdout(io.StringIO()):
+        scraper = ProductHuntScraper(use_db=False)
+        json_scraper = ProductHuntScraper(use_db=False)
+    # Cố định ngày để kết quả không phụ thuộc thời điểm chạy benchmark
+    scraper.context = json_scraper.context = RunContext(target_date=date(2025, 7, 15))
+    scraper.use_embedded_json = False
+    json_scraper.use_embedded_json = True
+    engines = {
+        'legacy': LegacyParser(scraper).parse_products,
+        f'fast[{scraper.parser_backend}]': scraper.parse_products,
+        'embedded-json': json_scraper.parse_products
+    }
+
+    results = []
+    mismatches = 0
+    for path in fixtures:
+        with open(path, 'rb') as f:
+            html = f.read()
+
+        outputs = {}
+        for name, parse in engines.items():
+            output, seconds, peak = measure(parse, html, args.repeats)
+            outputs[name] = output
+            results.append({
+                'fixture': os.path.basename(path),
+                'engine': name,
+                'path': json_scraper.extraction_path if parse == json_scraper.parse_products else 'dom',
+                'products': len(output),
+                'parse_ms': round(seconds * 1000, 2),
+                'peak_kib': round(peak / 1024, 1)
+            })
+
+        legacy, dom, embedded = outputs.values()
+        if dom != legacy:
+            mismatches += 1
+            print(f"❌ {os.path.basename(path)}: kết quả engine DOM mới KHÁC engine cũ")
+        if json_scraper.extraction_path == 'json' and not json_matches_dom(embedded, dom):
+            mismatches += 1
+            print(f"❌ {os.path.basename(path)}: kết quả đường JSON KHÁC đường DOM")
+
+    print(f"{'fixture':<40}{'engine':<16}{'path':<6}{'products':>9}{'parse':>11}{'peak mem':>12}")
+    for row in results:
+        print(f"{row['fixture']:<40}{row['engine']:<16}{row['path']:<6}{row['products']:>9}"
+              f"{row['parse_ms']:>9.2f}ms{row['peak_kib']:>9.1f}KiB")
+    print(json.dumps(results))
+    return 1 if mismatches else 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
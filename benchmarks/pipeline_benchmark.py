@@ -0,0 +1,227 @@
+"""Benchmark offline từng stage của CryptoTracker và ProductHuntScraper
+
+Chạy:
+    python benchmarks/pipeline_benchmark.py [--sizes 10,100,1000] [--repeats 3]
+                                            [--output result.json] [--compare baseline.json]
+
+Mọi request đi qua FakeTransport (response đã ghi trong benchmarks/fixtures),
+mọi thao tác ghi đi vào FakeFirestore trong bộ nhớ, nên kết quả chỉ phản ánh
+chi phí CPU của code (không phụ thuộc mạng). Mỗi lần lặp dùng tracker, cache
+và Firestore giả mới (cold run). Rate limit theo host của HttpClient được
+tắt (HTTP_RATE_LIMIT=0) vì không có upstream thật để bảo vệ.
+
+Stage của tracker (đo ở từng kích thước universe):
+    fx_fetch, toplist_fetch (các trang /coins/markets lấy song song),
+    quote_fetch (fetch_all_quotes),
+    chart_transform (get_crypto_data_from_yahoo cho từng symbol),
+    display, persist (save_all_data_to_firestore)
+Stage của scraper (đo trên từng fixture leaderboard):
+    fetch, parse (parse_products), extract (extract_product_info),
+    display, persist (save_to_firestore)
+
+Kết quả (median / min ms của từng stage) được in dạng bảng và JSON kèm độ
+phủ quote của universe ở từng kích thước; dùng --output để lưu và
+--compare để so với một lần chạy trước (vd: commit cũ).
+"""
+import argparse
+import contextlib
+import io
+import json
+import os
+import platform
+import statistics
+import subprocess
+import sys
+import tempfile
+import time
+from datetime import date
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, os.path.join(ROOT, 'scripts'))
+os.environ.setdefault('HTTP_RATE_LIMIT', '0')
+
+from fakes import FakeFirestore, FakeTransport  # noqa: E402
+from crypto_tracker import CryptoTracker  # noqa: E402
+from producthunt_scraper import ProductHuntScraper  # noqa: E402
+from quote_cache import QuoteCache  # noqa: E402
+from run_context import RunContext  # noqa: E402
+from sharded_layout import AssetUniverse  # noqa: E402
+from symbol_index import SymbolIndex  # noqa: E402
+
+# fixture -> đọc state JSON nhúng (PH_EMBEDDED_JSON) hay chỉ đo đường DOM; fixture nextdata là trang tổng hợp,
+# không phải trang thật
+LEADERBOARD_FIXTURES = {'leaderboard_2025-7-15.html': False, 'leaderboard_2025-7-15_nextdata.html': True}
+
+
+class StageTimer:
+    """Ghi thời gian của từng stage qua nhiều lần lặp"""
+
+    def __init__(self, warmup=0):
+        # Bỏ qua warmup lần lặp đầu (import lười, cache của thư viện...)
+        self.warmup = warmup
+        self.samples = {}
+
+    @contextlib.contextmanager
+    def stage(self, name):
+        start = time.perf_counter()
+        try:
+            yield
+        finally:
+            self.samples.setdefault(name, []).append(time.perf_counter() - start)
+
+    def measured(self):
+        return {name: samples[self.warmup:] for name, samples in self.samples.items()}
+
+
+def new_tracker(cache_dir, transport=None):
+    tracker = CryptoTracker(use_db=False)
+    (transport or FakeTransport()).install(tracker.http)
+    tracker.cache = QuoteCache(path=os.path.join(cache_dir, 'quote_cache.sqlite3'))
+    tracker.symbol_index = SymbolIndex(path=os.path.join(cache_dir, 'symbol_index.sqlite3'))
+    tracker.asset_universe = AssetUniverse(path=os.path.join(cache_dir, 'asset_universe.json'))
+    tracker.history_enabled = False
+    tracker.use_db = True
+    tracker.db = FakeFirestore()
+    return tracker
+
+
+def bench_tracker(size, repeats, warmup):
+    timer = StageTimer(warmup)
+    coverage = 0.0
+    for _ in range(warmup + repeats):
+        with tempfile.TemporaryDirectory() as cache_dir:
+            tracker = new_tracker(cache_dir)
+
+            with timer.stage('fx_fetch'):
+                tracker.get_usd_to_vnd_rate()
+            with timer.stage('toplist_fetch'):
+                yahoo_symbols, coin_info = tracker.get_top_cryptocurrencies(limit=size)
+            with timer.stage('quote_fetch'):
+                crypto_data, stock_indices, commodities = tracker.fetch_all_quotes(yahoo_symbols)
+            with timer.stage('chart_transform'):
+                for symbol in yahoo_symbols:
+                    tracker.get_crypto_data_from_yahoo(symbol)
+            with timer.stage('display'):
+                tracker.display_crypto_data_yahoo(crypto_data, coin_info)
+                tracker.display_all_stock_indices(stock_indices)
+                tracker.display_all_commodities(commodities)
+            with timer.stage('persist'):
+                tracker.save_all_data_to_firestore(crypto_data, coin_info, stock_indices, commodities)
+
+            if not tracker.db.documents:
+                raise RuntimeError("Không có document nào được ghi vào Firestore giả")
+            if len(yahoo_symbols) != size:
+                raise RuntimeError(f"Universe chỉ có {len(yahoo_symbols)}/{size} symbols")
+            coverage = len(crypto_data) / size
+            tracker.close()
+    return timer, coverage
+
+
+def bench_scraper(fixture, repeats, warmup, embedded_json=False):
+    timer = StageTimer(warmup)
+    products = []
+    for _ in range(warmup + repeats):
+        scraper = ProductHuntScraper(use_db=False, context=RunContext(target_date=date(2025, 7, 15)))
+        FakeTransport(leaderboard_fixture=fixture).install(scraper.http)
+        scraper.use_embedded_json = embedded_json
+        scraper.use_db = True
+        scraper.db = FakeFirestore()
+
+        with timer.stage('fetch'):
+            html = scraper.http.get(scraper.build_url()).content
+        with timer.stage('parse'):
+            products = scraper.parse_products(html)
+        with timer.stage('extract'):
+            for rank, element in enumerate(scraper.find_product_sections(html)[:20], start=1):
+                scraper.extract_product_info(element, rank)
+        with timer.stage('display'):
+            scraper.print_detailed_results(products)
+        with timer.stage('persist'):
+            saved = scraper.save_to_firestore(products)
+        if not saved or len(scraper.db.documents) != len(products):
+            raise RuntimeError(f"Ghi Firestore giả thất bại ({fixture})")
+        scraper.http.close()
+    return timer, len(products)
+
+
+def summarize(pipeline, size, timer):
+    return [{
+        'pipeline': pipeline,
+        'size': size,
+        'stage': stage,
+        'median_ms': round(statistics.median(samples) * 1000, 3),
+        'min_ms': round(min(samples) * 1000, 3),
+        'repeats': len(samples)
+    } for stage, samples in timer.measured().items()]
+
+
+def git_commit():
+    try:
+        return subprocess.run(['git', 'rev-parse', '--short', 'HEAD'], cwd=ROOT,
+                              capture_output=True, text=True, check=True).stdout.strip()
+    except (OSError, subprocess.CalledProcessError):
+        return None
+
+
+def result_key(row):
+    return (row['pipeline'], str(row['size']), row['stage'])
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument('--sizes', default='10,100,1000', help="Số symbol của universe crypto")
+    parser.add_argument('--repeats', type=int, default=3)
+    parser.add_argument('--warmup', type=int, default=1, help="Số lần lặp chạy trước, không tính vào kết quả")
+    parser.add_argument('--output', help="Ghi kết quả JSON ra file")
+    parser.add_argument('--compare', help="File JSON của lần chạy trước để so sánh")
+    args = parser.parse_args()
+
+    rows = []
+    coverage = {}
+    with contextlib.redirect_stdout(io.StringIO()):
+        for size in (int(value) for value in args.sizes.split(',')):
+            timer, coverage[str(size)] = bench_tracker(size, args.repeats, args.warmup)
+            rows.extend(summarize('crypto_tracker', size, timer))
+        for fixture, embedded_json in LEADERBOARD_FIXTURES.items():
+            timer, count = bench_scraper(fixture, args.repeats, args.warmup, embedded_json)
+            rows.extend(summarize('producthunt_scraper', f"{fixture}:{count}", timer))
+
+    report = {
+        'meta': {
+            'commit': git_commit(),
+            'python': sys.version.split()[0],
+            'platform': platform.platform(),
+            'created_at': time.strftime('%Y-%m-%dT%H:%M:%S'),
+            'repeats': args.repeats,
+            'warmup': args.warmup,
+            'coverage': coverage
+        },
+        'results': rows
+    }
+
+    previous = {}
+    if args.compare:
+        with open(args.compare, encoding='utf-8') as f:
+            previous = {result_key(row): row for row in json.load(f)['results']}
+
+    print(f"{'pipeline':<22}{'size':<42}{'stage':<17}{'median':>11}{'min':>11}{'vs base':>10}")
+    for row in rows:
+        base = previous.get(result_key(row))
+        delta = f"{(row['median_ms'] / base['median_ms'] - 1) * 100:+.0f}%" if base and base['median_ms'] else '-'
+        print(f"{row['pipeline']:<22}{str(row['size']):<42}{row['stage']:<17}"
+              f"{row['median_ms']:>9.2f}ms{row['min_ms']:>9.2f}ms{delta:>10}")
+
+    for size, ratio in coverage.items():
+        print(f"📊 Độ phủ quote ở universe {size}: {ratio * 100:.1f}%")
+
+    if args.output:
+        with open(args.output, 'w', encoding='utf-8') as f:
+            json.dump(report, f, indent=2)
+            f.write('\n')
+        print(f"💾 Đã ghi kết quả: {args.output}")
+    print(json.dumps(report))
+    return 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
@@ -0,0 +1,100 @@
+"""Đo thời gian import (cold start) của các script và so với baseline
+
+Chạy:
+    python benchmarks/startup_benchmark.py            # so với baseline, exit 1 nếu chậm hơn
+    python benchmarks/startup_benchmark.py --update   # ghi lại baseline
+"""
+import argparse
+import json
+import os
+import statistics
+import subprocess
+import sys
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+SCRIPTS_DIR = os.path.join(ROOT, 'scripts')
+BASELINE_PATH = os.path.join(os.path.dirname(os.path.abspath(__file__)), 'startup_baseline.json')
+
+MODULES = ['crypto_tracker', 'producthunt_scraper']
+
+# Các thư viện nặng không được import ngay khi load script
+LAZY_MODULES = ['firebase_admin', 'google.cloud.firestore', 'bs4', 'pytz', 'numpy']
+
+
+def import_time_us(module):
+    """Thời gian import cộng dồn (micro giây) theo python -X importtime"""
+    result = subprocess.run(
+        [sys.executable, '-X', 'importtime', '-c', f'import {module}'],
+        cwd=SCRIPTS_DIR, capture_output=True, text=True, check=True
+    )
+    for line in reversed(result.stderr.splitlines()):
+        parts = [part.strip() for part in line.split('|')]
+        if len(parts) == 3 and parts[2] == module:
+            return int(parts[1])
+    raise RuntimeError(f"Không tìm thấy dòng importtime của {module}")
+
+
+def eager_heavy_modules(module):
+    """Các module trong LAZY_MODULES bị import ngay khi import script"""
+    code = (
+        f"import sys, {module}; "
+        f"print(','.join(m for m in {LAZY_MODULES!r} if m in sys.modules))"
+    )
+    result = subprocess.run(
+        [sys.executable, '-c', code],
+        cwd=SCRIPTS_DIR, capture_output=True, text=True, check=True
+    )
+    output = result.stdout.strip().splitlines()
+    return [name for name in (output[-1] if output else '').split(',') if name]
+
+
+def measure(repeats):
+    results = {}
+    for module in MODULES:
+        samples = [import_time_us(module) for _ in range(repeats)]
+        results[module] = {
+            'median_ms': round(statistics.median(samples) / 1000, 1),
+            'min_ms': round(min(samples) / 1000, 1),
+            'eager_heavy_modules': eager_heavy_modules(module)
+        }
+    return results
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument('--repeats', type=int, default=5)
+    parser.add_argument('--tolerance', type=float, default=0.5,
+                        help="Cho phép chậm hơn baseline bao nhiêu (0.5 = 50%%)")
+    parser.add_argument('--update', action='store_true', help="Ghi kết quả làm baseline mới")
+    args = parser.parse_args()
+
+    results = measure(args.repeats)
+
+    if args.update:
+        with open(BASELINE_PATH, 'w', encoding='utf-8') as f:
+            json.dump({'python': sys.version.split()[0], 'modules': results}, f, indent=2)
+            f.write('\n')
+        print(f"💾 Đã ghi baseline: {BASELINE_PATH}")
+
+    baseline = {}
+    if os.path.exists(BASELINE_PATH):
+        with open(BASELINE_PATH, encoding='utf-8') as f:
+            baseline = json.load(f).get('modules', {})
+
+    failed = False
+    print(f"{'module':<22}{'median':>10}{'baseline':>10}  heavy imports")
+    for module, result in results.items():
+        base = baseline.get(module, {}).get('median_ms')
+        regression = base is not None and result['median_ms'] > base * (1 + args.tolerance)
+        heavy = result['eager_heavy_modules']
+        failed = failed or regression or bool(heavy)
+        marker = '❌' if regression or heavy else '✅'
+        print(f"{module:<22}{result['median_ms']:>8.1f}ms"
+              f"{(f'{base:.1f}ms' if base is not None else '-'):>10}  {', '.join(heavy) or '-'} {marker}")
+
+    print(json.dumps(results))
+    return 1 if failed and not args.update else 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
@@ -0,0 +1,122 @@
+import hashlib
+import json
+import threading
+
+# Các field thay đổi mỗi lần chạy, không tính vào hash
+VOLATILE_FIELDS = {'timestamp', 'last_updated', 'createdAt'}
+
+# Collection chứa manifest hash của từng collection đã publish
+MANIFEST_COLLECTION = 'publish_manifests'
+
+
+def strip_volatile(value, volatile_fields=VOLATILE_FIELDS):
+    """Bỏ các field volatile ở mọi cấp của payload"""
+    if isinstance(value, dict):
+        return {
+            key: strip_volatile(item, volatile_fields)
+            for key, item in value.items()
+            if key not in volatile_fields
+        }
+    if isinstance(value, (list, tuple)):
+        return [strip_volatile(item, volatile_fields) for item in value]
+    return value
+
+
+def payload_hash(data, volatile_fields=VOLATILE_FIELDS):
+    """Hash SHA-256 của payload ở dạng canonical JSON (key đã sắp xếp)"""
+    canonical = json.dumps(
+        strip_volatile(data, volatile_fields),
+        sort_keys=True, ensure_ascii=False, separators=(',', ':'), default=str
+    )
+    return hashlib.sha256(canonical.encode('utf-8')).hexdigest()
+
+
+class ChangeDetector:
+    """So sánh hash payload với lần publish trước để bỏ qua document không đổi
+
+    Hash của lần publish trước được lưu trong một document manifest nhỏ
+    publish_manifests/{collection_name}: đọc một lần đầu run, ghi lại một lần
+    cuối run (chỉ khi có thay đổi). Hash của document vừa ghi chỉ vào
+    manifest khi storage xác nhận đã ghi xong (commit), để document ghi lỗi
+    được ghi lại ở lần chạy sau thay vì bị bỏ qua mãi.
+    """
+
+    def __init__(self, db, collection_name):
+        self.db = db
+        self.manifest_ref = db.collection(MANIFEST_COLLECTION).document(collection_name)
+        self._hashes = None
+        # Hash của document đã gửi cho storage nhưng chưa xác nhận ghi xong
+        self._pending = {}
+        self._dirty = False
+        # Các nhánh của pipeline dùng chung detector từ nhiều thread
+        self._lock = threading.Lock()
+        self.written = []
+        self.skipped = []
+        self.failed = []
+
+    def _load(self):
+        with self._lock:
+            if self._hashes is None:
+                snapshot = self.manifest_ref.get()
+                self._hashes = dict((snapshot.to_dict() or {}).get('hashes', {})) if snapshot.exists else {}
+        return self._hashes
+
+    def has_changed(self, document_name, data):
+        """True nếu payload khác lần publish trước (hoặc chưa publish lần nào)"""
+        return self._load().get(document_name) != payload_hash(data)
+
+    def mark_written(self, document_name, data):
+        digest = payload_hash(data)
+        with self._lock:
+            self._pending[document_name] = digest
+            self.written.append(document_name)
+
+    def pending(self):
+        """Các document đã ghi (chưa xác nhận), lấy trước khi flush storage"""
+        with self._lock:
+            return list(self._pending)
+
+    def commit(self, document_names, failed=()):
+        """Đưa hash của document_names (đã ghi xong) vào manifest
+
+        Document trong failed (storage báo bị bỏ) giữ hash cũ để lần chạy
+        sau ghi lại.
+        """
+        hashes = self._load()
+        with self._lock:
+            for document_name in failed:
+                if self._pending.pop(document_name, None) is not None:
+                    self.written.remove(document_name)
+                    self.failed.append(document_name)
+            for document_name in document_names:
+                digest = self._pending.pop(document_name, None)
+                if digest is not None:
+                    hashes[document_name] = digest
+                    self._dirty = True
+
+    def reset(self):
+        """Bắt đầu lần chạy mới: xóa thống kê written/skipped/failed của lần trước
+
+        Detector được dùng lại qua nhiều lần chạy (daemon); hash chưa được
+        xác nhận cũng bị bỏ, document đó sẽ được ghi lại ở lần sau.
+        """
+        with self._lock:
+            self._pending.clear()
+            self.written = []
+            self.skipped = []
+            self.failed = []
+
+    def mark_skipped(self, document_name):
+        self.skipped.append(document_name)
+
+    def flush(self):
+        """Ghi manifest hash nếu có document thay đổi"""
+        if not self._dirty:
+            return False
+        self.manifest_ref.set({'hashes': self._hashes})
+        self._dirty = False
+        return True
+
+    def summary(self):
+        return (f"{len(self.written)} documents đã ghi, {len(self.skipped)} documents không đổi (bỏ qua)"
+                + (f", {len(self.failed)} documents ghi lỗi (ghi lại ở lần sau)" if self.failed else ''))
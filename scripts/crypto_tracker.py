@@ -2,32 +2,183 @@ import requests
 import json
 import time
 import os
+import queue
+from concurrent.futures import ThreadPoolExecutor, as_completed
+from concurrent.futures import TimeoutError as FuturesTimeoutError
 from datetime import datetime
 from dotenv import load_dotenv
-import firebase_admin
-from firebase_admin import credentials, firestore
+from http_client import DeadlineExceeded, HttpClient
+from quote_cache import QuoteCache
+from change_detector import ChangeDetector
+from storage import configured_backends, open_storage
+from run_metrics import RunMetrics
+from indicators import compute_indicators, series_from_chart
+from fx_rates import FX_URL, LastGoodRates, RateTable, convert_quotes, display_currencies
+from symbol_index import SymbolIndex
+from sharded_layout import ASSETS_COLLECTION, LAYOUTS, AssetUniverse, FieldManifest, asset_id, build_summary
+# firebase_admin, snapshot_publisher và price_history (numpy) được import khi cần
 
 # Load environment variables
 load_dotenv()
 
+# Các chỉ số chứng khoán theo dõi: key lưu trữ -> Yahoo symbol
+STOCK_INDEX_SYMBOLS = {
+    'SP500': '^GSPC',
+    'NASDAQ100': '^NDX',
+    'NASDAQ_COMPOSITE': '^IXIC'
+}
+
+# Tên hiển thị của các chỉ số chứng khoán
+STOCK_INDEX_NAMES = {
+    '^GSPC': 'S&P 500',
+    '^NDX': 'NASDAQ-100',
+    '^IXIC': 'NASDAQ Composite'
+}
+
+GOLD_SYMBOL = 'GC=F'
+
+# Field lưu series chart API kèm quote trong cache giá (không ghi vào document)
+CACHED_SERIES_FIELD = '_series'
+
+# Document tương ứng với từng nhóm tài sản khi làm mới riêng lẻ
+ASSET_CLASS_DOCUMENTS = {
+    'crypto': 'cryptocurrencies',
+    'indices': 'stock_indices',
+    'commodities': 'commodities'
+}
+
+# Key trong build_documents chứa các document từng coin của layout sharded
+CRYPTO_ASSETS_DOCUMENT = f"cryptocurrencies/{ASSETS_COLLECTION}"
+
 class CryptoTracker:
-    def __init__(self):
+    def __init__(self, max_workers=None, use_db=True):
         self.base_url = 'https://api.coingecko.com/api/v3'
-        self.session = requests.Session()
+        # HTTP transport dùng chung (connection pool + retry) cho mọi upstream
         # Thêm headers để tránh bị block
-        self.session.headers.update({
+        self.http = HttpClient(headers={
             'User-Agent': 'Mozilla/5.0 (Windows NT 10.0; Win64; x64) AppleWebKit/537.36',
             'Accept': 'application/json'
         })
+        self.session = self.http.session
+        # Cache TTL trên đĩa cho top list, tỷ giá và giá quote
+        self.cache = QuoteCache()
+        # Index CoinGecko id -> Yahoo symbol đã kiểm tra (kể cả symbol không có trên Yahoo)
+        self.symbol_index = SymbolIndex()
+        # Lịch sử giá cục bộ (append-only, theo cột NumPy), tạo khi dùng lần đầu
+        self.history_enabled = os.getenv('PRICE_HISTORY', '1') != '0'
+        self._history = None
+        self.history_collection = 'price_history'
         self.usd_to_vnd_rate = None
-        self.db = None
+        # Bảng tỷ giá đầy đủ (RateTable) và các currency được quy đổi sẵn vào document
+        self.fx = None
+        self.fx_last_good = LastGoodRates()
+        self.display_currencies = display_currencies()
+        # Firebase chỉ được khởi tạo một lần, khi cần dùng lần đầu
+        self.use_db = use_db
+        self._db = None
+        self._firebase_attempted = False
+        # Nơi ghi dữ liệu (Firestore, SQLite, JSON-lines, memory), tạo khi dùng lần đầu
+        self._storage = None
+        self._storage_attempted = False
         self.collection_name = "crypto & finance"
-        
-        # Initialize Firebase
-        self.init_firebase()
+        # 'upsert': chỉ ghi document có thay đổi; 'replace': xóa collection rồi ghi lại;
+        # 'snapshot': ghi version mới rồi flip pointer
+        self.publish_mode = os.getenv('PUBLISH_MODE', 'upsert')
+        self.publisher = None
+        self.change_detector = None
+        self.history_detector = None
+        # 'single': một document cho mọi coin (mặc định, giữ field data cho reader hiện có);
+        # 'sharded': mỗi coin một document + document summary (nên dùng khi top N lớn)
+        self.crypto_layout = os.getenv('CRYPTO_LAYOUT', 'single')
+        if self.crypto_layout not in LAYOUTS:
+            raise ValueError(f"CRYPTO_LAYOUT không hợp lệ: {self.crypto_layout} (hỗ trợ: {', '.join(LAYOUTS)})")
+        self.asset_manifest = None
+        # Asset id đã ghi ở lần chạy trước (khi không có manifest), để chỉ xóa coin khi universe đổi
+        self.asset_universe = AssetUniverse()
+        self.exchange_rate_data = None
+        # Số request Yahoo chạy song song tối đa
+        self.max_workers = max_workers or int(os.getenv('CRYPTO_MAX_WORKERS', '16'))
+        self.failed_symbols = []
+        # Số coin theo dõi (top N theo market cap) và kích thước trang CoinGecko (tối đa 250)
+        self.top_limit = int(os.getenv('CRYPTO_TOP_LIMIT', '10'))
+        self.coingecko_page_size = min(250, int(os.getenv('COINGECKO_PAGE_SIZE', '250')))
+        # Số coin được in chi tiết, phần còn lại chỉ in tóm tắt
+        self.display_limit = int(os.getenv('CRYPTO_DISPLAY_LIMIT', '25'))
+        # Metrics theo phase của lần chạy hiện tại (full_market_overview / refresh)
+        self.metrics = None
+        # full_market_overview: mỗi nhóm tài sản là một nhánh fetch -> transform -> persist
+        # chạy song song (OVERVIEW_PIPELINE=0: chạy tuần tự từng phase như trước)
+        self.pipeline_enabled = os.getenv('OVERVIEW_PIPELINE', '1') != '0'
+        # Dữ liệu mới nhất của từng nhóm tài sản (dùng khi làm mới riêng lẻ)
+        self.latest = {'crypto_data': {}, 'coin_info': {}, 'stock_indices': {}, 'commodities': {}}
+        # Yahoo Finance: có thể trỏ sang stub server khi test
+        self.yahoo_base_url = os.getenv('YAHOO_BASE_URL', 'https://query1.finance.yahoo.com').rstrip('/')
+        # Hedged request cho chart API: host dự phòng (YAHOO_HEDGE_URL, mặc định query2
+        # khi dùng query1; YAHOO_HEDGE=0 để tắt), delay theo HTTP_HEDGE_PERCENTILE
+        self.yahoo_hedge_urls = []
+        if os.getenv('YAHOO_HEDGE', '1') != '0':
+            hedge_url = os.getenv('YAHOO_HEDGE_URL')
+            if hedge_url is None and '//query1.' in self.yahoo_base_url:
+                hedge_url = self.yahoo_base_url.replace('//query1.', '//query2.', 1)
+            if hedge_url:
+                self.yahoo_hedge_urls = [hedge_url.rstrip('/')]
+        # Thời gian tối đa (giây) của một lần chạy, 0 = không giới hạn. Hết giờ thì
+        # bỏ qua các request còn lại và lưu kết quả một phần (đánh dấu 'partial')
+        self.run_budget = float(os.getenv('RUN_DEADLINE', '0'))
+        self.deadline = None
+        self.deadline_exceeded = False
+        # Batch quote: lấy nhiều symbol trong một request /v7/finance/quote. Endpoint này cần
+        # cookie/crumb của Yahoo (không có thì trả 401) nên chỉ bật khi YAHOO_BATCH_QUOTES=1
+        self.use_batch_quotes = os.getenv('YAHOO_BATCH_QUOTES', '0') == '1'
+        self.batch_size = int(os.getenv('YAHOO_BATCH_SIZE', '50'))
+        # Bị từ chối (401/403) thì bỏ qua batch trong YAHOO_BATCH_DENIED_TTL giây, gọi thẳng chart API
+        self.batch_denied_ttl = float(os.getenv('YAHOO_BATCH_DENIED_TTL', '3600'))
+        self.batch_denied_until = 0.0
+        # Chỉ báo kỹ thuật từ series của chart API (INDICATORS=1 để bật); bật thì
+        # bỏ qua batch quote vì cần gọi chart API cho mọi symbol
+        self.indicators_enabled = os.getenv('INDICATORS', '0') == '1'
+
+    @property
+    def db(self):
+        """Firestore client, khởi tạo ở lần dùng đầu tiên (None nếu không dùng DB)"""
+        if self._db is None and self.use_db and not self._firebase_attempted:
+            self.init_firebase()
+        return self._db
+
+    @db.setter
+    def db(self, value):
+        self._db = value
+
+    @property
+    def storage(self):
+        """Storage theo cấu hình STORAGE_BACKENDS (None nếu không có backend nào)"""
+        if not self._storage_attempted:
+            self._storage_attempted = True
+            # Chỉ khởi tạo Firebase khi có backend Firestore
+            self._storage = open_storage(db=self.db if 'firestore' in configured_backends() else None)
+            if self._storage:
+                print(f"💽 Storage: {', '.join(self._storage.names)}")
+        return self._storage
+
+    @storage.setter
+    def storage(self, value):
+        self._storage = value
+        self._storage_attempted = True
+
+    @property
+    def history(self):
+        """PriceHistoryStore, tạo ở lần dùng đầu tiên (None nếu tắt PRICE_HISTORY)"""
+        if self._history is None and self.history_enabled:
+            from price_history import PriceHistoryStore
+            self._history = PriceHistoryStore()
+        return self._history
 
     def init_firebase(self):
-        """Khởi tạo Firebase connection"""
+        """Khởi tạo Firebase connection (chỉ một lần cho mỗi tracker)"""
+        if self._firebase_attempted or not self.use_db:
+            return self._db is not None
+        self._firebase_attempted = True
+
         try:
             # Lấy service account key từ environment variable
             service_account_key = os.getenv('SERVICE_ACCOUNT_KEY')
@@ -39,13 +190,16 @@ class CryptoTracker:
             # Parse JSON string thành dict
             service_account_info = json.loads(service_account_key)
             
+            import firebase_admin
+            from firebase_admin import credentials, firestore
+            
             # Khởi tạo Firebase app nếu chưa có
             if not firebase_admin._apps:
                 cred = credentials.Certificate(service_account_info)
                 firebase_admin.initialize_app(cred)
             
             # Khởi tạo Firestore client
-            self.db = firestore.client()
+            self._db = firestore.client()
             print("✅ Đã kết nối thành công với Firestore")
             return True
             
@@ -53,21 +207,52 @@ class CryptoTracker:
             print(f"❌ Lỗi khi khởi tạo Firebase: {e}")
             return False
 
+    def stamp_document(self, data):
+        """Thêm timestamp vào document trước khi lưu"""
+        data['timestamp'] = datetime.now()
+        data['last_updated'] = datetime.now().isoformat()
+        return data
+
+    def firestore_storage_enabled(self):
+        """True nếu storage có backend Firestore (manifest chỉ có ý nghĩa với Firestore)"""
+        return bool(self.storage) and 'firestore' in self.storage.names
+
+    def get_change_detector(self):
+        """ChangeDetector cho chế độ upsert khi ghi vào Firestore (None ở các trường hợp khác)"""
+        if self.publish_mode != 'upsert' or not self.firestore_storage_enabled():
+            return None
+        if self.change_detector is None:
+            self.change_detector = ChangeDetector(self.db, self.collection_name)
+        return self.change_detector
+
+    def get_history_detector(self):
+        """ChangeDetector của collection lịch sử giá (cùng điều kiện với get_change_detector)"""
+        if self.get_change_detector() is None:
+            return None
+        if self.history_detector is None:
+            self.history_detector = ChangeDetector(self.db, self.history_collection)
+        return self.history_detector
+
     def save_to_firestore(self, document_name, data):
-        """Lưu dữ liệu vào Firestore"""
-        if not self.db:
+        """Lưu một document vào storage (Firestore và/hoặc các backend đã cấu hình)"""
+        if not self.storage:
             print("❌ Chưa kết nối với Firestore")
             return False
             
         try:
-            # Thêm timestamp
-            data['timestamp'] = datetime.now()
-            data['last_updated'] = datetime.now().isoformat()
+            detector = self.get_change_detector()
+            if detector and not detector.has_changed(document_name, data):
+                detector.mark_skipped(document_name)
+                print(f"⏭️ {document_name} không thay đổi - bỏ qua")
+                return True
+            
+            self.stamp_document(data)
             
             # Lưu vào collection
-            doc_ref = self.db.collection(self.collection_name).document(document_name)
-            doc_ref.set(data)
+            self.storage.write(self.collection_name, document_name, data)
             
+            if detector:
+                detector.mark_written(document_name, data)
             print(f"✅ Đã lưu {document_name} vào Firestore")
             return True
             
@@ -75,62 +260,160 @@ class CryptoTracker:
             print(f"❌ Lỗi khi lưu {document_name} vào Firestore: {e}")
             return False
 
-    def get_usd_to_vnd_rate(self):
-        """Lấy tỷ giá USD/VND từ API"""
+    def remaining_time(self):
+        """Số giây còn lại trước deadline của lần chạy hiện tại (None nếu không giới hạn)"""
+        if self.deadline is None:
+            return None
+        return self.deadline - time.monotonic()
+
+    def request_timeout(self):
+        """Timeout (connect, read) của một request, không vượt quá thời gian còn lại của run
+
+        None nếu không có deadline (dùng timeout mặc định của HttpClient);
+        đã hết giờ thì raise DeadlineExceeded mà không gửi request.
+        """
+        remaining = self.remaining_time()
+        if remaining is None:
+            return None
+        if remaining <= 0:
+            self.deadline_exceeded = True
+            raise DeadlineExceeded(f"Hết thời gian chạy (RUN_DEADLINE={self.run_budget:g}s)")
+        return tuple(min(value, remaining) for value in self.http.timeout)
+
+    def within_deadline(self, send, *args, **kwargs):
+        """Gọi send (http.get / http.get_hedged) với timeout và deadline của run
+
+        Mọi lần chờ bên trong HttpClient (token bucket, backoff) đều dừng ở
+        deadline; hết giờ thì đánh dấu deadline_exceeded rồi raise lại.
+        """
         try:
-            url = 'https://api.exchangerate-api.com/v4/latest/USD'
-            response = requests.get(url, timeout=10)
-            response.raise_for_status()
-            data = response.json()
+            return send(*args, timeout=self.request_timeout(), deadline=self.deadline, **kwargs)
+        except DeadlineExceeded:
+            self.deadline_exceeded = True
+            raise
+
+    def get_chart(self, symbol):
+        """GET chart API của symbol, hedged sang host dự phòng nếu có"""
+        path = f'/v8/finance/chart/{symbol}'
+        if not self.yahoo_hedge_urls:
+            return self.within_deadline(self.http.get, self.yahoo_base_url + path)
+        urls = [base_url + path for base_url in [self.yahoo_base_url] + self.yahoo_hedge_urls]
+        return self.within_deadline(self.http.get_hedged, urls)
+
+    def get_json(self, url, params=None):
+        """GET một endpoint JSON, raise nếu HTTP lỗi"""
+        response = self.within_deadline(self.http.get, url, params=params)
+        response.raise_for_status()
+        return response.json()
 
-            if 'rates' in data and 'VND' in data['rates']:
-                self.usd_to_vnd_rate = data['rates']['VND']
-                print(f"✅ Tỷ giá USD/VND: {self.usd_to_vnd_rate:,.0f}")
-                
-                # Lưu tỷ giá vào Firestore
-                exchange_rate_data = {
-                    'usd_to_vnd': self.usd_to_vnd_rate,
-                    'source': 'exchangerate-api.com',
-                    'currency_pair': 'USD/VND'
-                }
-                self.save_to_firestore('exchange_rates', exchange_rate_data)
-                
-                return True
-            else:
-                print("❌ Không thể lấy tỷ giá USD/VND")
-                return False
+    def get_usd_to_vnd_rate(self):
+        """Lấy bảng tỷ giá USD đầy đủ (qua cache) và tỷ giá USD/VND
 
+        Bảng tốt gần nhất được lưu ra file (xem fx_rates.LastGoodRates); khi
+        API lỗi thì dùng bảng đó, đánh dấu stale, thay cho tỷ giá cố định.
+        """
+        try:
+            data = self.cache.get_or_fetch('fx', FX_URL, lambda: self.get_json(FX_URL))
+            table = RateTable.from_api(data)
+            self.fx_last_good.save(table)
         except Exception as e:
             print(f"❌ Lỗi khi lấy tỷ giá: {e}")
-            # Fallback rate nếu không lấy được
-            self.usd_to_vnd_rate = 24000  # Rate dự phòng
-            print(f"⚠️ Sử dụng tỷ giá dự phòng: {self.usd_to_vnd_rate:,.0f}")
+            table = self.fx_last_good.load()
+            if table is None:
+                print("⚠️ Chưa có tỷ giá nào được lưu - bỏ qua quy đổi VND")
+                return False
+            print(f"♻️ Dùng bảng tỷ giá tốt gần nhất ({table.age / 3600:.1f} giờ trước)")
+
+        self.fx = table
+        self.usd_to_vnd_rate = table.factor('USD', 'VND')
+        if not self.usd_to_vnd_rate:
+            print("❌ Không thể lấy tỷ giá USD/VND")
             return False
+        print(f"✅ Tỷ giá USD/VND: {self.usd_to_vnd_rate:,.0f}")
+
+        # Lưu tỷ giá vào Firestore
+        self.exchange_rate_data = {
+            'usd_to_vnd': self.usd_to_vnd_rate,
+            'source': table.source,
+            'currency_pair': 'USD/VND',
+            **table.summary(self.display_currencies)
+        }
+        if self.storage:
+            self.save_to_firestore('exchange_rates', dict(self.exchange_rate_data))
+
+        return not table.stale
 
-    def get_top_cryptocurrencies(self, limit=10):
-        """Lấy top cryptocurrency theo market cap từ CoinGecko"""
+    def get_markets_page(self, page, per_page):
+        """Một trang /coins/markets của CoinGecko (qua cache, lỗi thì dùng trang cũ trong cache)"""
         url = f'{self.base_url}/coins/markets'
         params = {
             'vs_currency': 'usd',
             'order': 'market_cap_desc',
-            'per_page': limit,
-            'page': 1,
+            'per_page': per_page,
+            'page': page,
             'sparkline': False
         }
 
+        cache_key = f'markets:{per_page}:{page}'
         try:
-            response = self.session.get(url, params=params, timeout=10)
-            response.raise_for_status()
-            data = response.json()
+            return self.cache.get_or_fetch('toplist', cache_key, lambda: self.get_json(url, params))
+        except requests.exceptions.RequestException as e:
+            # CoinGecko lỗi / bị throttle / bị ngắt: dùng trang tốt gần nhất
+            data = self.stale_fallback('toplist', cache_key)
+            if data is None:
+                raise
+            print(f"♻️ CoinGecko lỗi ({e}), dùng trang {page} cũ trong cache")
+            return data
+
+    def get_top_cryptocurrencies(self, limit=None):
+        """Lấy top cryptocurrency theo market cap từ CoinGecko
+
+        limit lớn hơn một trang (self.coingecko_page_size, tối đa 250) được
+        chia thành nhiều trang lấy song song (HttpClient giới hạn rate theo
+        host), rồi gộp lại theo thứ hạng market cap. Chỉ giữ coin có Yahoo
+        symbol hợp lệ theo self.symbol_index.
+        """
+        limit = limit or self.top_limit
+        per_page = min(limit, self.coingecko_page_size)
+        pages = -(-limit // per_page)
+
+        try:
+            if pages == 1:
+                data = self.get_markets_page(1, per_page)
+            else:
+                fetched = self.fetch_concurrently({
+                    page: (self.get_markets_page, (page, per_page))
+                    for page in range(1, pages + 1)
+                }, group='toplist_page')
+                if not fetched:
+                    raise requests.exceptions.RequestException("Không lấy được trang nào từ CoinGecko")
+                if len(fetched) < pages:
+                    missing = [str(page) for page in range(1, pages + 1) if page not in fetched]
+                    print(f"⚠️ Thiếu {len(missing)}/{pages} trang CoinGecko: {', '.join(missing)}")
+                data = [coin for page in sorted(fetched) for coin in fetched[page]]
+
+            # Gộp các trang theo thứ hạng (coin chưa có rank xếp cuối), bỏ trùng id
+            data = sorted(data, key=lambda coin: coin.get('market_cap_rank') or float('inf'))
+            seen = set()
+            universe = []
+            for coin in data:
+                if coin['id'] not in seen:
+                    seen.add(coin['id'])
+                    universe.append(coin)
+
+            # Mapping từ CoinGecko sang Yahoo Finance symbols (bỏ coin không có trên Yahoo)
+            universe = universe[:limit]
+            resolved = self.symbol_index.resolve(universe, self.verify_yahoo_symbols)
+            if len(resolved) < len(universe):
+                print(f"⏭️ Bỏ qua {len(universe) - len(resolved)} coin không có (hoặc chưa kiểm tra được) trên Yahoo")
 
-            # Tạo mapping từ CoinGecko sang Yahoo Finance symbols
             yahoo_symbols = []
             coin_info = {}
 
-            for coin in data:
-                # Mapping các coin phổ biến sang Yahoo Finance symbol
-                yahoo_symbol = self.get_yahoo_symbol(coin['symbol'], coin['name'])
-                if yahoo_symbol:
+            for coin in universe:
+                yahoo_symbol = resolved.get(coin['id'])
+                # Nhiều coin có thể trùng ticker: giữ coin có thứ hạng cao hơn
+                if yahoo_symbol and yahoo_symbol not in coin_info:
                     yahoo_symbols.append(yahoo_symbol)
                     coin_info[yahoo_symbol] = {
                         'name': coin['name'],
@@ -150,61 +433,46 @@ class CryptoTracker:
             print(f"❌ Lỗi parse JSON: {e}")
             return None, None
 
-    def get_yahoo_symbol(self, symbol, name):
-        """Mapping cryptocurrency symbols sang Yahoo Finance format"""
-        # Mapping các coin phổ biến
-        symbol_mapping = {
-            'btc': 'BTC-USD',
-            'eth': 'ETH-USD',
-            'bnb': 'BNB-USD',
-            'sol': 'SOL-USD',
-            'ada': 'ADA-USD',
-            'xrp': 'XRP-USD',
-            'dot': 'DOT-USD',
-            'doge': 'DOGE-USD',
-            'avax': 'AVAX-USD',
-            'link': 'LINK-USD',
-            'matic': 'MATIC-USD',
-            'ltc': 'LTC-USD',
-            'bch': 'BCH-USD',
-            'xlm': 'XLM-USD',
-            'vet': 'VET-USD',
-            'fil': 'FIL-USD',
-            'trx': 'TRX-USD',
-            'etc': 'ETC-USD',
-            'atom': 'ATOM-USD',
-            'icp': 'ICP-USD',
-            'uni': 'UNI-USD',
-            'algo': 'ALGO-USD',
-            'hbar': 'HBAR-USD',
-            'apt': 'APT-USD',
-            'near': 'NEAR-USD',
-            'op': 'OP-USD',
-            'arb': 'ARB-USD',
-            'ldo': 'LDO-USD',
-            'rpl': 'RPL-USD',
-            'mkr': 'MKR-USD'
-        }
+    def verify_yahoo_symbols(self, symbols):
+        """Kiểm tra các symbol có trên Yahoo không (dùng cho self.symbol_index)
+
+        Kiểm tra bằng batch quote (một request cho self.batch_size symbols);
+        symbol thuộc batch lỗi được kiểm tra riêng qua chart API. Trả về
+        (tập symbol hợp lệ, tập symbol đã kiểm tra được).
+        """
+        failed = []
+        valid = set(self.get_quotes_batch(symbols, failed=failed))
+        checked = set(symbols) - set(failed)
 
-        symbol_lower = symbol.lower()
+        if failed:
+            results = self.fetch_concurrently({
+                symbol: (self.check_chart_symbol, (symbol,)) for symbol in failed
+            }, group='symbol_check')
+            valid.update(symbol for symbol, status in results.items() if status == 'ok')
+            checked.update(results)
 
-        # Kiểm tra mapping trước
-        if symbol_lower in symbol_mapping:
-            return symbol_mapping[symbol_lower]
+        return valid, checked
 
-        # Nếu không có trong mapping, tạo symbol mặc định
-        return f"{symbol.upper()}-USD"
+    def check_chart_symbol(self, symbol):
+        """'ok' / 'bad' (404) theo chart API, None nếu lỗi khác (chưa biết)"""
+        try:
+            response = self.get_chart(symbol)
+            if response.status_code == 404:
+                return 'bad'
+            response.raise_for_status()
+            result = (response.json().get('chart') or {}).get('result')
+            return 'ok' if result and result[0].get('meta', {}).get('regularMarketPrice') is not None else 'bad'
+        except requests.exceptions.RequestException as e:
+            print(f"⚠️ Không kiểm tra được symbol {symbol}: {e}")
+            return None
+        except ValueError as e:
+            print(f"⚠️ Response không hợp lệ khi kiểm tra symbol {symbol}: {e}")
+            return None
 
     def get_crypto_data_from_yahoo(self, symbol):
         """Lấy dữ liệu crypto từ Yahoo Finance"""
         try:
-            url = f'https://query1.finance.yahoo.com/v8/finance/chart/{symbol}'
-
-            headers = {
-                'User-Agent': 'Mozilla/5.0 (Windows NT 10.0; Win64; x64) AppleWebKit/537.36'
-            }
-
-            response = requests.get(url, headers=headers, timeout=10)
+            response = self.get_chart(symbol)
             response.raise_for_status()
 
             data = response.json()
@@ -223,7 +491,7 @@ class CryptoTracker:
                     change = 0
                     change_percent = 0
 
-                return {
+                return self.with_series({
                     'symbol': symbol,
                     'current_price': current_price,
                     'previous_close': previous_close,
@@ -231,7 +499,7 @@ class CryptoTracker:
                     'change_percent': change_percent,
                     'market_time': meta.get('regularMarketTime', int(time.time())),
                     'currency': meta.get('currency', 'USD')
-                }
+                }, result)
             else:
                 print(f"❌ Không thể parse dữ liệu {symbol}")
                 return None
@@ -243,27 +511,272 @@ class CryptoTracker:
             print(f"❌ Lỗi xử lý dữ liệu {symbol}: {e}")
             return None
 
-    def get_all_crypto_data(self, yahoo_symbols):
-        """Lấy dữ liệu tất cả crypto từ Yahoo Finance"""
-        crypto_data = {}
+    def get_quotes_batch(self, symbols, failed=None):
+        """Lấy quote nhiều symbol qua /v7/finance/quote, chia theo self.batch_size
+
+        Trả về dict {symbol: quote thô của Yahoo}. Symbol nào không có trong
+        response thì không có trong dict (để fallback sang chart API). Nếu
+        truyền list failed thì symbol của các batch bị lỗi được thêm vào đó.
+        Yahoo từ chối (401/403, thiếu crumb) thì dừng ở chunk đó, các chunk
+        còn lại đi thẳng sang chart API, và batch bị tắt trong batch_denied_ttl giây.
+        """
+        quotes = {}
+        url = f'{self.yahoo_base_url}/v7/finance/quote'
+        batch_size = max(1, self.batch_size)
+
+        for start in range(0, len(symbols), batch_size):
+            chunk = symbols[start:start + batch_size]
+            try:
+                response = self.within_deadline(self.http.get, url, params={'symbols': ','.join(chunk)})
+                if response.status_code in (401, 403):
+                    self.batch_denied_until = time.monotonic() + self.batch_denied_ttl
+                    print(f"⚠️ Batch quote bị từ chối (HTTP {response.status_code}, cần cookie/crumb): "
+                          f"dùng chart API trong {self.batch_denied_ttl:g}s tới")
+                    break
+                response.raise_for_status()
+                data = response.json()
+
+                for quote in (data.get('quoteResponse') or {}).get('result') or []:
+                    if quote.get('symbol') in chunk and quote.get('regularMarketPrice') is not None:
+                        quotes[quote['symbol']] = quote
+
+            except requests.exceptions.RequestException as e:
+                print(f"⚠️ Lỗi batch quote ({len(chunk)} symbols): {e}")
+                if failed is not None:
+                    failed.extend(chunk)
+            except Exception as e:
+                print(f"⚠️ Lỗi xử lý batch quote ({len(chunk)} symbols): {e}")
+                if failed is not None:
+                    failed.extend(chunk)
+
+        return quotes
+
+    def parse_batch_quote(self, symbol, quote):
+        """Chuyển quote từ /v7/finance/quote sang cùng cấu trúc với các hàm chart"""
+        current_price = quote.get('regularMarketPrice')
+        previous_close = quote.get('regularMarketPreviousClose', 0)
+
+        if current_price and previous_close:
+            change = current_price - previous_close
+            change_percent = (change / previous_close) * 100
+        else:
+            change = 0
+            change_percent = 0
+
+        data = {
+            'symbol': symbol,
+            'current_price': current_price,
+            'previous_close': previous_close,
+            'change': change,
+            'change_percent': change_percent,
+            'market_time': quote.get('regularMarketTime', int(time.time())),
+            'currency': quote.get('currency', 'USD')
+        }
 
+        if symbol in STOCK_INDEX_NAMES:
+            data = {'name': STOCK_INDEX_NAMES[symbol], **data}
+        elif symbol == GOLD_SYMBOL:
+            data = {'name': 'Spot Gold', **data, 'symbol': 'XAU/USD', 'currency': 'USD'}
+
+        return data
+
+    def fetch_concurrently(self, tasks, group='quote', failed=None):
+        """Chạy song song các hàm fetch, giới hạn bởi self.max_workers
+
+        tasks: dict {key: (func, args)}. Trả về dict {key: kết quả} chỉ gồm
+        các key lấy được dữ liệu; các key lỗi được thêm vào list failed (nếu
+        có). group là nhóm thời gian trong metrics.
+        Hết deadline của run thì không chờ các key còn lại (coi như lỗi).
+        """
+        results = {}
+        if not tasks:
+            return results
+
+        workers = max(1, min(self.max_workers, len(tasks)))
+        executor = ThreadPoolExecutor(max_workers=workers)
+        pending = set(tasks)
+        try:
+            futures = {
+                executor.submit(self.timed, group, key, func, *args): key
+                for key, (func, args) in tasks.items()
+            }
+            for future in as_completed(futures, timeout=self.remaining_time()):
+                key = futures[future]
+                pending.discard(key)
+                try:
+                    data = future.result()
+                except Exception as e:
+                    print(f"❌ Lỗi khi lấy dữ liệu {key}: {e}")
+                    data = None
+                if data:
+                    results[key] = data
+                elif failed is not None:
+                    failed.append(key)
+        except FuturesTimeoutError:
+            self.deadline_exceeded = True
+            print(f"⏰ Hết thời gian chạy (RUN_DEADLINE={self.run_budget:g}s): bỏ qua {len(pending)} {group}")
+            if failed is not None:
+                failed.extend(key for key in tasks if key in pending)
+        finally:
+            # Request đang chạy tự kết thúc theo timeout (đã giới hạn bởi deadline)
+            executor.shutdown(wait=False, cancel_futures=True)
+
+        # Giữ nguyên thứ tự key như lúc gửi request
+        return {key: results[key] for key in tasks if key in results}
+
+    def fetch_quotes(self, tasks, failed=None):
+        """Lấy quote cho tasks {yahoo_symbol: (func, args)}: cache -> batch -> chart API
+
+        Symbol còn hạn trong cache không gửi request; symbol thiếu trong
+        batch response mới gọi chart API riêng (song song). Khi bật chỉ báo
+        kỹ thuật thì bỏ qua batch (cần series của chart API), lưu series kèm
+        quote trong cache và gắn thêm field 'indicators' cho mỗi quote.
+        Symbol không lấy được (kể cả từ quote cũ) được thêm vào list failed
+        (mặc định self.failed_symbols).
+        """
+        results = self.cache.lookup_many('price', tasks, refresh_fns={
+            symbol: (lambda func=func, args=args: func(*args))
+            for symbol, (func, args) in tasks.items()
+        })
+
+        pending = [symbol for symbol in tasks if symbol not in results]
+        fetched = {}
+        use_batch = self.use_batch_quotes and time.monotonic() >= self.batch_denied_until
+        if use_batch and not self.indicators_enabled and pending:
+            # Lấy batch trước, chỉ gọi chart API cho symbol thiếu trong batch
+            batch_quotes = self.get_quotes_batch(pending)
+            for symbol, quote in batch_quotes.items():
+                fetched[symbol] = self.parse_batch_quote(symbol, quote)
+            print(f"📦 Batch quote: {len(fetched)}/{len(pending)} symbols, "
+                  f"{len(pending) - len(fetched)} symbols gọi riêng qua chart API")
+
+        missing = {symbol: tasks[symbol] for symbol in pending if symbol not in fetched}
+        fetched.update(self.fetch_concurrently(missing))
+
+        self.cache.store_many('price', fetched)
+        results.update(fetched)
+
+        # Symbol lấy lỗi (upstream lỗi / bị ngắt): dùng quote tốt gần nhất, đánh dấu stale
+        stale = {}
+        for symbol in pending:
+            if symbol not in fetched:
+                data = self.stale_fallback('price', symbol)
+                if data is not None:
+                    stale[symbol] = data
+        if stale:
+            print(f"♻️ Dùng quote cũ trong cache cho {len(stale)} symbols: {', '.join(stale)}")
+            results.update(stale)
+        (self.failed_symbols if failed is None else failed).extend(symbol for symbol in tasks if symbol not in results)
+
+        # Series đi kèm quote (chart response hoặc cache giá): tính chỉ báo không cần gọi lại chart API
+        series = {symbol: quote.pop(CACHED_SERIES_FIELD) for symbol, quote in results.items() if CACHED_SERIES_FIELD in quote}
+        if self.indicators_enabled:
+            results = self.add_indicators(results, series)
+
+        return {symbol: results[symbol] for symbol in tasks if symbol in results}
+
+    def with_series(self, data, result):
+        """Gắn series (timestamp/close/high/low) của chart response vào quote cho bước tính chỉ báo
+
+        Series nằm ở field CACHED_SERIES_FIELD (được lưu cùng quote trong
+        cache giá); fetch_quotes tách ra trước khi trả quote.
+        """
+        if self.indicators_enabled:
+            series = series_from_chart(result)
+            if series:
+                data[CACHED_SERIES_FIELD] = series
+        return data
+
+    def get_chart_series(self, symbol):
+        """Chỉ lấy series của chart API (cho quote đến từ cache)"""
+        try:
+            response = self.get_chart(symbol)
+            response.raise_for_status()
+            return series_from_chart(response.json()['chart']['result'][0])
+        except requests.exceptions.RequestException as e:
+            print(f"⚠️ Không lấy được series {symbol}: {e}")
+            return None
+        except (ValueError, KeyError, IndexError, TypeError) as e:
+            print(f"⚠️ Lỗi xử lý series {symbol}: {e}")
+            return None
+
+    def add_indicators(self, quotes, series=None):
+        """Tính chỉ báo kỹ thuật cho mọi quote trong một lượt (xem indicators.py)
+
+        quotes: {yahoo_symbol: quote}, series: {yahoo_symbol: series} đã có
+        sẵn. Trả về dict mới, quote nào có series được thêm field
+        'indicators' (SMA/EMA, độ biến động, RSI, max drawdown, cao/thấp 24h).
+        """
+        series = dict(series or {})
+
+        # Quote chưa có series (vd: quote từ batch): gọi chart API riêng
+        missing = {
+            symbol: (self.get_chart_series, (symbol,))
+            for symbol, quote in quotes.items() if symbol not in series and not quote.get('stale')
+        }
+        series.update(self.fetch_concurrently(missing, group='series'))
+
+        keys = [key for key in quotes if key in series]
+        try:
+            values = dict(zip(keys, compute_indicators([series[key] for key in keys])))
+        except Exception as e:
+            print(f"⚠️ Lỗi khi tính chỉ báo kỹ thuật: {e}")
+            return quotes
+        return {
+            key: {**quote, 'indicators': values[key]} if key in values else quote
+            for key, quote in quotes.items()
+        }
+
+    def stale_fallback(self, data_class, key):
+        """Giá trị tốt gần nhất trong cache khi upstream lỗi, None nếu không có
+
+        Dict được đánh dấu 'stale' và 'stale_age_seconds' (được lưu kèm
+        document để client biết dữ liệu không còn mới).
+        """
+        value, age = self.cache.last_good(data_class, key)
+        if isinstance(value, dict):
+            value = {**value, 'stale': True, 'stale_age_seconds': round(age)}
+        return value
+
+    def get_all_crypto_data(self, yahoo_symbols, failed=None):
+        """Lấy dữ liệu tất cả crypto từ Yahoo Finance (song song)"""
+        return self.fetch_quotes({
+            symbol: (self.get_crypto_data_from_yahoo, (symbol,))
+            for symbol in yahoo_symbols
+        }, failed)
+
+    def fetch_all_quotes(self, yahoo_symbols):
+        """Gửi đồng thời mọi request chart: crypto, chỉ số chứng khoán và hàng hóa
+
+        Trả về (crypto_data, stock_indices, commodities) cùng cấu trúc với
+        get_all_crypto_data / get_all_stock_indices / get_all_commodities.
+        Quote đi qua fetch_quotes: cache, rồi batch quote, rồi chart API.
+        """
+        tasks = {}
+        groups = {}
         for symbol in yahoo_symbols:
-            data = self.get_crypto_data_from_yahoo(symbol)
-            if data:
-                crypto_data[symbol] = data
+            tasks[symbol] = (self.get_crypto_data_from_yahoo, (symbol,))
+            groups[symbol] = ('crypto', symbol)
+        for key, symbol in STOCK_INDEX_SYMBOLS.items():
+            tasks[symbol] = (self.get_stock_data, (symbol,))
+            groups[symbol] = ('index', key)
+        tasks[GOLD_SYMBOL] = (self.get_gold_data, ())
+        groups[GOLD_SYMBOL] = ('commodity', 'GOLD')
+
+        results = self.fetch_quotes(tasks)
 
-        return crypto_data
+        grouped = {'crypto': {}, 'index': {}, 'commodity': {}}
+        for symbol in tasks:
+            if symbol in results:
+                group, key = groups[symbol]
+                grouped[group][key] = results[symbol]
+
+        return grouped['crypto'], grouped['index'], grouped['commodity']
 
     def get_stock_data(self, symbol):
         """Lấy dữ liệu chỉ số chứng khoán từ Yahoo Finance API"""
         try:
-            url = f'https://query1.finance.yahoo.com/v8/finance/chart/{symbol}'
-
-            headers = {
-                'User-Agent': 'Mozilla/5.0 (Windows NT 10.0; Win64; x64) AppleWebKit/537.36'
-            }
-
-            response = requests.get(url, headers=headers, timeout=10)
+            response = self.get_chart(symbol)
             response.raise_for_status()
 
             data = response.json()
@@ -277,15 +790,8 @@ class CryptoTracker:
                 change = current_price - previous_close
                 change_percent = (change / previous_close) * 100
 
-                # Mapping tên chỉ số
-                index_names = {
-                    '^GSPC': 'S&P 500',
-                    '^NDX': 'NASDAQ-100',
-                    '^IXIC': 'NASDAQ Composite'
-                }
-
-                return {
-                    'name': index_names.get(symbol, symbol),
+                return self.with_series({
+                    'name': STOCK_INDEX_NAMES.get(symbol, symbol),
                     'symbol': symbol,
                     'current_price': current_price,
                     'previous_close': previous_close,
@@ -293,7 +799,7 @@ class CryptoTracker:
                     'change_percent': change_percent,
                     'market_time': meta.get('regularMarketTime', int(time.time())),
                     'currency': meta.get('currency', 'USD')
-                }
+                }, result)
             else:
                 print(f"❌ Không thể parse dữ liệu {symbol}")
                 return None
@@ -308,13 +814,7 @@ class CryptoTracker:
     def get_gold_data(self):
         """Lấy dữ liệu giá vàng từ Yahoo Finance API"""
         try:
-            url = 'https://query1.finance.yahoo.com/v8/finance/chart/GC=F'
-
-            headers = {
-                'User-Agent': 'Mozilla/5.0 (Windows NT 10.0; Win64; x64) AppleWebKit/537.36'
-            }
-
-            response = requests.get(url, headers=headers, timeout=10)
+            response = self.get_chart(GOLD_SYMBOL)
             response.raise_for_status()
 
             data = response.json()
@@ -328,7 +828,7 @@ class CryptoTracker:
                 change = current_price - previous_close
                 change_percent = (change / previous_close) * 100
 
-                return {
+                return self.with_series({
                     'name': 'Spot Gold',
                     'symbol': 'XAU/USD',
                     'current_price': current_price,
@@ -337,7 +837,7 @@ class CryptoTracker:
                     'change_percent': change_percent,
                     'market_time': meta.get('regularMarketTime', int(time.time())),
                     'currency': 'USD'
-                }
+                }, result)
             else:
                 print("❌ Không thể parse dữ liệu Gold")
                 return None
@@ -349,35 +849,22 @@ class CryptoTracker:
             print(f"❌ Lỗi xử lý dữ liệu Gold: {e}")
             return None
 
-    def get_all_stock_indices(self):
-        """Lấy dữ liệu tất cả chỉ số chứng khoán"""
-        indices = {}
-
-        # Lấy dữ liệu từng chỉ số
-        sp500 = self.get_stock_data('^GSPC')
-        nasdaq100 = self.get_stock_data('^NDX')
-        nasdaq_composite = self.get_stock_data('^IXIC')
+    def get_all_stock_indices(self, failed=None):
+        """Lấy dữ liệu tất cả chỉ số chứng khoán (song song)
 
-        if sp500:
-            indices['SP500'] = sp500
-        if nasdaq100:
-            indices['NASDAQ100'] = nasdaq100
-        if nasdaq_composite:
-            indices['NASDAQ_COMPOSITE'] = nasdaq_composite
+        Quote được lấy (và cache) theo Yahoo symbol như fetch_all_quotes,
+        rồi mới đổi sang key lưu trữ của STOCK_INDEX_SYMBOLS.
+        """
+        quotes = self.fetch_quotes({
+            symbol: (self.get_stock_data, (symbol,))
+            for symbol in STOCK_INDEX_SYMBOLS.values()
+        }, failed)
+        return {key: quotes[symbol] for key, symbol in STOCK_INDEX_SYMBOLS.items() if symbol in quotes}
 
-        return indices
-
-    def get_all_commodities(self):
-        """Lấy dữ liệu tất cả hàng hóa"""
-        commodities = {}
-
-        # Lấy dữ liệu vàng
-        gold = self.get_gold_data()
-
-        if gold:
-            commodities['GOLD'] = gold
-
-        return commodities
+    def get_all_commodities(self, failed=None):
+        """Lấy dữ liệu tất cả hàng hóa (cache, batch quote, chart API như get_all_stock_indices)"""
+        quotes = self.fetch_quotes({GOLD_SYMBOL: (self.get_gold_data, ())}, failed)
+        return {'GOLD': quotes[GOLD_SYMBOL]} if GOLD_SYMBOL in quotes else {}
 
     def format_price(self, price, currency='usd'):
         """Format giá tiền"""
@@ -488,11 +975,13 @@ class CryptoTracker:
             return
 
         print(f"\n{'='*120}")
-        print(f"💰 TOP 10 CRYPTOCURRENCY (Yahoo Finance) - {datetime.now().strftime('%Y-%m-%d %H:%M:%S')}")
+        print(f"💰 TOP {len(coin_info)} CRYPTOCURRENCY (Yahoo Finance) - {datetime.now().strftime('%Y-%m-%d %H:%M:%S')}")
         print(f"{'='*120}")
 
-        # Sắp xếp theo thứ hạng market cap
-        sorted_coins = sorted(coin_info.items(), key=lambda x: x[1]['rank'])
+        # Sắp xếp theo thứ hạng market cap; universe lớn chỉ in chi tiết display_limit coin đầu
+        sorted_coins = sorted(coin_info.items(), key=lambda x: x[1]['rank'] or float('inf'))
+        hidden = sorted_coins[self.display_limit:]
+        sorted_coins = sorted_coins[:self.display_limit]
 
         for yahoo_symbol, info in sorted_coins:
             if yahoo_symbol in crypto_data:
@@ -520,17 +1009,41 @@ class CryptoTracker:
                 # Giá đóng cửa hôm trước
                 print(f"   🔒 Giá đóng cửa hôm trước: {self.format_dual_price(data['previous_close'])}")
 
+                # Chỉ báo kỹ thuật (nếu có)
+                indicators = data.get('indicators') or {}
+                if indicators.get('rsi_14') is not None:
+                    print(f"   📐 RSI 14: {indicators['rsi_14']:.1f} | "
+                          f"Biến động: {indicators.get('volatility_60') or 0:.3f}% | "
+                          f"Max drawdown: {indicators.get('max_drawdown_percent') or 0:.2f}%")
+
                 # Thời gian cập nhật
                 market_time = datetime.fromtimestamp(data['market_time'])
                 print(f"   ⏰ Thời gian cập nhật: {market_time.strftime('%Y-%m-%d %H:%M:%S')}")
             else:
                 print(f"\n#{info['rank']} ❌ {info['name']} ({info['symbol']}) - Không có dữ liệu từ Yahoo Finance")
 
-    def save_all_data_to_firestore(self, crypto_data, coin_info, stock_indices, commodities):
-        """Lưu tất cả dữ liệu vào Firestore"""
-        saved_count = 0
+        if hidden:
+            with_data = sum(1 for yahoo_symbol, _ in hidden if yahoo_symbol in crypto_data)
+            print(f"\n... và {len(hidden)} coin khác ({with_data} có dữ liệu), không in chi tiết "
+                  f"(CRYPTO_DISPLAY_LIMIT={self.display_limit})")
+
+    def convert_prices(self, crypto_data, stock_indices, commodities):
+        """Quy đổi giá của mọi quote sang self.display_currencies trong một lần
+
+        Trả về (crypto_data, stock_indices, commodities) mới, mỗi quote có
+        thêm field 'converted' (xem fx_rates.convert_quotes).
+        """
+        groups = [crypto_data or {}, stock_indices or {}, commodities or {}]
+        quotes = [quote for group in groups for quote in group.values()]
+        converted = iter(convert_quotes(quotes, self.fx, self.display_currencies))
+        return tuple({key: next(converted) for key in group} for group in groups)
+
+    def build_documents(self, crypto_data, coin_info, stock_indices, commodities):
+        """Tạo các documents cần lưu: {document_name: data}"""
+        documents = {}
+        crypto_data, stock_indices, commodities = self.convert_prices(crypto_data, stock_indices, commodities)
         
-        # Lưu dữ liệu cryptocurrency
+        # Dữ liệu cryptocurrency
         if crypto_data and coin_info:
             # Kết hợp crypto_data với coin_info
             combined_crypto_data = {}
@@ -542,47 +1055,393 @@ class CryptoTracker:
                         'usd_to_vnd_rate': self.usd_to_vnd_rate
                     }
             
-            if self.save_to_firestore('cryptocurrencies', {
-                'data': combined_crypto_data,
-                'total_coins': len(combined_crypto_data),
-                'source': 'Yahoo Finance + CoinGecko'
-            }):
-                saved_count += 1
+            if self.crypto_layout == 'sharded':
+                # Ghi các coin trước document summary để index không trỏ tới coin chưa có
+                assets = {asset_id(symbol): data for symbol, data in combined_crypto_data.items()}
+                documents[CRYPTO_ASSETS_DOCUMENT] = assets
+                documents['cryptocurrencies'] = build_summary(
+                    assets, f"{self.collection_name}/{CRYPTO_ASSETS_DOCUMENT}", 'Yahoo Finance + CoinGecko'
+                )
+            else:
+                documents['cryptocurrencies'] = {
+                    'data': combined_crypto_data,
+                    'total_coins': len(combined_crypto_data),
+                    'source': 'Yahoo Finance + CoinGecko'
+                }
+
+            # Kết quả một phần: coin trong universe không lấy được quote (kể cả dữ liệu cũ)
+            missing_symbols = [symbol for symbol in coin_info if symbol not in combined_crypto_data]
+            documents['cryptocurrencies']['partial'] = bool(missing_symbols)
+            documents['cryptocurrencies']['missing_symbols'] = missing_symbols
         
-        # Lưu dữ liệu chỉ số chứng khoán
+        # Dữ liệu chỉ số chứng khoán
         if stock_indices:
-            if self.save_to_firestore('stock_indices', {
+            documents['stock_indices'] = {
                 'data': stock_indices,
                 'total_indices': len(stock_indices),
                 'source': 'Yahoo Finance',
                 'usd_to_vnd_rate': self.usd_to_vnd_rate
-            }):
-                saved_count += 1
+            }
         
-        # Lưu dữ liệu hàng hóa
+        # Dữ liệu hàng hóa
         if commodities:
-            if self.save_to_firestore('commodities', {
+            documents['commodities'] = {
                 'data': commodities,
                 'total_commodities': len(commodities),
                 'source': 'Yahoo Finance',
                 'usd_to_vnd_rate': self.usd_to_vnd_rate
-            }):
-                saved_count += 1
+            }
         
-        # Lưu tổng quan thị trường
-        market_overview = {
+        # Tổng quan thị trường
+        documents['market_overview'] = self.build_market_overview(crypto_data, coin_info, stock_indices, commodities)
+        
+        return documents
+
+    def build_market_overview(self, crypto_data, coin_info, stock_indices, commodities):
+        """Document market_overview (số lượng của từng nhóm tài sản)"""
+        return {
             'crypto_count': len(crypto_data) if crypto_data else 0,
+            'crypto_universe_size': len(coin_info) if coin_info else 0,
             'stock_indices_count': len(stock_indices) if stock_indices else 0,
             'commodities_count': len(commodities) if commodities else 0,
             'usd_to_vnd_rate': self.usd_to_vnd_rate,
+            'partial': self.deadline_exceeded,
             'data_sources': ['Yahoo Finance', 'CoinGecko', 'Exchange Rate API']
         }
+
+    def save_all_data_to_firestore(self, crypto_data, coin_info, stock_indices, commodities):
+        """Lưu tất cả dữ liệu vào Firestore"""
+        documents = self.build_documents(crypto_data, coin_info, stock_indices, commodities)
         
-        if self.save_to_firestore('market_overview', market_overview):
-            saved_count += 1
+        if self.publish_mode == 'snapshot':
+            return self.publish_snapshot(documents)
+        
+        saved_count = 0
+        for document_name, data in documents.items():
+            if self.timed('document', document_name, self.save_document, document_name, data):
+                saved_count += 1
+        
+        self.flush_change_detector()
         
         return saved_count
 
+    def save_document(self, document_name, data):
+        """Lưu một document của build_documents (các coin của layout sharded lưu riêng)"""
+        if document_name == CRYPTO_ASSETS_DOCUMENT:
+            return self.save_crypto_assets(data)
+        return self.save_to_firestore(document_name, data)
+
+    def get_asset_manifest(self):
+        """FieldManifest cho các document coin (cùng điều kiện với get_change_detector)"""
+        if self.get_change_detector() is None:
+            return None
+        if self.asset_manifest is None:
+            manifest_id = f"{self.collection_name}__{CRYPTO_ASSETS_DOCUMENT.replace('/', '_')}"
+            self.asset_manifest = FieldManifest(self.db, manifest_id)
+        return self.asset_manifest
+
+    def save_crypto_assets(self, assets):
+        """Lưu mỗi coin một document trong {collection}/cryptocurrencies/assets
+
+        Ở chế độ upsert chỉ ghi field thay đổi so với lần ghi trước (field
+        mask, theo FieldManifest); coin mới được ghi cả document, coin không
+        còn trong universe bị xóa. Không có manifest thì so với danh sách id
+        của lần chạy trước (AssetUniverse), chỉ xóa khi universe thay đổi.
+        """
+        if not self.storage:
+            print("❌ Chưa kết nối với Firestore")
+            return False
+
+        collection = f"{self.collection_name}/{CRYPTO_ASSETS_DOCUMENT}"
+        try:
+            manifest = self.get_asset_manifest()
+            writes = []
+            partial = 0
+            for doc_id, data in assets.items():
+                fields = manifest.changed_fields(doc_id, data) if manifest else None
+                if fields == []:
+                    continue
+                self.stamp_document(data)
+                if fields:
+                    partial += 1
+                    fields = fields + ['timestamp', 'last_updated']
+                writes.append((doc_id, data, fields))
+
+            if writes:
+                self.storage.write_many(collection, writes)
+
+            # Coin rời khỏi universe (chưa biết universe cũ thì xóa mọi coin không còn theo dõi)
+            known = manifest.known_ids() if manifest else self.asset_universe.load(collection)
+            removed = known - set(assets) if known is not None else None
+            deleted = 0
+            if removed is None or removed:
+                deleted = self.storage.clear(collection, keep=list(assets))
+            if not manifest and known != set(assets):
+                self.asset_universe.save(collection, assets)
+
+            if manifest:
+                # Hash chỉ vào manifest khi storage xác nhận đã ghi (flush_change_detector)
+                for doc_id, data, _ in writes:
+                    manifest.mark(doc_id, data)
+                manifest.remove(removed)
+
+            print(f"✅ Đã lưu {len(writes)}/{len(assets)} coin vào '{collection}' "
+                  f"({len(writes) - partial} cả document, {partial} chỉ field thay đổi, "
+                  f"{len(assets) - len(writes)} không đổi, {deleted} xóa)")
+            return True
+
+        except Exception as e:
+            print(f"❌ Lỗi khi lưu các coin vào '{collection}': {e}")
+            return False
+
+    def flush_change_detector(self):
+        """Ghi manifest hash của chế độ upsert và in số document đã ghi / bỏ qua
+
+        Chờ storage ghi xong (write-behind) trước, chỉ document đã ghi thành
+        công mới được đưa vào manifest (cả manifest field của các coin).
+        """
+        detector = self.get_change_detector()
+        if not detector:
+            return
+        self.commit_change_detector(
+            (detector, self.collection_name),
+            (self.asset_manifest, f"{self.collection_name}/{CRYPTO_ASSETS_DOCUMENT}")
+        )
+        print(f"📝 Upsert: {detector.summary()}")
+
+    def commit_change_detector(self, *detectors):
+        """Chờ storage ghi xong rồi commit từng (detector, collection) và lưu manifest của nó
+
+        Storage chỉ được flush một lần cho mọi detector: dropped_keys chỉ
+        có ở lần flush() đầu tiên sau khi record bị bỏ.
+        """
+        detectors = [(detector, collection, detector.pending()) for detector, collection in detectors if detector]
+        dropped = set() if self.storage.flush() else self.storage.dropped_keys
+        for detector, collection, written in detectors:
+            detector.commit(written, {doc_id for name, doc_id in dropped if name == collection})
+            try:
+                detector.flush()
+            except Exception as e:
+                print(f"⚠️ Lỗi khi lưu manifest hash: {e}")
+
+    def publish_snapshot(self, documents):
+        """Ghi documents thành snapshot mới và flip pointer trong một transaction"""
+        if not self.db:
+            print("❌ Chưa kết nối với Firestore")
+            return 0
+        
+        documents = dict(documents)
+        # Snapshot ghi mọi document nên các coin được ghi đầy đủ, dưới cùng đường dẫn
+        for doc_id, data in documents.pop(CRYPTO_ASSETS_DOCUMENT, {}).items():
+            documents[f"{CRYPTO_ASSETS_DOCUMENT}/{doc_id}"] = data
+        if self.exchange_rate_data:
+            documents['exchange_rates'] = dict(self.exchange_rate_data)
+        for data in documents.values():
+            self.stamp_document(data)
+        
+        try:
+            if self.publisher is None:
+                from snapshot_publisher import SnapshotPublisher
+                self.publisher = SnapshotPublisher(self.db, self.collection_name)
+            self.publisher.publish(documents)
+            return len(documents)
+        except Exception as e:
+            print(f"❌ Lỗi khi publish snapshot: {e}")
+            return 0
+
+    def record_history(self, crypto_data, coin_info, stock_indices, commodities):
+        """Ghi quote vào lịch sử giá cục bộ và compaction dữ liệu cũ
+
+        Trả về danh sách Yahoo symbol đã ghi.
+        """
+        if not self.history:
+            return []
+
+        quotes = dict(crypto_data or {})
+        for data in (stock_indices or {}).values():
+            quotes[data['symbol']] = data
+        if commodities and 'GOLD' in commodities:
+            quotes[GOLD_SYMBOL] = commodities['GOLD']
+        volumes = {symbol: info.get('total_volume') for symbol, info in (coin_info or {}).items()}
+
+        try:
+            appended = self.history.append_quotes(quotes, volumes)
+            # Chỉ symbol vừa có điểm mới mới có thể có partition cần compaction
+            compacted = self.history.compact(symbols=appended)
+            print(f"🗃️ Lịch sử giá: thêm {len(appended)} điểm, compaction {compacted} partition ({self.history.root})")
+        except Exception as e:
+            print(f"⚠️ Lỗi khi ghi lịch sử giá: {e}")
+        return list(quotes)
+
+    def publish_history(self, symbols, resolution='1h', days=30):
+        """Publish chuỗi giá đã downsample qua storage: một document cho mỗi symbol
+
+        Ở chế độ upsert, chuỗi không đổi so với lần publish trước được bỏ
+        qua (ChangeDetector riêng cho collection lịch sử).
+        """
+        if not self.history or not self.storage or not symbols:
+            return 0
+
+        try:
+            detector = self.get_history_detector()
+            documents = []
+            skipped = 0
+            for doc_id, document in self.history.series_documents(symbols, resolution, days).items():
+                if detector and not detector.has_changed(doc_id, document):
+                    detector.mark_skipped(doc_id)
+                    skipped += 1
+                    continue
+                documents.append((doc_id, document))
+
+            if documents:
+                self.storage.write_many(self.history_collection, documents)
+            if detector:
+                for doc_id, document in documents:
+                    detector.mark_written(doc_id, document)
+                self.commit_change_detector((detector, self.history_collection))
+
+            print(f"📈 Đã publish lịch sử {resolution} của {len(documents)} symbols vào "
+                  f"'{self.history_collection}' ({skipped} không đổi)")
+            return len(documents)
+        except Exception as e:
+            print(f"❌ Lỗi khi publish lịch sử giá: {e}")
+            return 0
+
+    def refresh(self, asset_class, top_limit=None):
+        """Làm mới riêng một nhóm tài sản và lưu document tương ứng
+
+        asset_class: 'fx', 'crypto', 'indices' hoặc 'commodities'. Dùng cho
+        daemon, nơi mỗi nhóm có lịch chạy riêng. Metrics của mỗi lần làm mới
+        được ghi ra crypto_tracker_{asset_class}.prom / .json.
+        """
+        if asset_class != 'fx' and asset_class not in ASSET_CLASS_DOCUMENTS:
+            raise ValueError(f"Nhóm tài sản không hợp lệ: {asset_class}")
+
+        metrics = self.start_metrics(f"crypto_tracker_{asset_class}")
+        try:
+            if asset_class == 'fx':
+                with metrics.phase('fx'):
+                    return self.get_usd_to_vnd_rate()
+            return self._refresh(asset_class, top_limit)
+        finally:
+            metrics.set_value('run_deadline_exceeded', int(self.deadline_exceeded))
+            metrics.finish(print_summary=False)
+
+    def _refresh(self, asset_class, top_limit):
+        metrics = self.metrics
+        if self.usd_to_vnd_rate is None:
+            with metrics.phase('fx'):
+                self.get_usd_to_vnd_rate()
+
+        self.failed_symbols = []
+        latest = self.latest
+        if asset_class == 'crypto':
+            with metrics.phase('toplist') as phase:
+                yahoo_symbols, coin_info = self.get_top_cryptocurrencies(top_limit)
+                if not yahoo_symbols or not coin_info:
+                    phase.status = 'error'
+                    print("❌ Không thể lấy danh sách top crypto")
+                    return False
+            latest['coin_info'] = coin_info
+            with metrics.phase('quotes'):
+                latest['crypto_data'] = self.get_all_crypto_data(yahoo_symbols)
+            with metrics.phase('history'):
+                history_symbols = self.record_history(latest['crypto_data'], coin_info, {}, {})
+        elif asset_class == 'indices':
+            with metrics.phase('quotes'):
+                latest['stock_indices'] = self.get_all_stock_indices()
+            with metrics.phase('history'):
+                history_symbols = self.record_history({}, {}, latest['stock_indices'], {})
+        else:
+            with metrics.phase('quotes'):
+                latest['commodities'] = self.get_all_commodities()
+            with metrics.phase('history'):
+                history_symbols = self.record_history({}, {}, {}, latest['commodities'])
+
+        if self.failed_symbols:
+            print(f"⚠️ Không lấy được: {', '.join(self.failed_symbols)}")
+
+        if not self.storage:
+            return True
+
+        with metrics.phase('save') as phase:
+            documents = self.build_documents(**latest)
+            if self.publish_mode == 'snapshot':
+                saved_count = self.publish_snapshot(documents)
+                phase.docs += saved_count
+            else:
+                saved_count = 0
+                names = (CRYPTO_ASSETS_DOCUMENT,) if asset_class == 'crypto' else ()
+                for document_name in names + (ASSET_CLASS_DOCUMENTS[asset_class], 'market_overview'):
+                    if document_name in documents and self.timed('document', document_name, self.save_document,
+                                                                 document_name, documents[document_name]):
+                        saved_count += 1
+                self.flush_change_detector()
+            if not saved_count:
+                phase.status = 'error'
+
+        with metrics.phase('publish_history'):
+            self.publish_history(history_symbols)
+        return saved_count > 0
+
+    def print_coverage(self, yahoo_symbols, crypto_data, metrics=None):
+        """In tỷ lệ coin trong universe có quote (và thời gian từng phase đã chạy)"""
+        total = len(yahoo_symbols)
+        covered = sum(1 for symbol in yahoo_symbols if symbol in (crypto_data or {}))
+        stale = sum(1 for symbol in yahoo_symbols if (crypto_data or {}).get(symbol, {}).get('stale'))
+        percent = covered / total * 100 if total else 0
+        timings = ''
+        if metrics is not None:
+            metrics.set_value('crypto_universe_size', total)
+            metrics.set_value('crypto_quotes', covered)
+            metrics.set_value('crypto_coverage_ratio', round(covered / total, 4) if total else 0)
+            timings = ', '.join(f"{phase.name} {phase.seconds:.2f}s" for phase in metrics.phases)
+        print(f"📊 Độ phủ: {covered}/{total} coin có quote ({percent:.1f}%"
+              + (f", {stale} dữ liệu cũ" if stale else '') + ")"
+              + (f" | {timings}" if timings else ''))
+        return covered, total
+
+    def start_metrics(self, job):
+        """Bắt đầu đo metrics theo phase cho một lần chạy (xem run_metrics.RunMetrics)
+
+        Deadline RUN_DEADLINE của lần chạy cũng được tính từ đây, thống kê
+        của các ChangeDetector (dùng lại giữa các lần chạy) được xóa.
+        """
+        self.deadline = time.monotonic() + self.run_budget if self.run_budget > 0 else None
+        self.deadline_exceeded = False
+        for detector in (self.change_detector, self.history_detector):
+            if detector:
+                detector.reset()
+        self.metrics = RunMetrics(
+            job, http=self.http,
+            # Chỉ đếm khi storage đã được tạo, không khởi tạo Firebase chỉ để đếm
+            docs_counter=lambda: self._storage.written if self._storage else 0
+        )
+        return self.metrics
+
+    def timed(self, group, key, func, *args):
+        """Gọi func(*args), ghi thời gian vào metrics của run hiện tại (nếu có)"""
+        if self.metrics is None:
+            return func(*args)
+        return self.metrics.timed(group, key, func, *args)
+
+    def flush_storage(self):
+        """Chờ các thao tác ghi đang đệm (write-behind) hoàn tất"""
+        if self._storage:
+            self._storage.flush()
+            print(f"💽 Storage: {self._storage.summary()}")
+
+    def close(self):
+        """Hoàn tất các thao tác ghi đang chờ và đóng connection"""
+        self.flush_change_detector()
+        if self._storage:
+            self._storage.close()
+        if self.publisher is not None:
+            self.publisher.wait()
+        self.cache.wait_for_refreshes()
+        self.symbol_index.wait_for_refreshes()
+        self.http.close()
+
     def get_data_from_firestore(self, document_name):
             """Lấy dữ liệu từ Firestore"""
             try:
@@ -604,6 +1463,36 @@ class CryptoTracker:
                 print(f"❌ Lỗi khi lấy dữ liệu từ Firestore: {e}")
                 return None
 
+    def get_crypto_asset(self, symbol):
+        """Đọc dữ liệu một coin (Yahoo symbol) từ layout sharded, không tải cả universe"""
+        try:
+            if not self.db:
+                return None
+            doc = self.db.collection(f"{self.collection_name}/{CRYPTO_ASSETS_DOCUMENT}").document(asset_id(symbol)).get()
+            return doc.to_dict() if doc.exists else None
+        except Exception as e:
+            print(f"❌ Lỗi khi lấy dữ liệu {symbol} từ Firestore: {e}")
+            return None
+
+    def get_crypto_assets(self, page=1, page_size=50):
+        """Một trang coin (theo thứ hạng) từ layout sharded: {asset_id: data}
+
+        Đọc document summary để lấy danh sách id theo thứ hạng, rồi chỉ đọc
+        các document coin của trang đó (một lệnh get_all).
+        """
+        try:
+            summary = self.get_data_from_firestore('cryptocurrencies')
+            if not summary or summary.get('layout') != 'sharded':
+                return None
+            ids = summary['symbols'][(page - 1) * page_size:page * page_size]
+            assets_ref = self.db.collection(f"{self.collection_name}/{CRYPTO_ASSETS_DOCUMENT}")
+            docs = self.db.get_all([assets_ref.document(doc_id) for doc_id in ids])
+            assets = {doc.id: doc.to_dict() for doc in docs if doc.exists}
+            return {doc_id: assets[doc_id] for doc_id in ids if doc_id in assets}
+        except Exception as e:
+            print(f"❌ Lỗi khi lấy trang {page} các coin từ Firestore: {e}")
+            return None
+
     def list_all_documents(self):
         """Liệt kê tất cả documents trong collection 'crypto & finance'"""
         try:
@@ -627,107 +1516,348 @@ class CryptoTracker:
             print(f"❌ Lỗi khi liệt kê documents: {e}")
             return False
 
-    def clear_collection(self, batch_size=500):
-        """Xóa toàn bộ dữ liệu cũ trong collection trước khi ghi mới."""
-        if not self.db:
-            if not self.init_firebase():
-                print("❌ Không thể kết nối Firestore để xóa dữ liệu.")
-                return False
-
-        coll_ref = self.db.collection(self.collection_name)
+    def clear_collection(self, keep=()):
+        """Xóa dữ liệu cũ trong collection trước khi ghi mới (trừ các document trong keep)."""
+        if not self.storage:
+            print("❌ Không thể kết nối Firestore để xóa dữ liệu.")
+            return False
 
-        total_deleted = 0
-        while True:
-            docs = coll_ref.limit(batch_size).stream()
-            deleted_in_batch = 0
-            for doc in docs:
-                doc.reference.delete()
-                deleted_in_batch += 1
-            total_deleted += deleted_in_batch
-            if deleted_in_batch < batch_size:
-                break  # đã hết document
+        total_deleted = self.storage.clear(self.collection_name, keep=keep)
 
         print(f"🧹 Đã xóa {total_deleted} documents cũ trong collection '{self.collection_name}'.")
         return True
     
     def full_market_overview(self):
-        """Hiển thị tổng quan thị trường và lưu vào Firestore"""
-        # Khởi tạo Firebase
-        if not self.init_firebase():
-            print("❌ Không thể khởi tạo Firebase. Tiếp tục mà không lưu dữ liệu.")
-        
-        # Lấy tỷ giá USD/VND trước
-        print("🔄 Đang lấy tỷ giá USD/VND...")
-        self.get_usd_to_vnd_rate()
+        """Hiển thị tổng quan thị trường và lưu vào Firestore
 
-        print("🔄 Đang lấy top 10 cryptocurrency từ CoinGecko...")
-
-        # Lấy top 10 crypto từ CoinGecko
-        yahoo_symbols, coin_info = self.get_top_cryptocurrencies(10)
+        Thời gian, số byte, status HTTP, retries và số document của từng phase
+        được ghi ra METRICS_DIR/crypto_tracker.prom / .json khi kết thúc.
+        """
+        metrics = self.start_metrics('crypto_tracker')
+        try:
+            if self.pipeline_enabled:
+                return self._pipelined_market_overview(metrics)
+            return self._full_market_overview(metrics)
+        finally:
+            metrics.finish()
+
+    def run_stage(self, metrics, name, func, *args):
+        """Chạy một bước của pipeline như một phase concurrent"""
+        with metrics.phase(name, concurrent=True):
+            return func(*args)
+
+    def fetch_asset_class(self, asset_class, failed=None):
+        """Dữ liệu của một nhóm tài sản theo các key của build_documents (rỗng nếu lỗi)
+
+        Symbol không lấy được quote được thêm vào list failed (xem fetch_quotes).
+        """
+        if asset_class == 'crypto':
+            yahoo_symbols, coin_info = self.get_top_cryptocurrencies(self.top_limit)
+            if not yahoo_symbols or not coin_info:
+                print(f"❌ Không thể lấy danh sách top {self.top_limit} crypto")
+                return {}
+            print(f"✅ Đã lấy được {len(yahoo_symbols)} coin symbols, đang lấy quote từ Yahoo Finance...")
+            return {'crypto_data': self.get_all_crypto_data(yahoo_symbols, failed), 'coin_info': coin_info}
+        if asset_class == 'indices':
+            return {'stock_indices': self.get_all_stock_indices(failed)}
+        return {'commodities': self.get_all_commodities(failed)}
+
+    def run_branch(self, metrics, asset_class, *args):
+        """Chạy một nhánh của pipeline (xem _run_branch) với list symbol lỗi riêng
+
+        Trả về (documents, số document đã lưu, symbol lỗi, số giây từ lúc
+        nhánh bắt đầu tới khi lưu xong).
+        """
+        failed = []
+        start = time.perf_counter()
+        documents, saved_count = self._run_branch(metrics, asset_class, failed, *args)
+        return documents, saved_count, failed, time.perf_counter() - start
+
+    def _run_branch(self, metrics, asset_class, failed, fx_ready, cleared, stream, persist):
+        """Một nhánh của pipeline: fetch -> hiển thị (qua stream) -> transform -> persist
+
+        Dữ liệu được đưa vào stream ngay khi fetch xong (kể cả khi lỗi, để
+        main thread không chờ mãi). Transform chờ tỷ giá (fx_ready), lưu chờ
+        bước xóa collection (cleared, chế độ replace). Trả về (documents,
+        số document đã lưu).
+        """
+        data = {}
+        try:
+            with metrics.phase(f'{asset_class}.fetch', concurrent=True) as phase:
+                data = self.fetch_asset_class(asset_class, failed)
+                if not any(data.values()):
+                    phase.status = 'error'
+        finally:
+            stream.put((asset_class, data))
+        if not any(data.values()):
+            return {}, 0
+
+        fx_ready.result()
+        with metrics.phase(f'{asset_class}.transform', concurrent=True):
+            documents = self.build_documents(**{**dict.fromkeys(self.latest), **data})
+            documents.pop('market_overview')
+        if not persist:
+            return documents, 0
+
+        if cleared is not None:
+            cleared.result()
+        with metrics.phase(f'{asset_class}.save', concurrent=True) as phase:
+            saved_count = sum(
+                1 for document_name, document in documents.items()
+                if self.timed('document', document_name, self.save_document, document_name, document)
+            )
+            if saved_count < len(documents):
+                phase.status = 'error'
+        return documents, saved_count
+
+    def display_asset_class(self, asset_class, data, metrics):
+        """Hiển thị một nhóm tài sản ngay khi nhánh của nó fetch xong"""
+        if asset_class == 'indices':
+            if data.get('stock_indices'):
+                self.display_all_stock_indices(data['stock_indices'])
+            else:
+                print("❌ Không thể lấy dữ liệu chỉ số chứng khoán")
+        elif asset_class == 'commodities':
+            if data.get('commodities'):
+                self.display_all_commodities(data['commodities'])
+            else:
+                print("❌ Không thể lấy dữ liệu hàng hóa")
+        elif data.get('crypto_data') and data.get('coin_info'):
+            crypto_data, coin_info = data['crypto_data'], data['coin_info']
+            self.display_crypto_data_yahoo(crypto_data, coin_info)
+            print(f"\n📊 Thống kê: {len(crypto_data)}/{len(coin_info)} coin có dữ liệu từ Yahoo Finance")
+            self.print_coverage(list(coin_info), crypto_data, metrics)
+        else:
+            print("❌ Không thể lấy dữ liệu crypto từ Yahoo Finance")
 
-        if not yahoo_symbols or not coin_info:
-            print("❌ Không thể lấy danh sách top 10 crypto")
-            return False
+    def _pipelined_market_overview(self, metrics):
+        """full_market_overview dạng pipeline: các nhóm tài sản chạy song song
+
+        Tỷ giá, xóa collection (chế độ replace) và ba nhánh crypto / chỉ số /
+        hàng hóa bắt đầu cùng lúc. Nhánh nào fetch xong thì được hiển thị
+        ngay (main thread đọc stream) trong khi nhánh đó tiếp tục transform
+        và lưu, nên tổng thời gian xấp xỉ nhánh chậm nhất thay vì tổng các
+        phase. market_overview, lịch sử giá và snapshot (cần mọi document)
+        được ghi sau khi các nhánh xong.
+        """
+        if not self.use_db:
+            print("⚡ Chế độ --no-db: chỉ lấy và hiển thị dữ liệu, không lưu Firestore")
+
+        # Khởi tạo Firebase, storage và manifest ở main thread trước khi chia nhánh
+        storage = self.storage
+        if self.use_db and not storage:
+            print("⚠️ Không thể lưu vào Firestore do lỗi khởi tạo")
+        self.get_change_detector()
+        self.get_asset_manifest()
+        snapshot = self.publish_mode == 'snapshot'
+
+        self.failed_symbols = []
+        branches = ('crypto', 'indices', 'commodities')
+        stream = queue.Queue()
+        results = dict.fromkeys(self.latest)
+        documents = {}
+        saved_count = 0
+        ok = True
+
+        print(f"🔄 Pipeline: tỷ giá, top {self.top_limit} crypto, chỉ số chứng khoán và hàng hóa chạy song song "
+              f"(tối đa {self.max_workers} request song song mỗi nhánh)...")
+        with metrics.phase('pipeline') as pipeline_phase, \
+                ThreadPoolExecutor(max_workers=len(branches) + 2) as executor:
+            fx_ready = executor.submit(self.run_stage, metrics, 'fx', self.get_usd_to_vnd_rate)
+            cleared = None
+            if storage and self.publish_mode == 'replace':
+                # Giữ lại exchange_rates do nhánh tỷ giá ghi
+                cleared = executor.submit(self.run_stage, metrics, 'clear', self.clear_collection, ('exchange_rates',))
+            futures = {
+                asset_class: executor.submit(self.run_branch, metrics, asset_class, fx_ready, cleared, stream,
+                                             bool(storage) and not snapshot)
+                for asset_class in branches
+            }
 
-        print(f"✅ Đã lấy được {len(yahoo_symbols)} coin symbols cho Yahoo Finance")
-        print(f"📋 Danh sách: {', '.join(yahoo_symbols)}")
+            # Hiển thị cần tỷ giá; các nhánh vẫn fetch trong lúc chờ
+            fx_ready.result()
+            print(f"\n{'='*120}")
+            print(f"🌍 TỔNG QUAN THỊ TRƯỜNG - {datetime.now().strftime('%Y-%m-%d %H:%M:%S')}")
+            if self.usd_to_vnd_rate:
+                print(f"💱 Tỷ giá USD/VND: {self.usd_to_vnd_rate:,.0f}")
+            print(f"{'='*120}")
+
+            for _ in branches:
+                asset_class, data = stream.get()
+                results.update(data)
+                with metrics.phase(f'{asset_class}.display', concurrent=True):
+                    self.display_asset_class(asset_class, data, metrics)
+
+            # Gộp kết quả và symbol lỗi của các nhánh theo thứ tự cố định
+            branch_seconds = {}
+            for asset_class, future in futures.items():
+                try:
+                    branch_documents, branch_saved, branch_failed, branch_seconds[asset_class] = future.result()
+                except Exception as e:
+                    print(f"❌ Lỗi ở nhánh {asset_class}: {e}")
+                    ok = False
+                    continue
+                documents.update(branch_documents)
+                saved_count += branch_saved
+                self.failed_symbols.extend(branch_failed)
+                metrics.set_value(f'pipeline_{asset_class}_seconds', round(branch_seconds[asset_class], 4))
+            if cleared is not None and not cleared.result():
+                ok = False
+            if not ok:
+                pipeline_phase.status = 'partial'
+
+        branch_times = ', '.join(f"{asset_class} {seconds:.2f}s" for asset_class, seconds in branch_seconds.items())
+        print(f"⏱️ Pipeline xong trong {pipeline_phase.seconds:.2f}s (thời gian từng nhánh: {branch_times})")
+        if self.failed_symbols:
+            print(f"⚠️ Không lấy được: {', '.join(self.failed_symbols)}")
+
+        crypto_data, coin_info = results['crypto_data'], results['coin_info']
+        with metrics.phase('history'):
+            history_symbols = self.record_history(crypto_data, coin_info, results['stock_indices'], results['commodities'])
+
+        if storage:
+            with metrics.phase('save') as phase:
+                documents['market_overview'] = self.build_market_overview(**results)
+                if snapshot:
+                    saved_count = self.publish_snapshot(documents)
+                    phase.docs += saved_count
+                elif self.save_document('market_overview', documents['market_overview']):
+                    saved_count += 1
+                self.flush_change_detector()
+                if saved_count > 0:
+                    print(f"✅ Đã lưu {saved_count} documents vào Firestore thành công!")
+                else:
+                    phase.status = 'error'
+                    print("❌ Có lỗi khi lưu dữ liệu vào Firestore")
 
-        print("🔄 Đang lấy dữ liệu từ Yahoo Finance...")
+            with metrics.phase('publish_history'):
+                self.publish_history(history_symbols)
 
-        # Lấy dữ liệu crypto từ Yahoo Finance
-        crypto_data = self.get_all_crypto_data(yahoo_symbols)
+        self.finish_overview(metrics)
+        return crypto_data and coin_info
 
-        # Lấy dữ liệu các chỉ số chứng khoán
-        stock_indices = self.get_all_stock_indices()
+    def finish_overview(self, metrics):
+        """Chờ các thao tác ghi / làm mới ở background và in thống kê cuối run"""
+        with metrics.phase('flush'):
+            self.flush_storage()
+            if self.publisher is not None:
+                self.publisher.wait()
+        self.http.print_stats()
+        self.http.print_hedge_stats()
+        metrics.set_value('hedged_requests', self.http.hedge_stats['hedged'])
+        metrics.set_value('run_deadline_exceeded', int(self.deadline_exceeded))
+        if self.deadline_exceeded:
+            print(f"⏰ Run vượt deadline {self.run_budget:g}s: dữ liệu đã lưu được đánh dấu partial")
+        self.cache.wait_for_refreshes()
+        self.cache.print_stats()
+        self.symbol_index.wait_for_refreshes()
+        self.symbol_index.print_stats()
+
+    def _full_market_overview(self, metrics):
+        # Firebase được khởi tạo khi ghi lần đầu (ở bước lưu tỷ giá)
+        if not self.use_db:
+            print("⚡ Chế độ --no-db: chỉ lấy và hiển thị dữ liệu, không lưu Firestore")
+        
+        # Lấy tỷ giá USD/VND trước
+        print("🔄 Đang lấy tỷ giá USD/VND...")
+        with metrics.phase('fx'):
+            self.get_usd_to_vnd_rate()
 
-        # Lấy dữ liệu hàng hóa
-        commodities = self.get_all_commodities()
+        print(f"🔄 Đang lấy top {self.top_limit} cryptocurrency từ CoinGecko...")
 
-        print(f"\n{'='*120}")
-        print(f"🌍 TỔNG QUAN THỊ TRƯỜNG - {datetime.now().strftime('%Y-%m-%d %H:%M:%S')}")
-        if self.usd_to_vnd_rate:
-            print(f"💱 Tỷ giá USD/VND: {self.usd_to_vnd_rate:,.0f}")
-        print(f"{'='*120}")
+        # Lấy top N crypto từ CoinGecko (nhiều trang thì lấy song song)
+        with metrics.phase('toplist') as phase:
+            yahoo_symbols, coin_info = self.get_top_cryptocurrencies(self.top_limit)
 
-        # Hiển thị các chỉ số chứng khoán
-        if stock_indices:
-            self.display_all_stock_indices(stock_indices)
-        else:
-            print("❌ Không thể lấy dữ liệu chỉ số chứng khoán")
+            if not yahoo_symbols or not coin_info:
+                phase.status = 'error'
+                print(f"❌ Không thể lấy danh sách top {self.top_limit} crypto")
+                return False
 
-        # Hiển thị hàng hóa
-        if commodities:
-            self.display_all_commodities(commodities)
-        else:
-            print("❌ Không thể lấy dữ liệu hàng hóa")
+        print(f"✅ Đã lấy được {len(yahoo_symbols)} coin symbols cho Yahoo Finance")
+        shown = ', '.join(yahoo_symbols[:self.display_limit])
+        more = f" ... (+{len(yahoo_symbols) - self.display_limit})" if len(yahoo_symbols) > self.display_limit else ''
+        print(f"📋 Danh sách: {shown}{more}")
+
+        print(f"🔄 Đang lấy dữ liệu từ Yahoo Finance (tối đa {self.max_workers} request song song)...")
+
+        # Lấy đồng thời crypto, chỉ số chứng khoán và hàng hóa
+        self.failed_symbols = []
+        fetch_start = time.time()
+        with metrics.phase('quotes'):
+            crypto_data, stock_indices, commodities = self.fetch_all_quotes(yahoo_symbols)
+        print(f"⏱️ Đã lấy dữ liệu Yahoo Finance trong {time.time() - fetch_start:.2f}s")
+        if self.failed_symbols:
+            print(f"⚠️ Không lấy được: {', '.join(self.failed_symbols)}")
+        self.print_coverage(yahoo_symbols, crypto_data, metrics)
+
+        # Ghi lịch sử giá cục bộ
+        with metrics.phase('history'):
+            history_symbols = self.record_history(crypto_data, coin_info, stock_indices, commodities)
+
+        with metrics.phase('display'):
+            print(f"\n{'='*120}")
+            print(f"🌍 TỔNG QUAN THỊ TRƯỜNG - {datetime.now().strftime('%Y-%m-%d %H:%M:%S')}")
+            if self.usd_to_vnd_rate:
+                print(f"💱 Tỷ giá USD/VND: {self.usd_to_vnd_rate:,.0f}")
+            print(f"{'='*120}")
+
+            # Hiển thị các chỉ số chứng khoán
+            if stock_indices:
+                self.display_all_stock_indices(stock_indices)
+            else:
+                print("❌ Không thể lấy dữ liệu chỉ số chứng khoán")
 
-        # Hiển thị crypto từ Yahoo Finance
-        if crypto_data and coin_info:
-            self.display_crypto_data_yahoo(crypto_data, coin_info)
-            success_count = len(crypto_data)
-            total_count = len(yahoo_symbols)
-            print(f"\n📊 Thống kê: {success_count}/{total_count} coin có dữ liệu từ Yahoo Finance")
-        else:
-            print("❌ Không thể lấy dữ liệu crypto từ Yahoo Finance")
+            # Hiển thị hàng hóa
+            if commodities:
+                self.display_all_commodities(commodities)
+            else:
+                print("❌ Không thể lấy dữ liệu hàng hóa")
+
+            # Hiển thị crypto từ Yahoo Finance
+            if crypto_data and coin_info:
+                self.display_crypto_data_yahoo(crypto_data, coin_info)
+                success_count = len(crypto_data)
+                total_count = len(yahoo_symbols)
+                print(f"\n📊 Thống kê: {success_count}/{total_count} coin có dữ liệu từ Yahoo Finance")
+            else:
+                print("❌ Không thể lấy dữ liệu crypto từ Yahoo Finance")
 
-        # Lưu dữ liệu vào Firestore
-        if hasattr(self, 'db') and self.db:
-            print("\n🧹 Đang xóa dữ liệu cũ trong Firestore...")
-            self.clear_collection()
+        # Lưu dữ liệu vào Firestore (và các backend storage khác)
+        if self.storage:
+            if self.publish_mode == 'replace':
+                print("\n🧹 Đang xóa dữ liệu cũ trong Firestore...")
+                # Giữ lại exchange_rates vừa ghi ở bước lấy tỷ giá
+                with metrics.phase('clear'):
+                    self.clear_collection(keep=('exchange_rates',))
 
             print("\n🔄 Đang lưu dữ liệu mới vào Firestore...")
-            saved_count = self.save_all_data_to_firestore(crypto_data, coin_info, stock_indices, commodities)
-            if saved_count > 0:
-                print(f"✅ Đã lưu {saved_count} documents vào Firestore thành công!")
-            else:
-                print("❌ Có lỗi khi lưu dữ liệu vào Firestore")
-        else:
+            with metrics.phase('save') as phase:
+                saved_count = self.save_all_data_to_firestore(crypto_data, coin_info, stock_indices, commodities)
+                if self.publish_mode == 'snapshot':
+                    phase.docs += saved_count
+                if saved_count > 0:
+                    print(f"✅ Đã lưu {saved_count} documents vào Firestore thành công!")
+                else:
+                    phase.status = 'error'
+                    print("❌ Có lỗi khi lưu dữ liệu vào Firestore")
+
+            with metrics.phase('publish_history'):
+                self.publish_history(history_symbols)
+        elif self.use_db:
             print("⚠️ Không thể lưu vào Firestore do lỗi khởi tạo")
 
+        self.finish_overview(metrics)
         return crypto_data and coin_info
 
 if __name__ == "__main__":
-    tracker = CryptoTracker()
+    import argparse
+
+    parser = argparse.ArgumentParser(description="Theo dõi crypto, chỉ số chứng khoán và hàng hóa")
+    parser.add_argument('--no-db', action='store_true', help="Không khởi tạo Firebase, chỉ hiển thị dữ liệu")
+    args = parser.parse_args()
+
+    tracker = CryptoTracker(use_db=not args.no_db)
     
     # Test chạy full market overview
     success = tracker.full_market_overview()
@@ -736,7 +1866,8 @@ if __name__ == "__main__":
         print("\n✅ Chương trình chạy thành công!")
         
         # Optional: List all documents
-        print("\n🔍 Liệt kê tất cả documents:")
-        tracker.list_all_documents()
+        if tracker.db:
+            print("\n🔍 Liệt kê tất cả documents:")
+            tracker.list_all_documents()
     else:
         print("\n❌ Chương trình gặp lỗi!")
\ No newline at end of file
@@ -0,0 +1,78 @@
+import math
+import os
+
+# Giới hạn số thao tác trong một WriteBatch của Firestore
+MAX_BATCH_OPS = 500
+
+
+class BatchWriter:
+    """Gom các thao tác set/update/delete vào WriteBatch, commit theo chunk
+
+    Đếm số RPC thực tế (commit + list) và số document bị tác động để so sánh
+    với cách ghi từng document một.
+    """
+
+    def __init__(self, db, chunk_size=None):
+        self.db = db
+        chunk_size = chunk_size or int(os.getenv('FIRESTORE_BATCH_SIZE', str(MAX_BATCH_OPS)))
+        self.chunk_size = max(1, min(chunk_size, MAX_BATCH_OPS))
+        self.rpc_count = 0
+        self.doc_count = 0
+        self._batch = None
+        self._pending = 0
+
+    def _add(self, op, *args, **kwargs):
+        if self._batch is None:
+            self._batch = self.db.batch()
+        getattr(self._batch, op)(*args, **kwargs)
+        self._pending += 1
+        self.doc_count += 1
+        if self._pending >= self.chunk_size:
+            self.commit()
+
+    def set(self, doc_ref, data, merge=False):
+        self._add('set', doc_ref, data, merge=merge)
+
+    def update(self, doc_ref, field_updates):
+        self._add('update', doc_ref, field_updates)
+
+    def delete(self, doc_ref):
+        self._add('delete', doc_ref)
+
+    def commit(self):
+        """Commit các thao tác còn lại trong batch hiện tại"""
+        if self._batch is None or self._pending == 0:
+            return
+        self._batch.commit()
+        self.rpc_count += 1
+        self._batch = None
+        self._pending = 0
+
+    def delete_collection(self, collection_ref, keep=(), recursive=False):
+        """Xóa toàn bộ documents của collection bằng batch delete
+
+        Chỉ lấy document reference (không tải dữ liệu) rồi xóa theo chunk.
+        Các document id trong keep được giữ lại. recursive=True thì xóa cả
+        subcollection của từng document (list_documents không đi xuống
+        subcollection). Trả về số document đã xóa.
+        """
+        deleted = 0
+        listed = 0
+        for doc_ref in collection_ref.list_documents(page_size=self.chunk_size):
+            listed += 1
+            if doc_ref.id in keep:
+                continue
+            if recursive:
+                # Mỗi lệnh collections() là một RPC
+                self.rpc_count += 1
+                for subcollection in doc_ref.collections():
+                    deleted += self.delete_collection(subcollection, recursive=True)
+            self.delete(doc_ref)
+            deleted += 1
+        self.commit()
+        # list_documents phân trang theo chunk_size: mỗi trang là một RPC
+        self.rpc_count += max(1, math.ceil(listed / self.chunk_size))
+        return deleted
+
+    def summary(self):
+        return f"{self.rpc_count} RPC cho {self.doc_count} documents"
@@ -0,0 +1,148 @@
+import json
+import os
+import time
+from datetime import datetime, timezone
+# numpy được import khi quy đổi lần đầu
+
+FX_URL = 'https://api.exchangerate-api.com/v4/latest/USD'
+
+# Các loại tiền được quy đổi sẵn và lưu cùng document (DISPLAY_CURRENCIES="VND,EUR,JPY")
+DEFAULT_DISPLAY_CURRENCIES = 'VND,EUR,JPY'
+
+# Các field giá (theo currency của quote) được quy đổi
+CONVERTED_FIELDS = ('current_price', 'previous_close', 'change')
+
+
+def display_currencies():
+    return [code.strip().upper() for code in os.getenv('DISPLAY_CURRENCIES', DEFAULT_DISPLAY_CURRENCIES).split(',')
+            if code.strip()]
+
+
+class RateTable:
+    """Bảng tỷ giá đầy đủ của một base currency (1 base = rates[code] code)"""
+
+    def __init__(self, base, rates, updated_at, source='exchangerate-api.com', stale=False):
+        self.base = base
+        self.rates = rates
+        # Epoch giây lúc upstream cập nhật bảng (time_last_updated)
+        self.updated_at = updated_at
+        self.source = source
+        self.stale = stale
+
+    @classmethod
+    def from_api(cls, data):
+        """Từ response /v4/latest/{base} của exchangerate-api.com"""
+        if not data.get('rates'):
+            raise ValueError("Response tỷ giá không có 'rates'")
+        return cls(data.get('base', 'USD'), data['rates'], data.get('time_last_updated') or time.time())
+
+    @classmethod
+    def from_dict(cls, data, stale=False):
+        return cls(data['base'], data['rates'], data['updated_at'], data.get('source', 'exchangerate-api.com'), stale)
+
+    def to_dict(self):
+        return {'base': self.base, 'rates': self.rates, 'updated_at': self.updated_at, 'source': self.source}
+
+    @property
+    def age(self):
+        return max(0.0, time.time() - self.updated_at)
+
+    def factor(self, source, target):
+        """Hệ số quy đổi 1 source -> target (tỷ giá chéo qua base), None nếu thiếu"""
+        source_rate = self.rates.get((source or self.base).upper())
+        target_rate = self.rates.get(target.upper())
+        if not source_rate or not target_rate:
+            return None
+        return target_rate / source_rate
+
+    def summary(self, currencies):
+        """Dữ liệu lưu vào document exchange_rates"""
+        data = {
+            'base': self.base,
+            'rates': {code: self.rates[code] for code in currencies if code in self.rates},
+            'rates_updated_at': datetime.fromtimestamp(self.updated_at, timezone.utc).isoformat(),
+            'source': self.source
+        }
+        if self.stale:
+            data['stale'] = True
+            data['stale_age_seconds'] = round(self.age)
+        return data
+
+
+class LastGoodRates:
+    """Bảng tỷ giá tốt gần nhất lưu trên đĩa (JSON), không hết hạn
+
+    Dùng thay cho tỷ giá cố định khi API tỷ giá lỗi: bảng trả về được đánh
+    dấu stale kèm tuổi của dữ liệu.
+    """
+
+    def __init__(self, path=None):
+        self.path = path or os.getenv('FX_LAST_GOOD_PATH', os.path.join('.cache', 'fx_last_good.json'))
+        self._saved_at = None
+
+    def load(self):
+        try:
+            with open(self.path, encoding='utf-8') as f:
+                return RateTable.from_dict(json.load(f), stale=True)
+        except (OSError, ValueError, KeyError):
+            return None
+
+    def save(self, table):
+        # Bảng từ cache thường trùng với bảng đã lưu: chỉ ghi khi upstream có bảng mới
+        if table.updated_at == self._saved_at:
+            return
+        try:
+            directory = os.path.dirname(self.path)
+            if directory:
+                os.makedirs(directory, exist_ok=True)
+            tmp_path = f"{self.path}.tmp"
+            with open(tmp_path, 'w', encoding='utf-8') as f:
+                json.dump(table.to_dict(), f)
+            os.replace(tmp_path, self.path)
+            self._saved_at = table.updated_at
+        except OSError as e:
+            print(f"⚠️ Không lưu được tỷ giá: {e}")
+
+
+def convert_quotes(quotes, table, currencies, fields=CONVERTED_FIELDS):
+    """Quy đổi giá của mọi quote sang các currency trong một phép nhân NumPy
+
+    quotes: list dict quote (có 'currency', mặc định base của bảng). Trả
+    về list dict mới (không sửa quote gốc) có thêm
+    'converted': {currency: {field: giá trị}}; field thiếu hoặc currency
+    không có tỷ giá thì bỏ qua.
+    """
+    if not quotes or not currencies or table is None:
+        return list(quotes)
+
+    import numpy as np
+
+    # Hệ số theo từng currency nguồn (thường chỉ vài loại), rồi chọn theo index
+    sources = sorted({(quote.get('currency') or table.base).upper() for quote in quotes})
+    factor_table = np.array([
+        [table.factor(source, target) or np.nan for target in currencies]
+        for source in sources
+    ], dtype=float)
+    source_index = {source: index for index, source in enumerate(sources)}
+    factors = factor_table[[source_index[(quote.get('currency') or table.base).upper()] for quote in quotes]]
+
+    values = np.array([
+        [quote.get(field) if isinstance(quote.get(field), (int, float)) else np.nan for field in fields]
+        for quote in quotes
+    ], dtype=float)
+
+    # (quote, field, currency)
+    converted = values[:, :, None] * factors[:, None, :]
+    valid = ~np.isnan(converted)
+    converted = converted.tolist()
+    valid = valid.tolist()
+
+    results = []
+    for quote, rows, masks in zip(quotes, converted, valid):
+        by_currency = {}
+        for column, currency in enumerate(currencies):
+            prices = {field: rows[row][column] for row, field in enumerate(fields) if masks[row][column]}
+            if prices:
+                by_currency[currency] = prices
+        results.append({**quote, 'converted': by_currency})
+    return results
@@ -0,0 +1,601 @@
+import os
+import random
+import threading
+import time
+from collections import Counter, defaultdict, deque
+from concurrent.futures import FIRST_COMPLETED, ThreadPoolExecutor, wait
+from datetime import datetime, timezone
+from email.utils import parsedate_to_datetime
+from urllib.parse import urlparse
+
+import requests
+from requests.adapters import HTTPAdapter
+
+# Các status code nên thử lại (bị throttle hoặc lỗi phía server)
+RETRY_STATUSES = {429, 500, 502, 503, 504}
+
+# Giới hạn mặc định theo host: (request/giây, burst). Ghi đè bằng
+# HTTP_RATE_LIMITS="api.coingecko.com=0.5:5,query1.finance.yahoo.com=10"
+DEFAULT_HOST_RATES = {
+    'api.coingecko.com': (0.5, 5),
+    'query1.finance.yahoo.com': (10.0, 20),
+    'query2.finance.yahoo.com': (10.0, 20)
+}
+
+
+def parse_retry_after(value):
+    """Số giây chờ từ header Retry-After (giây hoặc HTTP-date), None nếu không đọc được"""
+    if not value:
+        return None
+    try:
+        seconds = float(value)
+    except ValueError:
+        try:
+            retry_at = parsedate_to_datetime(value)
+            seconds = (retry_at - datetime.now(timezone.utc)).total_seconds()
+        except (TypeError, ValueError):
+            return None
+    return max(seconds, 0)
+
+
+def parse_rate_limits(value):
+    """'host=rate[:burst],...' -> {host: (rate, burst)}"""
+    limits = {}
+    for item in (value or '').split(','):
+        if '=' not in item:
+            continue
+        host, spec = item.split('=', 1)
+        rate, _, burst = spec.partition(':')
+        limits[host.strip()] = (float(rate), float(burst) if burst else None)
+    return limits
+
+
+def percentile(values, q):
+    """Percentile q (0-100) của danh sách số, nội suy tuyến tính giữa hai phần tử gần nhất"""
+    ordered = sorted(values)
+    if not ordered:
+        return None
+    position = (len(ordered) - 1) * q / 100
+    lower = int(position)
+    upper = min(lower + 1, len(ordered) - 1)
+    return ordered[lower] + (ordered[upper] - ordered[lower]) * (position - lower)
+
+
+class CircuitOpenError(requests.exceptions.RequestException):
+    """Host đang bị ngắt (circuit breaker mở), request không được gửi đi"""
+
+
+class DeadlineExceeded(requests.exceptions.RequestException):
+    """Hết thời gian của lần chạy (deadline), request không được gửi đi"""
+
+
+class TokenBucket:
+    """Token bucket với rate thích ứng (AIMD) cho một host
+
+    - 429 / Retry-After: giảm rate một nửa (không dưới min_rate), xóa token
+      đang có và tạm dừng mọi request tới host cho hết Retry-After
+    - Mỗi response thành công: tăng rate thêm recovery, tối đa về rate ban đầu
+    """
+
+    def __init__(self, rate, burst=None, min_rate=None, recovery=None,
+                 clock=time.monotonic, sleep=time.sleep):
+        self.max_rate = rate
+        self.rate = rate
+        self.min_rate = min_rate or rate / 16
+        self.burst = burst or max(1.0, rate)
+        # Hồi phục chậm: khoảng 50 response thành công để từ nửa rate về rate tối đa
+        self.recovery = recovery or rate / 100
+        self.clock = clock
+        self.sleep = sleep
+        self.tokens = self.burst
+        self.updated = clock()
+        self.paused_until = 0.0
+        self._lock = threading.Lock()
+
+    def _refill(self, now):
+        self.tokens = min(self.burst, self.tokens + (now - self.updated) * self.rate)
+        self.updated = now
+
+    def acquire(self, deadline=None):
+        """Chờ tới khi có token; trả về số giây đã chờ
+
+        deadline (theo clock): không chờ quá thời điểm này, không kịp có
+        token trước deadline thì raise DeadlineExceeded ngay.
+        """
+        waited = 0.0
+        while True:
+            with self._lock:
+                now = self.clock()
+                self._refill(now)
+                if now < self.paused_until:
+                    wait = self.paused_until - now
+                elif self.tokens >= 1:
+                    self.tokens -= 1
+                    return waited
+                else:
+                    wait = (1 - self.tokens) / self.rate
+            if deadline is not None and now + wait >= deadline:
+                raise DeadlineExceeded(f"Không kịp có token trước deadline (cần chờ {wait:.2f}s)")
+            self.sleep(wait)
+            waited += wait
+
+    def try_acquire(self):
+        """Lấy token nếu có sẵn, không chờ; False khi hết token hoặc host đang tạm dừng"""
+        with self._lock:
+            now = self.clock()
+            self._refill(now)
+            if now < self.paused_until or self.tokens < 1:
+                return False
+            self.tokens -= 1
+            return True
+
+    def throttled(self, retry_after=None):
+        with self._lock:
+            now = self.clock()
+            self._refill(now)
+            self.rate = max(self.min_rate, self.rate / 2)
+            self.tokens = 0.0
+            if retry_after:
+                self.paused_until = max(self.paused_until, now + retry_after)
+
+    def succeeded(self):
+        with self._lock:
+            if self.rate < self.max_rate:
+                self.rate = min(self.max_rate, self.rate + self.recovery)
+
+
+class CircuitBreaker:
+    """Ngắt một host sau failure_threshold lần lỗi liên tiếp, trong cooldown giây
+
+    Hết cooldown thì cho đúng một request thử (half-open): thành công thì
+    đóng lại, lỗi thì mở tiếp một cooldown nữa.
+    """
+
+    def __init__(self, failure_threshold=5, cooldown=60.0, clock=time.monotonic):
+        self.failure_threshold = failure_threshold
+        self.cooldown = cooldown
+        self.clock = clock
+        self.state = 'closed'
+        self.failures = 0
+        self.opened_at = 0.0
+        self._probing = False
+        self._lock = threading.Lock()
+
+    def allow(self):
+        with self._lock:
+            if self.state == 'closed':
+                return True
+            if self.state == 'open' and self.clock() - self.opened_at >= self.cooldown:
+                self.state = 'half_open'
+                self._probing = False
+            if self.state == 'half_open' and not self._probing:
+                self._probing = True
+                return True
+            return False
+
+    def remaining(self):
+        """Số giây còn lại trước khi được thử lại"""
+        with self._lock:
+            return max(0.0, self.cooldown - (self.clock() - self.opened_at)) if self.state == 'open' else 0.0
+
+    def record_success(self):
+        with self._lock:
+            self.state = 'closed'
+            self.failures = 0
+            self._probing = False
+
+    def record_failure(self):
+        with self._lock:
+            self.failures += 1
+            if self.state == 'half_open' or self.failures >= self.failure_threshold:
+                self.state = 'open'
+                self.opened_at = self.clock()
+                self._probing = False
+
+    def cancel(self):
+        """Trả lại lượt thử half-open khi request chưa được gửi (vd: hết deadline)"""
+        with self._lock:
+            if self.state == 'half_open':
+                self._probing = False
+
+
+class LatencyWindow:
+    """Độ trễ (giây) của các request gần nhất, dùng để tính hedge delay"""
+
+    def __init__(self, size=200):
+        self._samples = deque(maxlen=size)
+        self._lock = threading.Lock()
+
+    def record(self, seconds):
+        with self._lock:
+            self._samples.append(seconds)
+
+    def percentile(self, q, min_samples=20):
+        """Percentile q của cửa sổ, None khi chưa đủ min_samples mẫu"""
+        with self._lock:
+            samples = list(self._samples)
+        if len(samples) < min_samples:
+            return None
+        return percentile(samples, q)
+
+
+def _close_response(future):
+    """Đóng response của request đã bị hủy khi nó về"""
+    if future.cancelled() or future.exception() is not None:
+        return
+    future.result().close()
+
+
+class HttpClient:
+    """HTTP transport dùng chung cho các script
+
+    - Một requests.Session với connection pool theo host (keep-alive)
+    - Retry với exponential backoff có jitter cho 429/5xx và lỗi kết nối,
+      tôn trọng header Retry-After
+    - Timeout connect/read tách riêng
+    - Token bucket thích ứng theo host (DEFAULT_HOST_RATES / HTTP_RATE_LIMITS,
+      tắt bằng HTTP_RATE_LIMIT=0) và circuit breaker theo host: khi host
+      đang bị ngắt, request raise CircuitOpenError ngay để caller dùng dữ
+      liệu cũ trong cache
+    - Hedged request (get_hedged): request tới host chính chưa có trả lời
+      sau hedge delay (percentile HTTP_HEDGE_PERCENTILE của độ trễ gần đây)
+      thì gửi thêm bản sao tới host dự phòng, lấy response tốt đầu tiên
+    - Thống kê theo host: số connection mới và số lần dùng lại connection,
+      số byte tải về và số response theo status code
+    """
+
+    def __init__(self, headers=None, pool_size=None, max_retries=None,
+                 backoff_base=0.5, backoff_max=30.0,
+                 connect_timeout=None, read_timeout=None, rate_limits=None):
+        self.pool_size = pool_size or int(os.getenv('HTTP_POOL_SIZE', '20'))
+        self.max_retries = max_retries if max_retries is not None else int(os.getenv('HTTP_MAX_RETRIES', '3'))
+        self.backoff_base = backoff_base
+        self.backoff_max = backoff_max
+        self.timeout = (
+            connect_timeout or float(os.getenv('HTTP_CONNECT_TIMEOUT', '5')),
+            read_timeout or float(os.getenv('HTTP_READ_TIMEOUT', '15'))
+        )
+
+        self.session = requests.Session()
+        if headers:
+            self.session.headers.update(headers)
+
+        # Retry tự xử lý bên dưới nên tắt retry của urllib3
+        self.adapter = HTTPAdapter(pool_connections=32, pool_maxsize=self.pool_size, max_retries=0)
+        self.session.mount('https://', self.adapter)
+        self.session.mount('http://', self.adapter)
+
+        self._lock = threading.Lock()
+        self._stats = defaultdict(lambda: {'requests': 0, 'retries': 0, 'errors': 0, 'bytes': 0,
+                                           'throttled': 0, 'short_circuited': 0})
+        self._statuses = Counter()
+
+        # Rate limit theo host; rate_limits={} hoặc HTTP_RATE_LIMIT=0 để tắt
+        if rate_limits is None:
+            rate_limits = {}
+            if os.getenv('HTTP_RATE_LIMIT', '1') != '0':
+                rate_limits = dict(DEFAULT_HOST_RATES)
+                rate_limits.update(parse_rate_limits(os.getenv('HTTP_RATE_LIMITS')))
+        self.rate_limits = rate_limits
+        self.breaker_threshold = int(os.getenv('HTTP_BREAKER_THRESHOLD', '5'))
+        self.breaker_cooldown = float(os.getenv('HTTP_BREAKER_COOLDOWN', '60'))
+        self._limiters = {}
+        self._breakers = {}
+
+        # Hedged request: delay = percentile độ trễ gần đây, HTTP_HEDGE_DELAY khi chưa đủ mẫu
+        self.hedge_percentile = float(os.getenv('HTTP_HEDGE_PERCENTILE', '95'))
+        self.hedge_initial_delay = float(os.getenv('HTTP_HEDGE_DELAY', '1.0'))
+        self.hedge_min_delay = float(os.getenv('HTTP_HEDGE_MIN_DELAY', '0.05'))
+        self._latencies = defaultdict(LatencyWindow)
+        self._hedge_executor = None
+        self.hedge_stats = {'requests': 0, 'hedged': 0, 'hedge_wins': 0, 'cancelled': 0, 'skipped': 0}
+
+    def limiter(self, host):
+        """Token bucket của host (None nếu host không bị giới hạn)"""
+        with self._lock:
+            if host not in self._limiters:
+                rate, burst = self.rate_limits.get(host, (None, None))
+                self._limiters[host] = TokenBucket(rate, burst) if rate else None
+            return self._limiters[host]
+
+    def set_rate_limit(self, host, rate, burst=None):
+        """Đặt giới hạn request/giây cho host (rate 0/None = không giới hạn), thay token bucket cũ"""
+        with self._lock:
+            if rate:
+                self.rate_limits[host] = (rate, burst)
+            else:
+                self.rate_limits.pop(host, None)
+            self._limiters.pop(host, None)
+
+    def breaker(self, host):
+        with self._lock:
+            if host not in self._breakers:
+                self._breakers[host] = CircuitBreaker(self.breaker_threshold, self.breaker_cooldown)
+            return self._breakers[host]
+
+    def get(self, url, **kwargs):
+        return self.request('GET', url, **kwargs)
+
+    def request(self, method, url, timeout=None, deadline=None, **kwargs):
+        """Gửi request, tự retry khi gặp 429/5xx hoặc lỗi kết nối
+
+        Hết lượt retry thì trả về response cuối cùng (để caller gọi
+        raise_for_status) hoặc raise lại exception của requests. Host đang
+        bị ngắt thì raise CircuitOpenError mà không gửi request.
+
+        deadline (time.monotonic): chờ token và timeout của từng lần gửi
+        không vượt quá deadline; backoff không kịp trước deadline thì dừng
+        retry. Hết giờ trước khi gửi được thì raise DeadlineExceeded.
+        """
+        return self._send(method, url, timeout, deadline, self.max_retries, **kwargs)
+
+    def _send(self, method, url, timeout, deadline, retries, acquire=True, latency=None, **kwargs):
+        """Vòng gửi / retry của request()
+
+        acquire=False khi token của lần gửi đầu đã được lấy trước; latency
+        (LatencyWindow) nhận thời gian của từng lần gửi có response, không
+        tính thời gian chờ token hay backoff.
+        """
+        host = urlparse(url).netloc
+        timeout = timeout or self.timeout
+        limiter = self.limiter(host)
+        breaker = self.breaker(host)
+        attempt = 0
+
+        if not breaker.allow():
+            self._count(host, 'short_circuited')
+            raise CircuitOpenError(f"{host} tạm ngắt sau nhiều lỗi liên tiếp, thử lại sau {breaker.remaining():.0f}s")
+
+        while True:
+            try:
+                attempt_timeout = self._clamp_timeout(timeout, deadline)
+                if limiter and (acquire or attempt):
+                    limiter.acquire(deadline)
+            except DeadlineExceeded:
+                breaker.cancel()
+                raise
+            self._count(host, 'requests')
+            start = time.perf_counter()
+            try:
+                response = self.session.request(method, url, timeout=attempt_timeout, **kwargs)
+            except (requests.exceptions.ConnectionError, requests.exceptions.Timeout):
+                delay = self._backoff_delay(attempt)
+                if attempt >= retries or not self._fits(delay, deadline):
+                    self._count(host, 'errors')
+                    breaker.record_failure()
+                    raise
+            else:
+                if latency is not None:
+                    latency.record(time.perf_counter() - start)
+                self._record_response(host, response)
+                if response.status_code == 429:
+                    self._count(host, 'throttled')
+                    if limiter:
+                        limiter.throttled(parse_retry_after(response.headers.get('Retry-After')))
+                elif response.status_code < 400 and limiter:
+                    limiter.succeeded()
+                delay = None
+                if response.status_code in RETRY_STATUSES and attempt < retries:
+                    delay = self._backoff_delay(attempt, response.headers.get('Retry-After'))
+                if delay is None or not self._fits(delay, deadline):
+                    if response.status_code >= 400:
+                        self._count(host, 'errors')
+                    # 4xx khác 429 (vd: 404) nghĩa là host vẫn hoạt động
+                    if response.status_code in RETRY_STATUSES:
+                        breaker.record_failure()
+                    else:
+                        breaker.record_success()
+                    return response
+                response.close()
+
+            attempt += 1
+            self._count(host, 'retries')
+            time.sleep(delay)
+
+    @staticmethod
+    def _fits(delay, deadline):
+        """Chờ delay giây rồi thử lại có còn trước deadline không"""
+        return deadline is None or time.monotonic() + delay < deadline
+
+    @staticmethod
+    def _clamp_timeout(timeout, deadline):
+        """Timeout (connect, read) không vượt quá thời gian còn lại tới deadline"""
+        if deadline is None:
+            return timeout
+        remaining = deadline - time.monotonic()
+        if remaining <= 0:
+            raise DeadlineExceeded("Hết thời gian trước khi gửi request")
+        if not isinstance(timeout, tuple):
+            timeout = (timeout, timeout)
+        return tuple(min(value, remaining) for value in timeout)
+
+    def hedge_delay(self, key):
+        """Số giây chờ host chính trước khi gửi bản sao tới host dự phòng"""
+        delay = self._latencies[key].percentile(self.hedge_percentile)
+        if delay is None:
+            return self.hedge_initial_delay
+        return max(delay, self.hedge_min_delay)
+
+    def _hedge_pool(self):
+        with self._lock:
+            if self._hedge_executor is None:
+                workers = int(os.getenv('HTTP_HEDGE_WORKERS', '64'))
+                self._hedge_executor = ThreadPoolExecutor(max_workers=workers, thread_name_prefix='hedge')
+            return self._hedge_executor
+
+    def get_hedged(self, urls, timeout=None, deadline=None, **kwargs):
+        """GET urls[0]; chưa có trả lời sau hedge delay thì gửi thêm urls[1], ...
+
+        Trả về response tốt đầu tiên (status không thuộc RETRY_STATUSES, kể
+        cả 404 vì đó là câu trả lời chắc chắn). Host trả lỗi sớm thì bản sao
+        được gửi ngay, không chờ hết delay. Request còn lại bị hủy: chưa gửi
+        thì không gửi nữa, đang chạy thì response bị đóng khi về (requests
+        không ngắt được request đang chờ, nhưng nó vẫn bị giới hạn bởi
+        timeout). Mọi request đều lỗi thì trả về response lỗi cuối cùng
+        hoặc raise lại exception.
+
+        Token của host chính được lấy trước khi bắt đầu tính hedge delay;
+        mỗi lần gửi chỉ thử một lần (không retry, không backoff) và cửa sổ
+        độ trễ chỉ ghi thời gian của chính request. Bản sao chỉ được gửi khi
+        host dự phòng còn token sẵn. Không chờ quá deadline (time.monotonic).
+        """
+        urls = list(urls)
+        key = urlparse(urls[0]).netloc
+        window = self._latencies[key]
+        pool = self._hedge_pool()
+        limiter = self.limiter(key)
+        if limiter:
+            limiter.acquire(deadline)
+
+        def attempt(url):
+            return self._send('GET', url, timeout, deadline, 0, acquire=False, latency=window, **kwargs)
+
+        with self._lock:
+            self.hedge_stats['requests'] += 1
+        delay = self.hedge_delay(key)
+        futures = {pool.submit(attempt, urls[0]): 0}
+        pending = set(futures)
+        next_index = 1
+        hedge_at = time.monotonic() + delay
+        last_response = None
+        last_error = None
+
+        try:
+            while pending or next_index < len(urls):
+                wait_for = max(hedge_at - time.monotonic(), 0) if next_index < len(urls) else None
+                if deadline is not None:
+                    remaining = deadline - time.monotonic()
+                    if remaining <= 0:
+                        break
+                    wait_for = remaining if wait_for is None else min(wait_for, remaining)
+                done, pending = wait(pending, timeout=wait_for, return_when=FIRST_COMPLETED)
+                for future in done:
+                    try:
+                        response = future.result()
+                    except requests.exceptions.RequestException as e:
+                        last_error = e
+                        continue
+                    if response.status_code not in RETRY_STATUSES:
+                        if futures[future] > 0:
+                            with self._lock:
+                                self.hedge_stats['hedge_wins'] += 1
+                        return response
+                    if last_response is not None:
+                        last_response.close()
+                    last_response = response
+
+                if next_index < len(urls) and (not pending or time.monotonic() >= hedge_at):
+                    url = urls[next_index]
+                    next_index += 1
+                    backup = self.limiter(urlparse(url).netloc)
+                    if backup and not backup.try_acquire():
+                        # Host dự phòng hết token: không gửi thêm tải vào host đó
+                        with self._lock:
+                            self.hedge_stats['skipped'] += 1
+                        continue
+                    future = pool.submit(attempt, url)
+                    futures[future] = next_index - 1
+                    pending.add(future)
+                    hedge_at = time.monotonic() + delay
+                    with self._lock:
+                        self.hedge_stats['hedged'] += 1
+        finally:
+            for future in pending:
+                with self._lock:
+                    self.hedge_stats['cancelled'] += 1
+                if not future.cancel():
+                    future.add_done_callback(_close_response)
+
+        if last_response is not None:
+            return last_response
+        if last_error is not None:
+            raise last_error
+        raise DeadlineExceeded(f"Hết thời gian khi chờ response từ {key}")
+
+    def _backoff_delay(self, attempt, retry_after=None):
+        """Full-jitter exponential backoff; Retry-After (giây hoặc HTTP-date) được ưu tiên"""
+        seconds = parse_retry_after(retry_after)
+        if seconds is not None:
+            return min(seconds, self.backoff_max)
+
+        return random.uniform(0, min(self.backoff_max, self.backoff_base * (2 ** attempt)))
+
+    def _count(self, host, key):
+        with self._lock:
+            self._stats[host][key] += 1
+
+    def _record_response(self, host, response):
+        """Cộng số byte tải về (theo Content-Length nếu có) và status code"""
+        try:
+            size = int(response.headers.get('Content-Length'))
+        except (TypeError, ValueError):
+            size = len(response.content)
+        with self._lock:
+            self._stats[host]['bytes'] += size
+            self._statuses[response.status_code] += 1
+
+    def totals(self):
+        """Tổng requests, retries, errors, bytes và số response theo status của mọi host"""
+        with self._lock:
+            totals = {'requests': 0, 'retries': 0, 'errors': 0, 'bytes': 0}
+            for values in self._stats.values():
+                for key in totals:
+                    totals[key] += values.get(key, 0)
+            totals['statuses'] = dict(self._statuses)
+        return totals
+
+    def connection_stats(self):
+        """Thống kê theo host: requests, retries, errors, connection mới / dùng lại"""
+        stats = {host: dict(values) for host, values in self._stats.items()}
+
+        pools = self.adapter.poolmanager.pools
+        for key in list(pools.keys()):
+            pool = pools.get(key)
+            if pool is None:
+                continue
+            host = pool.host if pool.port in (None, 80, 443) else f"{pool.host}:{pool.port}"
+            entry = stats.setdefault(host, {'requests': 0, 'retries': 0, 'errors': 0, 'bytes': 0,
+                                            'throttled': 0, 'short_circuited': 0})
+            entry['new_connections'] = entry.get('new_connections', 0) + pool.num_connections
+            entry['reused_connections'] = entry.get('reused_connections', 0) + max(pool.num_requests - pool.num_connections, 0)
+
+        for host, entry in stats.items():
+            limiter = self._limiters.get(host)
+            if limiter:
+                entry['rate'] = round(limiter.rate, 3)
+            breaker = self._breakers.get(host)
+            if breaker:
+                entry['breaker'] = breaker.state
+
+        return stats
+
+    def print_stats(self):
+        """In thống kê connection theo host"""
+        stats = self.connection_stats()
+        if not stats:
+            return
+
+        print("\n🌐 Thống kê HTTP theo host:")
+        for host, entry in sorted(stats.items()):
+            print(f"   • {host}: {entry['requests']} requests, "
+                  f"{entry.get('new_connections', 0)} connection mới, "
+                  f"{entry.get('reused_connections', 0)} lần dùng lại, "
+                  f"{entry['retries']} retries, {entry['errors']} lỗi, {entry['bytes'] / 1024:.1f} KiB"
+                  + (f", {entry['throttled']} lần 429" if entry['throttled'] else '')
+                  + (f", rate {entry['rate']:g}/s" if 'rate' in entry else '')
+                  + (f", breaker {entry['breaker']} ({entry['short_circuited']} request bị chặn)"
+                     if entry.get('breaker', 'closed') != 'closed' or entry['short_circuited'] else ''))
+
+    def print_hedge_stats(self):
+        """In thống kê hedged request (nếu có)"""
+        stats = self.hedge_stats
+        if not stats['requests']:
+            return
+        print(f"🪁 Hedged request: {stats['requests']} request, {stats['hedged']} bản sao gửi tới host dự phòng, "
+              f"{stats['hedge_wins']} lần bản sao về trước, {stats['cancelled']} request bị hủy"
+              + (f", {stats['skipped']} bản sao bỏ qua vì host dự phòng hết token" if stats['skipped'] else ''))
+
+    def close(self):
+        if self._hedge_executor is not None:
+            self._hedge_executor.shutdown(wait=False)
+        self.session.close()
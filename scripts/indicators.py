@@ -0,0 +1,159 @@
+import os
+# numpy được import khi tính lần đầu (giữ thời gian khởi động của script nhanh)
+
+# Cửa sổ (số điểm) của các chỉ báo; dữ liệu chart mặc định là nến 1 phút
+SMA_WINDOWS = (20, 50)
+EMA_SPAN = 20
+VOLATILITY_WINDOW = 60
+RSI_PERIOD = 14
+HIGH_LOW_SECONDS = 24 * 3600
+
+
+def max_points():
+    """Số điểm cuối cùng của mỗi series được dùng (INDICATOR_POINTS, mặc định 1440 = 24h nến 1 phút)"""
+    return int(os.getenv('INDICATOR_POINTS', '1440'))
+
+
+def series_from_chart(result):
+    """Lấy timestamp/close/high/low từ một phần tử chart.result của Yahoo
+
+    Trả về dict các list (giá trị thiếu là None) hoặc None nếu chart không
+    có series.
+    """
+    timestamps = result.get('timestamp') or []
+    quotes = (result.get('indicators') or {}).get('quote') or [{}]
+    quote = quotes[0] or {}
+    closes = quote.get('close') or []
+    if not timestamps or len(closes) != len(timestamps):
+        return None
+    return {
+        'timestamp': timestamps,
+        'close': closes,
+        'high': quote.get('high') or closes,
+        'low': quote.get('low') or closes
+    }
+
+
+def to_matrix(series_list, field, length):
+    """Xếp series của mọi symbol thành mảng (symbols × length), căn phải, thiếu là NaN"""
+    import numpy as np
+
+    matrix = np.full((len(series_list), length), np.nan)
+    for row, series in enumerate(series_list):
+        values = (series.get(field) or [])[-length:]
+        if values:
+            # None -> NaN khi ép kiểu float
+            matrix[row, length - len(values):] = np.array(values, dtype=float)
+    return matrix
+
+
+def fill_gaps(matrix):
+    """Forward-fill NaN bên trong series, phần đệm bên trái lấy giá trị hợp lệ đầu tiên
+
+    Trả về (mảng đã fill, số điểm thực của mỗi symbol tính từ điểm hợp lệ
+    đầu tiên). Phần đệm là hằng số nên không ảnh hưởng tới EMA / drawdown.
+    """
+    import numpy as np
+
+    rows, length = matrix.shape
+    valid = ~np.isnan(matrix)
+    index = np.where(valid, np.arange(length), 0)
+    np.maximum.accumulate(index, axis=1, out=index)
+    filled = matrix[np.arange(rows)[:, None], index]
+
+    first = valid.argmax(axis=1)
+    filled = np.where(np.isnan(filled), matrix[np.arange(rows), first][:, None], filled)
+    lengths = np.where(valid.any(axis=1), length - first, 0)
+    return filled, lengths
+
+
+def ewm_last(values, mask, alpha):
+    """Giá trị cuối của EWMA (adjust=True) theo từng hàng, chỉ tính các điểm trong mask"""
+    import numpy as np
+
+    weights = (1 - alpha) ** np.arange(values.shape[1] - 1, -1, -1)
+    numerator = np.where(mask, values, 0.0) @ weights
+    denominator = mask.astype(float) @ weights
+    with np.errstate(invalid='ignore', divide='ignore'):
+        return numerator / denominator
+
+
+def compute_matrix(close, high, low, timestamps):
+    """Tính mọi chỉ báo trên mảng 2-D (symbols × time), không lặp theo symbol
+
+    Trả về dict {tên chỉ báo: mảng 1-D theo symbol} (NaN nếu không đủ điểm).
+    """
+    import numpy as np
+
+    close, lengths = fill_gaps(close)
+    rows, length = close.shape
+    columns = np.arange(length)
+    results = {'points': lengths.astype(float)}
+
+    for window in SMA_WINDOWS:
+        sma = close[:, -window:].mean(axis=1) if window <= length else np.full(rows, np.nan)
+        results[f'sma_{window}'] = np.where(lengths >= window, sma, np.nan)
+
+    in_series = columns[None, :] >= (length - lengths)[:, None]
+    results[f'ema_{EMA_SPAN}'] = np.where(lengths > 0, ewm_last(close, in_series, 2 / (EMA_SPAN + 1)), np.nan)
+
+    with np.errstate(invalid='ignore', divide='ignore'):
+        # Độ biến động: độ lệch chuẩn của log return trên mỗi nến (%)
+        window = VOLATILITY_WINDOW
+        if window < length:
+            volatility = np.diff(np.log(close[:, -(window + 1):]), axis=1).std(axis=1, ddof=1) * 100
+        else:
+            volatility = np.full(rows, np.nan)
+        results[f'volatility_{window}'] = np.where(lengths > window, volatility, np.nan)
+
+        # RSI (Wilder): EWMA alpha = 1/period của phần tăng / giảm
+        delta = np.diff(close, axis=1)
+        in_returns = columns[None, 1:] >= (length - lengths + 1)[:, None]
+        alpha = 1 / RSI_PERIOD
+        average_gain = ewm_last(np.clip(delta, 0, None), in_returns, alpha)
+        average_loss = ewm_last(np.clip(-delta, 0, None), in_returns, alpha)
+        rsi = np.where(average_loss > 0, 100 - 100 / (1 + average_gain / average_loss),
+                       np.where(average_gain > 0, 100.0, 50.0))
+        results[f'rsi_{RSI_PERIOD}'] = np.where(lengths > RSI_PERIOD, rsi, np.nan)
+
+        # Max drawdown (%) so với đỉnh trước đó trong series
+        running_max = np.maximum.accumulate(close, axis=1)
+        results['max_drawdown_percent'] = (close / running_max - 1).min(axis=1) * 100
+
+    # Cao / thấp nhất trong 24h tính từ điểm cuối của từng symbol
+    last_timestamp = np.fmax.reduce(timestamps, axis=1)
+    in_window = timestamps >= (last_timestamp - HIGH_LOW_SECONDS)[:, None]
+    high_24h = np.where(in_window & ~np.isnan(high), high, -np.inf).max(axis=1)
+    low_24h = np.where(in_window & ~np.isnan(low), low, np.inf).min(axis=1)
+    results['high_24h'] = np.where(np.isfinite(high_24h), high_24h, np.nan)
+    results['low_24h'] = np.where(np.isfinite(low_24h), low_24h, np.nan)
+
+    return results
+
+
+def compute_indicators(series_list, points=None):
+    """Chỉ báo kỹ thuật cho danh sách series (xem series_from_chart)
+
+    Trả về list dict theo cùng thứ tự, giá trị không tính được là None.
+    """
+    if not series_list:
+        return []
+
+    length = min(points or max_points(), max(len(series['close']) for series in series_list))
+    results = compute_matrix(
+        to_matrix(series_list, 'close', length),
+        to_matrix(series_list, 'high', length),
+        to_matrix(series_list, 'low', length),
+        to_matrix(series_list, 'timestamp', length)
+    )
+
+    columns = {name: values.tolist() for name, values in results.items()}
+    indicators = []
+    for row in range(len(series_list)):
+        entry = {}
+        for name, values in columns.items():
+            value = values[row]
+            entry[name] = None if value != value else round(value, 6)
+        entry['points'] = int(entry['points'] or 0)
+        indicators.append(entry)
+    return indicators
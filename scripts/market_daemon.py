@@ -0,0 +1,262 @@
+import argparse
+import json
+import os
+import signal
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+from datetime import datetime, timedelta
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from urllib.parse import urlparse
+
+import pytz
+
+from crypto_tracker import CryptoTracker
+from producthunt_scraper import ProductHuntScraper
+
+NEW_YORK_TZ = pytz.timezone('America/New_York')
+
+
+def us_market_open(now=None):
+    """Sàn chứng khoán Mỹ đang mở cửa (thứ 2 - thứ 6, 9:30 - 16:00 giờ New York)"""
+    now = (now or datetime.now(pytz.utc)).astimezone(NEW_YORK_TZ)
+    if now.weekday() >= 5:
+        return False
+    minutes = now.hour * 60 + now.minute
+    return 9 * 60 + 30 <= minutes <= 16 * 60
+
+
+class Job:
+    """Một nguồn dữ liệu với lịch chạy riêng
+
+    interval: chạy lại sau mỗi interval giây
+    daily_at: 'HH:MM' (UTC) - chạy mỗi ngày một lần vào giờ này (thay cho interval)
+    condition: hàm trả về False thì bỏ qua lượt chạy định kỳ (vd: ngoài giờ giao dịch)
+    """
+
+    def __init__(self, name, func, interval=None, daily_at=None, condition=None):
+        self.name = name
+        self.func = func
+        self.interval = interval
+        self.daily_at = daily_at
+        self.condition = condition
+        self.next_run = time.time()
+        self.running = False
+        self.last_run = None
+        self.last_duration = None
+        self.last_result = None
+        self.last_error = None
+        self.run_count = 0
+        # Được yêu cầu chạy ngay qua endpoint (bỏ qua condition)
+        self.forced = False
+
+    def schedule_next(self, now=None):
+        now = now or time.time()
+        if self.daily_at:
+            hour, minute = (int(part) for part in self.daily_at.split(':'))
+            current = datetime.fromtimestamp(now, pytz.utc)
+            target = current.replace(hour=hour, minute=minute, second=0, microsecond=0)
+            if target.timestamp() <= now:
+                target += timedelta(days=1)
+            self.next_run = target.timestamp()
+        else:
+            self.next_run = now + self.interval
+
+    def status(self):
+        return {
+            'running': self.running,
+            'next_run': datetime.fromtimestamp(self.next_run, pytz.utc).isoformat(),
+            'last_run': datetime.fromtimestamp(self.last_run, pytz.utc).isoformat() if self.last_run else None,
+            'last_duration': self.last_duration,
+            'last_result': self.last_result,
+            'last_error': self.last_error,
+            'run_count': self.run_count
+        }
+
+
+class MarketDaemon:
+    """Tiến trình thường trú: giữ Firebase client và HTTP pool luôn sẵn sàng
+
+    Mỗi nguồn dữ liệu có lịch chạy riêng; có thể yêu cầu làm mới ngay qua
+    HTTP endpoint cục bộ (POST /refresh/<job>, GET /status).
+    """
+
+    def __init__(self, job_names=None, host='127.0.0.1', port=None, run_on_start=True):
+        self.tracker = CryptoTracker()
+        self.scraper = None
+        self.host = host
+        self.port = port if port is not None else int(os.getenv('DAEMON_PORT', '8765'))
+        self.stop_event = threading.Event()
+        self.wakeup = threading.Event()
+        self.lock = threading.Lock()
+        # Các job của CryptoTracker dùng chung state nên chạy lần lượt
+        self.tracker_lock = threading.Lock()
+        self.executor = None
+        self.server = None
+
+        jobs = [
+            Job('fx', lambda: self.refresh_tracker('fx'),
+                interval=int(os.getenv('DAEMON_FX_INTERVAL', '3600'))),
+            Job('crypto', lambda: self.refresh_tracker('crypto'),
+                interval=int(os.getenv('DAEMON_CRYPTO_INTERVAL', '300'))),
+            Job('indices', lambda: self.refresh_tracker('indices'),
+                interval=int(os.getenv('DAEMON_INDICES_INTERVAL', '300')), condition=us_market_open),
+            Job('commodities', lambda: self.refresh_tracker('commodities'),
+                interval=int(os.getenv('DAEMON_COMMODITIES_INTERVAL', '600'))),
+            Job('producthunt', self.run_producthunt,
+                daily_at=os.getenv('DAEMON_PRODUCTHUNT_AT', '22:00'))
+        ]
+        if job_names:
+            jobs = [job for job in jobs if job.name in job_names]
+        self.jobs = {job.name: job for job in jobs}
+
+        for job in self.jobs.values():
+            if job.daily_at or not run_on_start:
+                job.schedule_next()
+
+    def refresh_tracker(self, asset_class):
+        with self.tracker_lock:
+            if asset_class == 'crypto':
+                return self.tracker.refresh('crypto', int(os.getenv('DAEMON_CRYPTO_TOP', self.tracker.top_limit)))
+            return self.tracker.refresh(asset_class)
+
+    def run_producthunt(self):
+        if self.scraper is None:
+            self.scraper = ProductHuntScraper()
+        self.scraper.run(save_to_db=True, save_to_file=False)
+        return True
+
+    def request_refresh(self, name):
+        """Đưa job lên chạy ngay (bỏ qua condition)"""
+        job = self.jobs.get(name)
+        if job is None:
+            return False
+        with self.lock:
+            job.next_run = 0
+            job.forced = True
+        self.wakeup.set()
+        return True
+
+    def _run_job(self, job):
+        start = time.time()
+        print(f"\n⏰ [{datetime.now().strftime('%Y-%m-%d %H:%M:%S')}] Chạy job '{job.name}'")
+        try:
+            job.last_result = bool(job.func())
+            job.last_error = None
+        except Exception as e:
+            job.last_result = False
+            job.last_error = str(e)
+            print(f"❌ Job '{job.name}' lỗi: {e}")
+        finally:
+            job.last_run = start
+            job.last_duration = round(time.time() - start, 3)
+            job.run_count += 1
+            with self.lock:
+                job.running = False
+            print(f"✅ Job '{job.name}' xong trong {job.last_duration:.2f}s")
+
+    def _dispatch_due_jobs(self):
+        now = time.time()
+        with self.lock:
+            due = [job for job in self.jobs.values() if not job.running and job.next_run <= now]
+            for job in due:
+                forced = job.forced
+                job.forced = False
+                job.schedule_next(now)
+                if job.condition and not forced and not job.condition():
+                    continue
+                job.running = True
+                self.executor.submit(self._run_job, job)
+
+    def _seconds_until_next(self):
+        with self.lock:
+            pending = [job.next_run for job in self.jobs.values() if not job.running]
+        if not pending:
+            return 1.0
+        return max(0.0, min(pending) - time.time())
+
+    def start_server(self):
+        daemon = self
+
+        class Handler(BaseHTTPRequestHandler):
+            def log_message(self, *args):
+                pass
+
+            def _reply(self, status, body):
+                payload = json.dumps(body, ensure_ascii=False).encode('utf-8')
+                self.send_response(status)
+                self.send_header('Content-Type', 'application/json; charset=utf-8')
+                self.send_header('Content-Length', str(len(payload)))
+                self.end_headers()
+                self.wfile.write(payload)
+
+            def do_GET(self):
+                if urlparse(self.path).path == '/status':
+                    self._reply(200, {name: job.status() for name, job in daemon.jobs.items()})
+                else:
+                    self._reply(404, {'error': 'not found'})
+
+            def do_POST(self):
+                parts = urlparse(self.path).path.strip('/').split('/')
+                if len(parts) == 2 and parts[0] == 'refresh':
+                    if daemon.request_refresh(parts[1]):
+                        self._reply(202, {'queued': parts[1]})
+                    else:
+                        self._reply(404, {'error': f"không có job '{parts[1]}'"})
+                else:
+                    self._reply(404, {'error': 'not found'})
+
+        self.server = ThreadingHTTPServer((self.host, self.port), Handler)
+        threading.Thread(target=self.server.serve_forever, daemon=True).start()
+        print(f"🛰️ Endpoint làm mới: http://{self.host}:{self.server.server_port} (POST /refresh/<job>, GET /status)")
+
+    def stop(self, *args):
+        if not self.stop_event.is_set():
+            print("\n🛑 Đang dừng daemon...")
+        self.stop_event.set()
+        self.wakeup.set()
+
+    def run(self):
+        """Vòng lặp chính: chạy job đến hạn cho đến khi nhận tín hiệu dừng"""
+        signal.signal(signal.SIGINT, self.stop)
+        signal.signal(signal.SIGTERM, self.stop)
+
+        self.executor = ThreadPoolExecutor(max_workers=max(1, len(self.jobs)))
+        if self.port:
+            self.start_server()
+        print(f"🚀 Daemon đang chạy với các job: {', '.join(self.jobs)}")
+
+        try:
+            while not self.stop_event.is_set():
+                self._dispatch_due_jobs()
+                self.wakeup.wait(timeout=min(self._seconds_until_next(), 60))
+                self.wakeup.clear()
+        finally:
+            self.shutdown()
+
+    def shutdown(self):
+        """Dừng nhận request, chờ job đang chạy xong và flush các thao tác ghi"""
+        if self.server:
+            self.server.shutdown()
+        if self.executor:
+            self.executor.shutdown(wait=True)
+        self.tracker.close()
+        if self.scraper is not None:
+            self.scraper.close()
+        print("👋 Daemon đã dừng")
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Daemon theo dõi thị trường và Product Hunt")
+    parser.add_argument('--jobs', help="Danh sách job, phân tách bằng dấu phẩy (mặc định: tất cả)")
+    parser.add_argument('--host', default='127.0.0.1', help="Địa chỉ bind của endpoint làm mới")
+    parser.add_argument('--port', type=int, default=None, help="Cổng endpoint làm mới (0 để tắt)")
+    parser.add_argument('--no-run-on-start', action='store_true', help="Không chạy ngay khi khởi động")
+    args = parser.parse_args()
+
+    MarketDaemon(
+        job_names=args.jobs.split(',') if args.jobs else None,
+        host=args.host,
+        port=args.port,
+        run_on_start=not args.no_run_on_start
+    ).run()
@@ -0,0 +1,227 @@
+import os
+import re
+import shutil
+import time
+from datetime import datetime, timezone
+
+import numpy as np
+
+# Mỗi cột là một file nhị phân riêng (append-only), đọc bằng memory-map
+COLUMNS = (
+    ('timestamp', np.int64),
+    ('price', np.float64),
+    ('previous_close', np.float64),
+    ('volume', np.float64)
+)
+
+# Độ phân giải (giây) và độ phân giải kế tiếp khi compaction
+RESOLUTIONS = {'1m': 60, '1h': 3600, '1d': 86400}
+NEXT_RESOLUTION = {'1m': '1h', '1h': '1d'}
+
+
+def safe_symbol(symbol):
+    """Tên symbol dùng được làm tên thư mục / document id"""
+    return re.sub(r'[^A-Za-z0-9._-]', '_', symbol)
+
+
+def day_of(timestamp):
+    return datetime.fromtimestamp(int(timestamp), timezone.utc).strftime('%Y-%m-%d')
+
+
+class PriceHistoryStore:
+    """Lưu lịch sử giá append-only theo cột NumPy, phân vùng theo ngày
+
+    Layout: {root}/{resolution}/{symbol}/{YYYY-MM-DD}/{column}.bin
+    Dữ liệu 1m cũ được compaction xuống 1h, dữ liệu 1h cũ xuống 1d.
+    """
+
+    def __init__(self, root=None, retention_days=None):
+        self.root = root or os.getenv('PRICE_HISTORY_DIR', os.path.join('.cache', 'history'))
+        # Số ngày giữ ở từng độ phân giải trước khi compaction
+        self.retention_days = {'1m': 2, '1h': 60}
+        if retention_days:
+            self.retention_days.update(retention_days)
+
+    def _partition_dir(self, symbol, day, resolution):
+        return os.path.join(self.root, resolution, safe_symbol(symbol), day)
+
+    def _read_partition(self, path):
+        """Đọc một partition bằng np.memmap, trả về dict {column: array}"""
+        columns = {}
+        for name, dtype in COLUMNS:
+            file_path = os.path.join(path, f"{name}.bin")
+            if not os.path.exists(file_path) or os.path.getsize(file_path) == 0:
+                return {name: np.empty(0, dtype=dtype) for name, dtype in COLUMNS}
+            columns[name] = np.memmap(file_path, dtype=dtype, mode='r')
+        # Cắt theo cột ngắn nhất phòng trường hợp ghi dở
+        length = min(len(values) for values in columns.values())
+        return {name: values[:length] for name, values in columns.items()}
+
+    def _last_timestamp(self, path):
+        file_path = os.path.join(path, 'timestamp.bin')
+        size = os.path.getsize(file_path) if os.path.exists(file_path) else 0
+        if size < 8:
+            return None
+        with open(file_path, 'rb') as f:
+            f.seek(size - 8)
+            return int(np.frombuffer(f.read(8), dtype=np.int64)[0])
+
+    def _append_rows(self, symbol, day, resolution, rows):
+        """Ghi thêm rows {column: array} vào cuối partition"""
+        path = self._partition_dir(symbol, day, resolution)
+        os.makedirs(path, exist_ok=True)
+        for name, dtype in COLUMNS:
+            with open(os.path.join(path, f"{name}.bin"), 'ab') as f:
+                f.write(np.asarray(rows[name], dtype=dtype).tobytes())
+
+    def append(self, symbol, timestamp, price, previous_close=None, volume=None, resolution='1m'):
+        """Ghi một điểm giá; bỏ qua nếu không mới hơn điểm cuối của partition"""
+        timestamp = int(timestamp)
+        day = day_of(timestamp)
+        last = self._last_timestamp(self._partition_dir(symbol, day, resolution))
+        if last is not None and timestamp <= last:
+            return False
+
+        self._append_rows(symbol, day, resolution, {
+            'timestamp': [timestamp],
+            'price': [price if price is not None else np.nan],
+            'previous_close': [previous_close if previous_close is not None else np.nan],
+            'volume': [volume if volume is not None else np.nan]
+        })
+        return True
+
+    def append_quotes(self, quotes, volumes=None):
+        """Ghi quote {symbol: data} theo định dạng của CryptoTracker; trả về các symbol có điểm mới"""
+        volumes = volumes or {}
+        appended = []
+        for symbol, data in quotes.items():
+            if not data or data.get('current_price') is None:
+                continue
+            if self.append(
+                symbol,
+                data.get('market_time') or time.time(),
+                data['current_price'],
+                data.get('previous_close'),
+                volumes.get(symbol, data.get('volume'))
+            ):
+                appended.append(symbol)
+        return appended
+
+    def symbols(self, resolution='1m'):
+        path = os.path.join(self.root, resolution)
+        return sorted(os.listdir(path)) if os.path.isdir(path) else []
+
+    def query(self, symbol, start=None, end=None, resolution='1m'):
+        """Trả về dict {column: np.ndarray} trong khoảng [start, end] (epoch giây)"""
+        base = os.path.join(self.root, resolution, safe_symbol(symbol))
+        days = sorted(os.listdir(base)) if os.path.isdir(base) else []
+        if start is not None:
+            days = [day for day in days if day >= day_of(start)]
+        if end is not None:
+            days = [day for day in days if day <= day_of(end)]
+
+        parts = [self._read_partition(os.path.join(base, day)) for day in days]
+        result = {
+            name: np.concatenate([part[name] for part in parts]) if parts else np.empty(0, dtype=dtype)
+            for name, dtype in COLUMNS
+        }
+
+        mask = np.ones(len(result['timestamp']), dtype=bool)
+        if start is not None:
+            mask &= result['timestamp'] >= int(start)
+        if end is not None:
+            mask &= result['timestamp'] <= int(end)
+        return {name: values[mask] for name, values in result.items()}
+
+    @staticmethod
+    def downsample(columns, step):
+        """Gộp theo bucket step giây, giữ điểm cuối cùng của mỗi bucket"""
+        timestamps = columns['timestamp']
+        if len(timestamps) == 0:
+            return {name: np.asarray(values) for name, values in columns.items()}
+
+        order = np.argsort(timestamps, kind='stable')
+        sorted_columns = {name: np.asarray(values)[order] for name, values in columns.items()}
+        buckets = sorted_columns['timestamp'] // step * step
+        # Chỉ số điểm cuối của mỗi bucket
+        last_index = np.flatnonzero(np.r_[buckets[1:] != buckets[:-1], True])
+
+        result = {name: values[last_index] for name, values in sorted_columns.items()}
+        result['timestamp'] = buckets[last_index]
+        return result
+
+    def compact(self, now=None, symbols=None):
+        """Downsample partition cũ: 1m -> 1h -> 1d, rồi xóa partition gốc
+
+        symbols: chỉ compaction các symbol này (vd: symbol vừa ghi thêm),
+        mặc định duyệt mọi symbol.
+        """
+        now = now or time.time()
+        compacted = 0
+        wanted = {safe_symbol(symbol) for symbol in symbols} if symbols is not None else None
+
+        for resolution, target in NEXT_RESOLUTION.items():
+            cutoff = day_of(now - self.retention_days[resolution] * 86400)
+            step = RESOLUTIONS[target]
+
+            for symbol_dir in self.symbols(resolution):
+                if wanted is not None and symbol_dir not in wanted:
+                    continue
+                base = os.path.join(self.root, resolution, symbol_dir)
+                for day in sorted(os.listdir(base)):
+                    if day >= cutoff:
+                        continue
+                    path = os.path.join(base, day)
+                    rows = self.downsample(self._read_partition(path), step)
+
+                    if len(rows['timestamp']):
+                        # Gộp với dữ liệu đã có ở độ phân giải đích (nếu có)
+                        target_day = day_of(rows['timestamp'][0])
+                        target_path = os.path.join(self.root, target, symbol_dir, target_day)
+                        existing = self._read_partition(target_path)
+                        merged = self.downsample({
+                            name: np.concatenate([existing[name], rows[name]]) for name, _ in COLUMNS
+                        }, step)
+                        shutil.rmtree(target_path, ignore_errors=True)
+                        self._append_rows(symbol_dir, target_day, target, merged)
+
+                    shutil.rmtree(path, ignore_errors=True)
+                    compacted += 1
+
+        return compacted
+
+    def series(self, symbol, resolution='1h', start=None, end=None):
+        """Chuỗi giá ở độ phân giải resolution, gộp cả dữ liệu mịn hơn chưa compaction"""
+        step = RESOLUTIONS[resolution]
+        sources = [name for name, seconds in RESOLUTIONS.items() if seconds <= step]
+        parts = [self.query(symbol, start, end, source) for source in sources]
+        return self.downsample({
+            name: np.concatenate([part[name] for part in parts]) for name, _ in COLUMNS
+        }, step)
+
+    def series_document(self, symbol, resolution='1h', start=None, end=None):
+        """Một document gọn cho cả chuỗi: các mảng song song t/p/pc/v"""
+        columns = self.series(symbol, resolution, start, end)
+
+        def to_list(values):
+            return [None if np.isnan(value) else float(value) for value in values]
+
+        return {
+            'symbol': symbol,
+            'resolution': resolution,
+            'points': int(len(columns['timestamp'])),
+            't': [int(value) for value in columns['timestamp']],
+            'p': to_list(columns['price']),
+            'pc': to_list(columns['previous_close']),
+            'v': to_list(columns['volume'])
+        }
+
+    def series_documents(self, symbols, resolution='1h', days=30):
+        """{document id: document chuỗi đã downsample} của days ngày gần nhất, bỏ symbol không có dữ liệu"""
+        start = time.time() - days * 86400
+        documents = {}
+        for symbol in symbols:
+            document = self.series_document(symbol, resolution, start=start)
+            if document['points']:
+                documents[safe_symbol(symbol)] = document
+        return documents
@@ -0,0 +1,232 @@
+import argparse
+import json
+import os
+import threading
+import time
+from concurrent.futures import FIRST_COMPLETED, ThreadPoolExecutor, wait
+from datetime import datetime, timedelta, timezone
+from itertools import islice
+from urllib.parse import urlparse
+
+import requests
+
+from producthunt_scraper import ProductHuntScraper
+from run_context import RunContext
+
+# Collection lưu leaderboard lịch sử: mỗi ngày một document
+HISTORY_COLLECTION = 'producthunt_history'
+
+
+def parse_day(value):
+    """'YYYY-MM-DD' hoặc 'YYYY/M/D' -> date"""
+    return datetime.strptime(value.replace('/', '-'), '%Y-%m-%d').date()
+
+
+def date_range(start, end):
+    """Các ngày từ start đến end (bao gồm cả hai đầu)"""
+    day = start
+    while day <= end:
+        yield day
+        day += timedelta(days=1)
+
+
+def leaderboard_date(day):
+    """date -> 'YYYY/M/D' (định dạng URL leaderboard, không có số 0 đầu)"""
+    return f"{day.year}/{day.month}/{day.day}"
+
+
+class BackfillState:
+    """Checkpoint các ngày đã backfill xong vào file JSON để chạy tiếp khi bị gián đoạn"""
+
+    def __init__(self, path):
+        self.path = path
+        self._lock = threading.Lock()
+        self.done = set()
+        if os.path.exists(path):
+            try:
+                with open(path, encoding='utf-8') as f:
+                    self.done = set(json.load(f).get('done', []))
+            except (OSError, ValueError) as e:
+                print(f"⚠️ Không đọc được file checkpoint {path}: {str(e)}")
+
+    def is_done(self, day):
+        return day.isoformat() in self.done
+
+    def mark_done(self, day):
+        """Ghi checkpoint ngay (ghi file tạm rồi rename để không hỏng khi bị kill)"""
+        with self._lock:
+            self.done.add(day.isoformat())
+            directory = os.path.dirname(self.path)
+            if directory:
+                os.makedirs(directory, exist_ok=True)
+            tmp_path = f"{self.path}.tmp"
+            with open(tmp_path, 'w', encoding='utf-8') as f:
+                json.dump({'done': sorted(self.done), 'updated_at': datetime.now().isoformat()}, f, indent=2)
+            os.replace(tmp_path, self.path)
+
+
+class ProductHuntBackfill:
+    """Backfill leaderboard Product Hunt theo khoảng ngày
+
+    - Tải các trang /leaderboard/daily/Y/M/D song song, giới hạn request/giây
+    - Parse và đẩy sản phẩm của từng ngày vào sink ngay khi ngày đó xong
+    - Checkpoint ngày đã xong để lần chạy sau bỏ qua
+    """
+
+    def __init__(self, scraper=None, state_path=None, workers=None, rate=None,
+                 save_to_db=True, output_dir=None, context=None):
+        self.scraper = scraper or ProductHuntScraper(use_db=save_to_db)
+        # Context gốc của lần backfill; mỗi ngày dùng context con cùng run_id
+        self.context = context or RunContext()
+        self.state = BackfillState(
+            state_path or os.getenv('PH_BACKFILL_STATE', os.path.join('.cache', 'producthunt_backfill.json'))
+        )
+        self.workers = workers or int(os.getenv('PH_BACKFILL_WORKERS', '4'))
+        # Giới hạn request/giây dùng chung cho mọi worker: token bucket của HttpClient cho host Product Hunt
+        self.rate = rate if rate is not None else float(os.getenv('PH_BACKFILL_RATE', '1'))
+        self.scraper.http.set_rate_limit(urlparse(self.scraper.base_url).netloc, self.rate, burst=1)
+        self.save_to_db = save_to_db
+        self.output_dir = output_dir
+
+    def fetch_day(self, day):
+        """Chỉ tải HTML (chạy trong worker), parse ở thread chính"""
+        url = self.scraper.build_url(leaderboard_date(day))
+        response = self.scraper.http.get(url)
+        response.raise_for_status()
+        return response.content
+
+    def save_day(self, day, products):
+        """Sink: ghi sản phẩm của một ngày (Firestore và/hoặc file JSON)"""
+        date_str = leaderboard_date(day)
+        saved = True
+        if self.save_to_db and self.scraper.storage:
+            self.scraper.storage.write(HISTORY_COLLECTION, day.isoformat(), {
+                'date': date_str,
+                'total_products': len(products),
+                'products': [
+                    {key: value for key, value in self.scraper.build_document(product).items() if key != 'createdAt'}
+                    for product in products
+                ],
+                'createdAt': datetime.now(timezone.utc)
+            })
+            # Chỉ checkpoint khi dữ liệu đã thực sự được ghi (kể cả khi bật write-behind)
+            saved = self.scraper.storage.flush()
+        elif self.save_to_db:
+            saved = False
+
+        if self.output_dir:
+            os.makedirs(self.output_dir, exist_ok=True)
+            filename = os.path.join(self.output_dir, f"producthunt_{date_str.replace('/', '-')}.json")
+            saved = self.scraper.save_to_json(products, filename) and saved
+        return saved
+
+    def process_day(self, day, future):
+        """Parse và lưu một ngày đã tải (thread chính); trả về số sản phẩm, None nếu lỗi"""
+        try:
+            self.scraper.context = self.context.for_date(day)
+            products = self.scraper.parse_products(future.result())
+        except requests.RequestException as e:
+            print(f"❌ {day}: lỗi khi tải trang: {str(e)}")
+            return None
+        except Exception as e:
+            print(f"❌ {day}: lỗi không xác định: {str(e)}")
+            return None
+
+        if not products:
+            print(f"⚠️ {day}: không có sản phẩm nào")
+            return None
+
+        try:
+            saved = self.save_day(day, products)
+        except Exception as e:
+            print(f"❌ {day}: lỗi khi lưu dữ liệu: {str(e)}")
+            saved = False
+        if not saved:
+            print(f"❌ {day}: lưu dữ liệu thất bại, sẽ thử lại ở lần chạy sau")
+            return None
+
+        self.state.mark_done(day)
+        return len(products)
+
+    def run(self, start, end):
+        """Backfill [start, end]; trả về dict thống kê
+
+        Chỉ giữ tối đa workers * 2 ngày đang tải hoặc chờ parse: ngày mới
+        được gửi đi khi một ngày xong, HTML của ngày đã xử lý được bỏ ngay
+        nên bộ nhớ không tăng theo độ dài khoảng ngày.
+        """
+        days = [day for day in date_range(start, end) if not self.state.is_done(day)]
+        skipped = (end - start).days + 1 - len(days)
+        print(f"🚀 BACKFILL PRODUCT HUNT {start} → {end}")
+        print(f"📅 {len(days)} ngày cần lấy, {skipped} ngày đã xong (checkpoint)")
+        print(f"⚙️ {self.workers} worker, tối đa {self.rate or '∞'} request/giây")
+
+        started = time.time()
+        completed, failed, total_products = 0, [], 0
+        remaining = iter(days)
+
+        with ThreadPoolExecutor(max_workers=self.workers) as executor:
+            futures = {executor.submit(self.fetch_day, day): day for day in islice(remaining, self.workers * 2)}
+            while futures:
+                done, _ = wait(futures, return_when=FIRST_COMPLETED)
+                for future in done:
+                    day = futures.pop(future)
+                    count = self.process_day(day, future)
+                    for next_day in islice(remaining, 1):
+                        futures[executor.submit(self.fetch_day, next_day)] = next_day
+
+                    if count is None:
+                        failed.append(day)
+                        continue
+                    completed += 1
+                    total_products += count
+                    elapsed = time.time() - started
+                    print(f"✅ {day}: {count} sản phẩm ({self.scraper.extraction_path}) - "
+                          f"{completed}/{len(days)} ngày, {completed / elapsed * 60:.1f} ngày/phút")
+
+        elapsed = time.time() - started
+        stats = {
+            'days': len(days),
+            'completed': completed,
+            'failed': [day.isoformat() for day in sorted(failed)],
+            'skipped': skipped,
+            'products': total_products,
+            'seconds': round(elapsed, 2),
+            'days_per_minute': round(completed / elapsed * 60, 1) if elapsed > 0 else None
+        }
+        print(f"\n🏁 Xong {completed}/{len(days)} ngày, {total_products} sản phẩm trong {elapsed:.1f}s "
+              f"({stats['days_per_minute']} ngày/phút)")
+        if failed:
+            print(f"⚠️ {len(failed)} ngày lỗi, chạy lại lệnh để thử lại: {', '.join(stats['failed'])}")
+        if self.scraper._storage:
+            print(f"💽 Storage: {self.scraper._storage.summary()}")
+        self.scraper.http.print_stats()
+        return stats
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Backfill leaderboard Product Hunt theo khoảng ngày")
+    parser.add_argument('start', help="Ngày bắt đầu (YYYY-MM-DD)")
+    parser.add_argument('end', nargs='?', help="Ngày kết thúc (YYYY-MM-DD, mặc định: bằng ngày bắt đầu)")
+    parser.add_argument('--workers', type=int, default=None, help="Số request song song")
+    parser.add_argument('--rate', type=float, default=None, help="Số request tối đa mỗi giây (0 = không giới hạn)")
+    parser.add_argument('--state', default=None, help="File checkpoint")
+    parser.add_argument('--output-dir', default=None, help="Thư mục ghi file JSON cho từng ngày")
+    parser.add_argument('--no-db', action='store_true', help="Không ghi Firestore")
+    args = parser.parse_args()
+
+    start_day = parse_day(args.start)
+    end_day = parse_day(args.end) if args.end else start_day
+    if end_day < start_day:
+        parser.error("Ngày kết thúc phải sau ngày bắt đầu")
+    if args.no_db and not args.output_dir:
+        parser.error("--no-db cần --output-dir để có nơi lưu dữ liệu")
+
+    result = ProductHuntBackfill(
+        state_path=args.state,
+        workers=args.workers,
+        rate=args.rate,
+        save_to_db=not args.no_db,
+        output_dir=args.output_dir
+    ).run(start_day, end_day)
+    raise SystemExit(1 if result['failed'] else 0)
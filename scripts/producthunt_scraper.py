@@ -1,19 +1,43 @@
+import contextlib
 import requests
-from bs4 import BeautifulSoup
 import json
-from datetime import datetime, timedelta
+from datetime import datetime
 import time
 import re
-import pytz
-import firebase_admin
-from firebase_admin import credentials, firestore
-from firebase_admin.firestore import SERVER_TIMESTAMP
 from dotenv import load_dotenv
 import os
+from http_client import HttpClient
+from storage import configured_backends, open_storage
+from run_context import RunContext
+from run_metrics import Phase, RunMetrics
+# bs4, pytz và firebase_admin được import khi cần để khởi động nhanh
+
+# Matcher biên dịch sẵn cho parser
+POST_ITEM_RE = re.compile(r'post-item-\d+')
+POST_NAME_RE = re.compile(r'post-name-\d+')
+FALLBACK_SECTION_RE = re.compile(r'.*group.*relative.*flex.*')
+
+# State JSON nhúng trong trang (Next.js / Apollo)
+NEXT_DATA_RE = re.compile(r'<script[^>]*\bid=["\']__NEXT_DATA__["\'][^>]*>(.*?)</script>', re.S)
+APOLLO_STATE_RE = re.compile(r'window\.__APOLLO_STATE__\s*=\s*(\{.*?\})\s*;?\s*</script>', re.S)
+
+# Số sản phẩm đầu bảng đọc từ DOM (đường state JSON lấy toàn bộ leaderboard)
+MAX_PRODUCTS = 20
+
+def default_parser_backend():
+    """lxml nếu đã cài (nhanh hơn), ngược lại dùng html.parser có sẵn"""
+    backend = os.getenv('PH_PARSER')
+    if backend:
+        return backend
+    try:
+        import lxml  # noqa: F401
+        return 'lxml'
+    except ImportError:
+        return 'html.parser'
 
 class ProductHuntScraper:
-    def __init__(self):
-        self.base_url = "https://www.producthunt.com"
+    def __init__(self, batch_size=None, use_db=True, context=None):
+        self.base_url = os.getenv('PRODUCTHUNT_BASE_URL', "https://www.producthunt.com")
         self.headers = {
             'User-Agent': 'Mozilla/5.0 (Windows NT 10.0; Win64; x64) AppleWebKit/537.36 (KHTML, like Gecko) Chrome/91.0.4472.124 Safari/537.36',
             'Accept': 'text/html,application/xhtml+xml,application/xml;q=0.9,image/webp,*/*;q=0.8',
@@ -22,13 +46,76 @@ class ProductHuntScraper:
             'Connection': 'keep-alive',
             'Upgrade-Insecure-Requests': '1'
         }
+        # HTTP transport dùng chung (connection pool + retry/backoff)
+        self.http = HttpClient(headers=self.headers)
+        # Backend parse HTML cho BeautifulSoup
+        self.parser_backend = default_parser_backend()
+        # Đọc state JSON nhúng trong trang trước, DOM là fallback (PH_EMBEDDED_JSON=0: chỉ đọc DOM)
+        self.use_embedded_json = os.getenv('PH_EMBEDDED_JSON', '1') != '0'
+        self.extraction_path = None
+        # Ngày cần lấy, múi giờ, run_id: tạo một lần cho mỗi run (xem RunContext)
+        self._context = context
+        # Metrics theo phase của run hiện tại (xem run_metrics.RunMetrics)
+        self.metrics = None
+        
+        # Số thao tác mỗi WriteBatch (tối đa 500)
+        self.batch_size = batch_size
+        # 'replace': xóa collection rồi ghi lại; 'snapshot': ghi version mới rồi flip pointer
+        self.publish_mode = os.getenv('PUBLISH_MODE', 'replace')
         
-        # Khởi tạo Firebase
-        self.db = None
-        self.init_firebase()
+        # Firebase chỉ được khởi tạo một lần, khi cần dùng lần đầu
+        self.use_db = use_db
+        self._db = None
+        self._firebase_attempted = False
+        # Nơi ghi dữ liệu (Firestore, SQLite, JSON-lines, memory), tạo khi dùng lần đầu
+        self._storage = None
+        self._storage_attempted = False
+    
+    @property
+    def context(self):
+        """RunContext của lần chạy hiện tại (tạo mặc định = ngày hôm qua nếu chưa có)"""
+        if self._context is None:
+            self._context = RunContext()
+        return self._context
+    
+    @context.setter
+    def context(self, value):
+        self._context = value
+    
+    @property
+    def storage(self):
+        """Storage theo cấu hình STORAGE_BACKENDS (None nếu không có backend nào)"""
+        if not self._storage_attempted:
+            self._storage_attempted = True
+            # Chỉ khởi tạo Firebase khi có backend Firestore
+            db = self.db if 'firestore' in configured_backends() else None
+            self._storage = open_storage(db=db, batch_size=self.batch_size)
+            if self._storage:
+                print(f"💽 Storage: {', '.join(self._storage.names)}")
+        return self._storage
+    
+    @storage.setter
+    def storage(self, value):
+        self._storage = value
+        self._storage_attempted = True
+    
+    @property
+    def db(self):
+        """Firestore client, khởi tạo ở lần dùng đầu tiên (None nếu không dùng DB)"""
+        if self._db is None and self.use_db and not self._firebase_attempted:
+            self.init_firebase()
+        return self._db
+    
+    @db.setter
+    def db(self, value):
+        self._db = value
         
     def init_firebase(self):
-        """Khởi tạo Firebase Admin SDK từ biến môi trường"""
+        """Khởi tạo Firebase Admin SDK từ biến môi trường (chỉ một lần)"""
+        if self._firebase_attempted or not self.use_db:
+            return
+        self._firebase_attempted = True
+        
         try:
             # Load biến môi trường
             load_dotenv()
@@ -42,13 +129,16 @@ class ProductHuntScraper:
                 print("   3. Script sẽ chạy mà không lưu vào Firebase")
                 return
             
+            import firebase_admin
+            from firebase_admin import credentials, firestore
+            
             if not firebase_admin._apps:
                 # Parse JSON chuỗi thành dict
                 service_account_dict = json.loads(service_account_json)
                 cred = credentials.Certificate(service_account_dict)
                 firebase_admin.initialize_app(cred)
             
-            self.db = firestore.client()
+            self._db = firestore.client()
             print("✅ Firebase đã được khởi tạo từ biến môi trường")
             
         except Exception as e:
@@ -56,30 +146,13 @@ class ProductHuntScraper:
             print("💡 Script sẽ tiếp tục chạy nhưng không lưu vào Firebase")
         
     def get_yesterday_date(self):
-        """Lấy ngày hôm qua theo múi giờ Việt Nam (UTC+7)"""
-        # Tạo timezone Việt Nam
-        vietnam_tz = pytz.timezone('Asia/Ho_Chi_Minh')
-        
-        # Lấy thời gian hiện tại theo múi giờ Việt Nam
-        now_vietnam = datetime.now(vietnam_tz)
-        
-        # Lấy ngày hôm qua
-        yesterday = now_vietnam - timedelta(days=1)
-        
-        # Format theo định dạng YYYY/M/D (không có số 0 đầu)
-        year = yesterday.year
-        month = yesterday.month
-        day = yesterday.day
-        
-        print(f"🕐 Thời gian hiện tại (VN): {now_vietnam.strftime('%Y-%m-%d %H:%M:%S')}")
-        print(f"📅 Ngày cần lấy dữ liệu: {year}/{month}/{day}")
-        
-        return f"{year}/{month}/{day}"
+        """Ngày cần lấy dữ liệu (YYYY/M/D), cố định trong cả run theo RunContext"""
+        return self.context.date_str
     
     def build_url(self, date_str=None):
         """Tạo URL cho trang leaderboard theo ngày"""
         if date_str is None:
-            date_str = self.get_yesterday_date()
+            date_str = self.context.date_str
         
         # Chuyển đổi từ YYYY/M/D sang YYYY/M/D format cho URL
         url = f"{self.base_url}/leaderboard/daily/{date_str}?ref=header_nav"
@@ -89,40 +162,17 @@ class ProductHuntScraper:
         """Lấy dữ liệu các sản phẩm từ trang leaderboard"""
         try:
             print(f"🌐 Đang truy cập: {url}")
-            response = requests.get(url, headers=self.headers)
-            response.raise_for_status()
+            with self.phase('fetch'):
+                response = self.http.get(url)
+                response.raise_for_status()
             
             print(f"✅ Truy cập thành công! Status code: {response.status_code}")
             print(f"📊 Kích thước response: {len(response.content)} bytes")
             
-            soup = BeautifulSoup(response.content, 'html.parser')
-            products = []
-            
-            # Tìm các section chứa thông tin sản phẩm với data-test="post-item-*"
-            product_elements = soup.find_all('section', {'data-test': re.compile(r'post-item-\d+')})
-            
-            if not product_elements:
-                print("⚠️ Không tìm thấy section với data-test='post-item-*', thử tìm cách khác...")
-                # Fallback: tìm sections có class chứa thông tin sản phẩm
-                product_elements = soup.find_all('section', class_=re.compile(r'.*group.*relative.*flex.*'))
-                print(f"🔍 Tìm được {len(product_elements)} elements với fallback method")
-            
-            print(f"🎯 Tìm thấy {len(product_elements)} sản phẩm")
-            
-            for i, element in enumerate(product_elements[:20]):  # Giới hạn 20 sản phẩm đầu
-                try:
-                    print(f"🔄 Đang xử lý sản phẩm #{i+1}...")
-                    product_data = self.extract_product_info(element, rank=i+1)  # Truyền rank vào
-                    if product_data and product_data['title'] != 'N/A':
-                        products.append(product_data)
-                        print(f"✅ Thành công: #{product_data['rank']} - {product_data['title']}")
-                    else:
-                        print(f"⚠️ Bỏ qua sản phẩm #{i+1} (không lấy được tên)")
-                except Exception as e:
-                    print(f"❌ Lỗi khi xử lý sản phẩm #{i+1}: {str(e)}")
-                    continue
-            
-            print(f"🏁 Hoàn thành! Đã lấy được {len(products)} sản phẩm hợp lệ")
+            with self.phase('parse') as phase:
+                products = self.parse_products(response.content)
+                if not products:
+                    phase.status = 'error'
             return products
             
         except requests.RequestException as e:
@@ -132,8 +182,171 @@ class ProductHuntScraper:
             print(f"❌ Lỗi không xác định: {str(e)}")
             return []
     
+    def find_product_sections(self, html):
+        """Parse HTML và trả về các section sản phẩm của leaderboard
+
+        Chỉ dựng cây cho các thẻ <section> (SoupStrainer) thay vì cả trang.
+        """
+        from bs4 import BeautifulSoup, SoupStrainer
+        
+        soup = BeautifulSoup(html, self.parser_backend, parse_only=SoupStrainer('section'))
+        
+        # Tìm các section chứa thông tin sản phẩm với data-test="post-item-*"
+        product_elements = soup.find_all('section', attrs={'data-test': POST_ITEM_RE})
+        
+        if not product_elements:
+            print("⚠️ Không tìm thấy section với data-test='post-item-*', thử tìm cách khác...")
+            # Fallback: tìm sections có class chứa thông tin sản phẩm
+            product_elements = soup.find_all('section', class_=FALLBACK_SECTION_RE)
+            print(f"🔍 Tìm được {len(product_elements)} elements với fallback method")
+        
+        return product_elements
+    
+    def extract_embedded_state(self, html):
+        """Tìm state JSON nhúng (__NEXT_DATA__ hoặc window.__APOLLO_STATE__), None nếu không có"""
+        if isinstance(html, bytes):
+            html = html.decode('utf-8', errors='replace')
+        
+        for pattern in (NEXT_DATA_RE, APOLLO_STATE_RE):
+            match = pattern.search(html)
+            if not match:
+                continue
+            try:
+                return json.loads(match.group(1))
+            except ValueError as e:
+                print(f"⚠️ Không parse được state JSON nhúng: {str(e)}")
+        return None
+    
+    def find_apollo_cache(self, state):
+        """Tìm Apollo normalized cache (dict có ROOT_QUERY hoặc key 'Post:*') trong state"""
+        stack = [state]
+        while stack:
+            value = stack.pop()
+            if isinstance(value, dict):
+                if 'ROOT_QUERY' in value or any(str(key).startswith('Post:') for key in value):
+                    return value
+                stack.extend(value.values())
+            elif isinstance(value, list):
+                stack.extend(value)
+        return None
+    
+    def extract_products_from_state(self, state):
+        """Giải mã các Post của leaderboard từ state JSON, theo thứ tự edges của connection
+        
+        Trả về [] (để chuyển sang đọc DOM) nếu không tìm thấy connection leaderboard
+        trong ROOT_QUERY hoặc có Post thiếu dailyRank.
+        """
+        cache = self.find_apollo_cache(state) or {}
+        
+        def resolve(value):
+            if isinstance(value, dict) and '__ref' in value:
+                return cache.get(value['__ref'])
+            return value
+        
+        def nodes(connection):
+            """Các node (đã resolve) của connection, theo thứ tự edges"""
+            connection = resolve(connection)
+            edges = connection.get('edges') if isinstance(connection, dict) else connection
+            found = []
+            for edge in edges if isinstance(edges, list) else ():
+                edge = resolve(edge)
+                node = resolve(edge.get('node', edge)) if isinstance(edge, dict) else None
+                if isinstance(node, dict):
+                    found.append(node)
+            return found
+        
+        leaderboard = None
+        for key, value in (cache.get('ROOT_QUERY') or {}).items():
+            value = resolve(value)
+            if str(key).startswith('leaderboard') and isinstance(value, dict) and 'edges' in value:
+                leaderboard = value
+                break
+        if leaderboard is None:
+            print("⚠️ State JSON không có connection leaderboard trong ROOT_QUERY")
+            return []
+        
+        posts = [post for post in nodes(leaderboard) if post.get('name')]
+        if not all(isinstance(post.get('dailyRank'), int) for post in posts):
+            print("⚠️ Có Post thiếu dailyRank trong state JSON")
+            return []
+        
+        products = []
+        date = self.context.date_str
+        for post in posts:
+            topics = nodes(post.get('topics'))
+            
+            product_ref = resolve(post.get('product')) or {}
+            if product_ref.get('slug'):
+                link = f"{self.base_url}/products/{product_ref['slug']}"
+            elif post.get('slug'):
+                link = f"{self.base_url}/posts/{post['slug']}"
+            else:
+                link = 'N/A'
+            
+            thumbnail = resolve(post.get('thumbnail')) or {}
+            if thumbnail.get('url'):
+                image = thumbnail['url']
+            elif post.get('thumbnailImageUuid'):
+                image = f"https://ph-files.imgix.net/{post['thumbnailImageUuid']}?auto=format&w=48&h=48&fit=crop"
+            else:
+                image = 'N/A'
+            
+            products.append({
+                'rank': post['dailyRank'],
+                'title': post['name'].strip(),
+                'description': (post.get('tagline') or 'N/A').strip(),
+                'link': link,
+                'topics': [topic['name'] for topic in topics if topic.get('name')],
+                'image': image,
+                'date': date,
+                'votes': post.get('votesCount', post.get('latestScore'))
+            })
+        
+        return products
+    
+    def parse_products(self, html):
+        """Trích xuất danh sách sản phẩm từ HTML trang leaderboard
+        
+        Thử state JSON nhúng trong trang trước (toàn bộ leaderboard, có vote, đủ
+        topics); dùng DOM (MAX_PRODUCTS sản phẩm đầu) khi không có payload này
+        hoặc payload thiếu rank.
+        """
+        if self.use_embedded_json:
+            state = self.extract_embedded_state(html)
+            products = self.extract_products_from_state(state) if state else []
+            if products:
+                self.extraction_path = 'json'
+                print(f"🧬 Đã đọc {len(products)} sản phẩm từ state JSON nhúng trong trang")
+                return products
+            print("⚠️ Không dùng được state JSON nhúng, chuyển sang đọc DOM...")
+        
+        self.extraction_path = 'dom'
+        product_elements = self.find_product_sections(html)
+        products = []
+        
+        print(f"🎯 Tìm thấy {len(product_elements)} sản phẩm")
+        
+        for i, element in enumerate(product_elements[:MAX_PRODUCTS]):
+            try:
+                print(f"🔄 Đang xử lý sản phẩm #{i+1}...")
+                product_data = self.extract_product_info(element, rank=i+1)  # Truyền rank vào
+                if product_data and product_data['title'] != 'N/A':
+                    products.append(product_data)
+                    print(f"✅ Thành công: #{product_data['rank']} - {product_data['title']}")
+                else:
+                    print(f"⚠️ Bỏ qua sản phẩm #{i+1} (không lấy được tên)")
+            except Exception as e:
+                print(f"❌ Lỗi khi xử lý sản phẩm #{i+1}: {str(e)}")
+                continue
+        
+        print(f"🏁 Hoàn thành! Đã lấy được {len(products)} sản phẩm hợp lệ")
+        return products
+    
     def extract_product_info(self, element, rank):
-        """Trích xuất thông tin sản phẩm từ element HTML - bao gồm rank"""
+        """Trích xuất thông tin sản phẩm từ element HTML - bao gồm rank
+        
+        Duyệt các thẻ <a>/<img> của section đúng một lần thay vì nhiều lần find/find_all.
+        """
         product = {
             'rank': rank,  # Thêm field rank
             'title': 'N/A',
@@ -141,12 +354,37 @@ class ProductHuntScraper:
             'link': 'N/A',
             'topics': [],
             'image': 'N/A',
-            'date': self.get_yesterday_date()
+            'date': self.context.date_str
         }
         
         try:
-            # Tìm tên sản phẩm từ link với data-test="post-name-*"
-            name_link = element.find('a', {'data-test': re.compile(r'post-name-\d+')})
+            name_link = None
+            desc_element = None
+            img_element = None
+            
+            for tag in element.find_all(('a', 'img')):
+                if tag.name == 'img':
+                    if img_element is None:
+                        img_element = tag
+                    continue
+                
+                # Link tên sản phẩm với data-test="post-name-*"
+                if name_link is None:
+                    data_test = tag.get('data-test')
+                    if data_test and POST_NAME_RE.search(data_test):
+                        name_link = tag
+                
+                # Mô tả (text-secondary trong cấu trúc)
+                if desc_element is None and 'text-secondary' in ' '.join(tag.get('class') or ()):
+                    desc_element = tag
+                
+                # Topics/tags
+                href = tag.get('href')
+                if href and '/topics/' in href:
+                    topic_name = tag.get_text(strip=True)
+                    if topic_name:
+                        product['topics'].append(topic_name)
+            
             if name_link:
                 product['title'] = name_link.get_text(strip=True)
                 # Lấy href để tạo link đầy đủ
@@ -155,24 +393,14 @@ class ProductHuntScraper:
                     product['link'] = f"{self.base_url}{href}" if href.startswith('/') else href
                 print(f"  📝 Tên: {product['title']}")
             
-            # Tìm mô tả (text-secondary trong cấu trúc)
-            desc_element = element.find('a', class_=re.compile(r'.*text-secondary.*'))
             if desc_element:
                 product['description'] = desc_element.get_text(strip=True)
                 print(f"  📄 Mô tả: {product['description'][:50]}...")
             
-            # Tìm topics/tags
-            topic_links = element.find_all('a', href=re.compile(r'/topics/'))
-            for link in topic_links:
-                topic_name = link.get_text(strip=True)
-                if topic_name:
-                    product['topics'].append(topic_name)
-            
             if product['topics']:
                 print(f"  🏷️ Topics: {', '.join(product['topics'])}")
             
-            # Tìm hình ảnh
-            img_element = element.find('img')
+            # Hình ảnh
             if img_element:
                 product['image'] = img_element.get('src') or img_element.get('srcset', '').split(' ')[0]
                 print(f"  🖼️ Có hình ảnh: {product['image'][:50]}...")
@@ -186,21 +414,15 @@ class ProductHuntScraper:
     
     def clear_collection(self, collection_name):
         """Xóa toàn bộ documents trong collection"""
-        if not self.db:
+        if not self.storage:
             print("❌ Firebase chưa được khởi tạo")
             return False
             
         try:
             print(f"🗑️ Đang xóa collection '{collection_name}'...")
             
-            # Lấy tất cả documents
-            docs = self.db.collection(collection_name).stream()
-            
-            # Xóa từng document
-            deleted_count = 0
-            for doc in docs:
-                doc.reference.delete()
-                deleted_count += 1
+            # Xóa theo batch thay vì từng document một
+            deleted_count = self.storage.clear(collection_name)
             
             print(f"✅ Đã xóa {deleted_count} documents từ collection '{collection_name}'")
             return True
@@ -210,8 +432,8 @@ class ProductHuntScraper:
             return False
     
     def save_to_firestore(self, products, collection_name="producthunt", clear_existing=True):
-        """Lưu danh sách sản phẩm vào Firestore - bao gồm field rank và createdAt"""
-        if not self.db:
+        """Lưu danh sách sản phẩm vào storage (Firestore và/hoặc các backend khác) - bao gồm field rank và createdAt"""
+        if not self.storage:
             print("❌ Firebase chưa được khởi tạo - bỏ qua việc lưu vào database")
             return False
             
@@ -220,34 +442,24 @@ class ProductHuntScraper:
             return False
         
         try:
+            if self.publish_mode == 'snapshot':
+                return self.publish_snapshot(products, collection_name)
+            
             # LUÔN xóa collection cũ trước khi lưu dữ liệu mới
             print(f"🗑️ Đang xóa toàn bộ dữ liệu cũ trong collection '{collection_name}'...")
-            clear_success = self.clear_collection(collection_name)
+            clear_success = self.timed('clear', collection_name, self.clear_collection, collection_name)
             
             if not clear_success:
                 print("⚠️ Có lỗi khi xóa dữ liệu cũ, nhưng vẫn tiếp tục lưu dữ liệu mới...")
             
             print(f"💾 Đang lưu {len(products)} sản phẩm mới vào Firestore...")
             
-            saved_count = 0
+            # Mỗi sản phẩm một document (id tự sinh), ghi theo batch ở mọi backend
+            documents = []
             for product in products:
-                doc_data = {
-                    'rank': product['rank'],
-                    'date': product['date'],
-                    'description': product['description'],
-                    'title': product['title'],
-                    'image': product['image'],
-                    'link': product['link'],
-                    'topics': product['topics'],
-                    'createdAt': SERVER_TIMESTAMP  # Thêm field createdAt với timestamp server
-                }
-                
-                # Lưu vào Firestore
-                doc_ref = self.db.collection(collection_name).document()
-                doc_ref.set(doc_data)
-                saved_count += 1
-                
-                print(f"  ✅ Đã lưu: #{product['rank']} - {product['title']}")
+                documents.append((None, self.build_document(product)))
+                print(f"  ✅ Đã thêm vào batch: #{product['rank']} - {product['title']}")
+            saved_count = self.storage.write_many(collection_name, documents)
             
             print(f"🎉 Thành công! Đã thay thế toàn bộ dữ liệu cũ bằng {saved_count} sản phẩm mới trong collection '{collection_name}'")
             print(f"🕐 Mỗi document đã được thêm field 'createdAt' với timestamp hiện tại")
@@ -257,6 +469,50 @@ class ProductHuntScraper:
             print(f"❌ Lỗi khi lưu vào Firestore: {str(e)}")
             return False
     
+    def firestore_active(self):
+        """True nếu dữ liệu được ghi vào Firestore (snapshot, hoặc storage có backend Firestore)"""
+        if self._db is None:
+            return False
+        if self.publish_mode == 'snapshot':
+            return True
+        return self._storage is not None and 'firestore' in self._storage.names
+    
+    def created_at(self):
+        """Giá trị createdAt: timestamp của server khi ghi Firestore, thời điểm hiện tại với backend cục bộ"""
+        if self.firestore_active():
+            from firebase_admin.firestore import SERVER_TIMESTAMP
+            return SERVER_TIMESTAMP
+        return self.context.now()
+    
+    def build_document(self, product):
+        """Tạo document Firestore cho một sản phẩm"""
+        return {
+            'rank': product['rank'],
+            'date': product['date'],
+            'description': product['description'],
+            'title': product['title'],
+            'image': product['image'],
+            'link': product['link'],
+            'topics': product['topics'],
+            'votes': product.get('votes'),
+            'createdAt': self.created_at()  # Timestamp server (Firestore) hoặc thời điểm ghi
+        }
+    
+    def publish_snapshot(self, products, collection_name="producthunt"):
+        """Ghi sản phẩm thành snapshot mới rồi flip pointer, không xóa dữ liệu đang live"""
+        print(f"💾 Đang publish {len(products)} sản phẩm thành snapshot mới của '{collection_name}'...")
+        
+        from snapshot_publisher import SnapshotPublisher
+        
+        publisher = SnapshotPublisher(self.db, collection_name, batch_size=self.batch_size)
+        documents = {
+            f"{product['rank']:03d}": self.build_document(product)
+            for product in products
+        }
+        publisher.publish(documents, run_id=self.context.run_id)
+        publisher.wait()
+        return True
+    
     def save_to_json(self, products, filename=None):
         """Lưu dữ liệu ra file JSON (backup method) - bao gồm field rank và createdAt"""
         if not products:
@@ -265,15 +521,15 @@ class ProductHuntScraper:
         
         try:
             if filename is None:
-                date_str = self.get_yesterday_date().replace('/', '-')
+                date_str = self.context.date_str.replace('/', '-')
                 filename = f"producthunt_{date_str}.json"
             
             # Lấy thời gian hiện tại để thêm vào JSON
-            current_time = datetime.now().isoformat()
+            current_time = self.context.now().isoformat()
             
             # Chuẩn bị dữ liệu bao gồm rank và createdAt
             data = {
-                'date': self.get_yesterday_date(),
+                'date': products[0]['date'],
                 'scraped_at': current_time,
                 'total_products': len(products),
                 'products': [{
@@ -284,6 +540,7 @@ class ProductHuntScraper:
                     'image': product['image'],
                     'link': product['link'],
                     'topics': product['topics'],
+                    'votes': product.get('votes'),
                     'createdAt': current_time  # Thêm createdAt vào JSON backup
                 } for product in products]
             }
@@ -306,7 +563,7 @@ class ProductHuntScraper:
             print("❌ Không tìm thấy sản phẩm nào!")
             return
         
-        date_str = self.get_yesterday_date()
+        date_str = self.context.date_str
         print(f"\n{'='*80}")
         print(f"🏆 SẢN PHẨM HOT NHẤT NGÀY {date_str}")
         print(f"📊 Tổng số sản phẩm tìm thấy: {len(products)}")
@@ -318,22 +575,46 @@ class ProductHuntScraper:
             print(f"   📝 Mô tả: {product['description']}")
             if product['topics']:
                 print(f"   🏷️ Topics: {', '.join(product['topics'])}")
+            if product.get('votes') is not None:
+                print(f"   👍 Votes: {product['votes']}")
             print(f"   🔗 Link: {product['link']}")
             if product['image'] != 'N/A':
                 print(f"   🖼️ Image: {product['image']}")
             print(f"   {'-'*70}")
         
         print(f"\n🎉 Hoàn thành! Đã hiển thị {len(products)} sản phẩm hàng đầu")
-        print(f"⏰ Thời gian xử lý: {datetime.now().strftime('%Y-%m-%d %H:%M:%S')}")
+        print(f"⏰ Thời gian xử lý: {self.context.now().strftime('%Y-%m-%d %H:%M:%S')}")
         print(f"🕐 Khi lưu vào Firestore, mỗi document sẽ có field 'createdAt' với timestamp hiện tại")
     
-    def run(self, save_to_db=True, save_to_file=True):
-        """Chạy script chính"""
+    def run(self, save_to_db=True, save_to_file=True, context=None):
+        """Chạy script chính
+        
+        context: RunContext cho lần chạy này; mặc định dùng context truyền cho
+        constructor (hoặc gán qua scraper.context), không có thì tạo mới (ngày
+        hôm qua). Context của run chỉ dùng trong run đó, để một scraper chạy
+        lâu (daemon) không dùng lại ngày của lần trước.
+        """
         print("🚀 BẮT ĐẦU LẤY DỮ LIỆU TỪ PRODUCT HUNT")
         print("="*50)
         
-        # Tạo URL cho ngày hôm qua
+        # Xác định ngày cần lấy một lần cho cả run
         print("📅 Đang xác định ngày cần lấy dữ liệu...")
+        previous = self._context
+        self.context = context or previous or RunContext()
+        print(self.context.describe())
+        
+        # Metrics theo phase, ghi ra METRICS_DIR/producthunt_scraper.prom / .json
+        self.metrics = RunMetrics(
+            'producthunt_scraper', run_id=self.context.run_id, http=self.http,
+            docs_counter=lambda: self._storage.written if self._storage else 0
+        )
+        try:
+            self._run(save_to_db, save_to_file)
+        finally:
+            self.metrics.finish()
+            self._context = previous
+    
+    def _run(self, save_to_db, save_to_file):
         url = self.build_url()
         print(f"🔗 URL được tạo: {url}")
         
@@ -342,24 +623,31 @@ class ProductHuntScraper:
         products = self.scrape_products(url)
         
         if products:
-            print(f"\n✅ THÀNH CÔNG! Đã lấy được {len(products)} sản phẩm")
+            print(f"\n✅ THÀNH CÔNG! Đã lấy được {len(products)} sản phẩm (nguồn: {self.extraction_path})")
             
             # In kết quả chi tiết
-            self.print_detailed_results(products)
+            with self.phase('display'):
+                self.print_detailed_results(products)
             
             # Lưu vào Firestore nếu được yêu cầu
             if save_to_db:
                 print(f"\n💾 Đang thay thế dữ liệu cũ và lưu dữ liệu mới vào Firestore...")
-                success = self.save_to_firestore(products)
-                if success:
-                    print("✅ Dữ liệu đã được thay thế thành công trong Firestore!")
-                else:
-                    print("❌ Có lỗi khi thay thế dữ liệu trong Firestore")
+                with self.phase('save') as phase:
+                    success = self.save_to_firestore(products)
+                    if success and self.publish_mode == 'snapshot':
+                        phase.docs += len(products)
+                    if success:
+                        print("✅ Dữ liệu đã được thay thế thành công trong Firestore!")
+                    else:
+                        phase.status = 'error'
+                        print("❌ Có lỗi khi thay thế dữ liệu trong Firestore")
             
             # Lưu vào file JSON như backup
             if save_to_file:
                 print(f"\n📄 Đang lưu backup vào file JSON...")
-                self.save_to_json(products)
+                with self.phase('save_file') as phase:
+                    if not self.save_to_json(products):
+                        phase.status = 'error'
             
         else:
             print("\n❌ THẤT BẠI! Không thể lấy dữ liệu")
@@ -373,8 +661,47 @@ class ProductHuntScraper:
             print("   • Kiểm tra kết nối internet")
             print("   • Cập nhật User-Agent header")
 
+        if self._storage:
+            with self.phase('flush'):
+                self._storage.flush()
+            print(f"💽 Storage: {self._storage.summary()}")
+        self.http.print_stats()
+    
+    def phase(self, name):
+        """Đo một phase của run hiện tại; ngoài run() chỉ là context rỗng"""
+        if self.metrics is None:
+            return contextlib.nullcontext(Phase(name))
+        return self.metrics.phase(name)
+    
+    def timed(self, group, key, func, *args):
+        """Gọi func(*args), ghi thời gian vào metrics của run hiện tại (nếu có)"""
+        if self.metrics is None:
+            return func(*args)
+        return self.metrics.timed(group, key, func, *args)
+    
+    def close(self):
+        """Flush các thao tác ghi đang đệm và đóng connection"""
+        if self._storage:
+            self._storage.close()
+        self.http.close()
+
 # Chạy script
 if __name__ == "__main__":
+    import argparse
+    
+    parser = argparse.ArgumentParser(description="Lấy top sản phẩm Product Hunt của ngày hôm qua")
+    parser.add_argument('--no-db', action='store_true', help="Không khởi tạo Firebase, chỉ lưu file JSON")
+    parser.add_argument('--no-file', action='store_true', help="Không lưu backup ra file JSON")
+    parser.add_argument('--date', help="Lấy leaderboard của ngày này (YYYY-MM-DD) thay cho ngày hôm qua")
+    args = parser.parse_args()
+    
+    run_context = None
+    if args.date:
+        try:
+            run_context = RunContext(target_date=datetime.strptime(args.date, '%Y-%m-%d').date())
+        except ValueError:
+            parser.error("--date phải có dạng YYYY-MM-DD")
+    
     print("🔧 CẤU HÌNH FIREBASE")
     print("="*30)
     print("💡 Sử dụng biến môi trường:")
@@ -397,7 +724,7 @@ if __name__ == "__main__":
     print("\n" + "="*50)
     
     # Khởi tạo scraper
-    scraper = ProductHuntScraper()
+    scraper = ProductHuntScraper(use_db=not args.no_db)
     
-    # Chạy với cả hai tùy chọn lưu trữ
-    scraper.run(save_to_db=True, save_to_file=True)
\ No newline at end of file
+    # Chạy với cả hai tùy chọn lưu trữ (trừ khi bị tắt qua tham số)
+    scraper.run(save_to_db=not args.no_db, save_to_file=not args.no_file, context=run_context)
\ No newline at end of file
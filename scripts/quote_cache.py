@@ -0,0 +1,222 @@
+import json
+import os
+import sqlite3
+import threading
+import time
+
+# TTL mặc định (giây) cho từng loại dữ liệu
+DEFAULT_TTLS = {
+    'toplist': 3600,   # Danh sách top coin ít thay đổi
+    'fx': 3600,        # Tỷ giá
+    'price': 60        # Giá quote
+}
+
+# Số key tối đa trong một câu SELECT ... IN (...) (giới hạn biến của SQLite cũ là 999)
+READ_CHUNK = 500
+
+
+class QuoteCache:
+    """Cache TTL lưu trên đĩa (SQLite) đặt trước các upstream API
+
+    Mỗi entry có TTL theo loại dữ liệu (data_class). Khi bật
+    stale-while-revalidate, entry đã hết hạn (nhưng chưa quá stale_max_age)
+    được trả về ngay và làm mới ở background.
+    """
+
+    def __init__(self, path=None, ttls=None, stale_while_revalidate=None, stale_max_age=None):
+        self.path = path or os.getenv('QUOTE_CACHE_PATH', os.path.join('.cache', 'quote_cache.sqlite3'))
+        self.ttls = dict(DEFAULT_TTLS)
+        for data_class in DEFAULT_TTLS:
+            env_ttl = os.getenv(f'CACHE_TTL_{data_class.upper()}')
+            if env_ttl:
+                self.ttls[data_class] = float(env_ttl)
+        if ttls:
+            self.ttls.update(ttls)
+
+        if stale_while_revalidate is None:
+            stale_while_revalidate = os.getenv('CACHE_STALE_WHILE_REVALIDATE', '0') == '1'
+        self.stale_while_revalidate = stale_while_revalidate
+        self.stale_max_age = stale_max_age or float(os.getenv('CACHE_STALE_MAX_AGE', '86400'))
+
+        self._lock = threading.Lock()
+        self._refreshing = set()
+        self._refresh_threads = []
+        self.stats = {'hit': 0, 'stale': 0, 'miss': 0, 'refresh': 0, 'refresh_error': 0, 'fallback': 0}
+
+        directory = os.path.dirname(self.path)
+        if directory:
+            os.makedirs(directory, exist_ok=True)
+        with self._connect() as conn:
+            conn.execute(
+                'CREATE TABLE IF NOT EXISTS cache ('
+                ' data_class TEXT NOT NULL,'
+                ' key TEXT NOT NULL,'
+                ' value TEXT NOT NULL,'
+                ' fetched_at REAL NOT NULL,'
+                ' PRIMARY KEY (data_class, key))'
+            )
+
+    def _connect(self):
+        # Mỗi thao tác mở connection riêng để dùng an toàn từ nhiều thread
+        return sqlite3.connect(self.path, timeout=10)
+
+    def _count(self, key):
+        with self._lock:
+            self.stats[key] += 1
+
+    def _read(self, data_class, key):
+        with self._connect() as conn:
+            row = conn.execute(
+                'SELECT value, fetched_at FROM cache WHERE data_class = ? AND key = ?',
+                (data_class, key)
+            ).fetchone()
+        if row is None:
+            return None, None
+        return json.loads(row[0]), row[1]
+
+    def _read_many(self, data_class, keys):
+        """{key: (value, fetched_at)} cho các key có trong cache, dùng một connection"""
+        rows = {}
+        with self._connect() as conn:
+            for start in range(0, len(keys), READ_CHUNK):
+                chunk = keys[start:start + READ_CHUNK]
+                placeholders = ','.join('?' * len(chunk))
+                for key, value, fetched_at in conn.execute(
+                    f'SELECT key, value, fetched_at FROM cache WHERE data_class = ? AND key IN ({placeholders})',
+                    (data_class, *chunk)
+                ):
+                    rows[key] = (json.loads(value), fetched_at)
+        return rows
+
+    def store(self, data_class, key, value):
+        """Ghi (hoặc ghi đè) một entry"""
+        with self._connect() as conn:
+            conn.execute(
+                'INSERT OR REPLACE INTO cache (data_class, key, value, fetched_at) VALUES (?, ?, ?, ?)',
+                (data_class, key, json.dumps(value, ensure_ascii=False), time.time())
+            )
+
+    def store_many(self, data_class, items):
+        """Ghi nhiều entry {key: value} trong một transaction"""
+        if not items:
+            return
+        now = time.time()
+        with self._connect() as conn:
+            conn.executemany(
+                'INSERT OR REPLACE INTO cache (data_class, key, value, fetched_at) VALUES (?, ?, ?, ?)',
+                [(data_class, key, json.dumps(value, ensure_ascii=False), now) for key, value in items.items()]
+            )
+
+    def lookup(self, data_class, key, refresh_fn=None):
+        """Đọc cache; trả về None nếu miss
+
+        Entry hết hạn được trả về (và làm mới ở background bằng refresh_fn)
+        chỉ khi bật stale-while-revalidate.
+        """
+        value, fetched_at = self._read(data_class, key)
+        return self._evaluate(data_class, key, value, fetched_at, refresh_fn)
+
+    def lookup_many(self, data_class, keys, refresh_fns=None):
+        """lookup cho nhiều key bằng một lần đọc; trả về {key: value} của các key hit
+
+        refresh_fns: {key: hàm làm mới} cho stale-while-revalidate.
+        """
+        keys = list(keys)
+        rows = self._read_many(data_class, keys)
+        refresh_fns = refresh_fns or {}
+        results = {}
+        for key in keys:
+            value, fetched_at = rows.get(key, (None, None))
+            value = self._evaluate(data_class, key, value, fetched_at, refresh_fns.get(key))
+            if value is not None:
+                results[key] = value
+        return results
+
+    def _evaluate(self, data_class, key, value, fetched_at, refresh_fn):
+        if fetched_at is not None:
+            age = time.time() - fetched_at
+            if age <= self.ttls.get(data_class, 0):
+                self._count('hit')
+                return value
+            if self.stale_while_revalidate and age <= self.stale_max_age:
+                self._count('stale')
+                if refresh_fn is not None:
+                    self._refresh_in_background(data_class, key, refresh_fn)
+                return value
+
+        self._count('miss')
+        return None
+
+    def last_good(self, data_class, key, max_age=None):
+        """Giá trị tốt gần nhất bất kể TTL (dùng khi upstream lỗi / bị ngắt)
+
+        Trả về (value, tuổi tính bằng giây) hoặc (None, None) nếu không có
+        entry hoặc entry cũ hơn max_age (mặc định stale_max_age).
+        """
+        value, fetched_at = self._read(data_class, key)
+        if fetched_at is None:
+            return None, None
+        age = time.time() - fetched_at
+        if age > (max_age or self.stale_max_age):
+            return None, None
+        self._count('fallback')
+        return value, age
+
+    def get_or_fetch(self, data_class, key, fetch_fn):
+        """Trả về giá trị từ cache, hoặc gọi fetch_fn() và lưu kết quả
+
+        Exception của fetch_fn được raise lại cho caller; kết quả None
+        không được lưu vào cache.
+        """
+        value = self.lookup(data_class, key, refresh_fn=fetch_fn)
+        if value is not None:
+            return value
+
+        value = fetch_fn()
+        if value is not None:
+            self.store(data_class, key, value)
+        return value
+
+    def _refresh_in_background(self, data_class, key, refresh_fn):
+        with self._lock:
+            if (data_class, key) in self._refreshing:
+                return
+            self._refreshing.add((data_class, key))
+
+        def refresh():
+            try:
+                value = refresh_fn()
+                if value is not None:
+                    self.store(data_class, key, value)
+                    self._count('refresh')
+                else:
+                    self._count('refresh_error')
+            except Exception as e:
+                self._count('refresh_error')
+                print(f"⚠️ Lỗi khi làm mới cache {data_class}/{key}: {e}")
+            finally:
+                with self._lock:
+                    self._refreshing.discard((data_class, key))
+
+        thread = threading.Thread(target=refresh, daemon=True)
+        thread.start()
+        with self._lock:
+            self._refresh_threads.append(thread)
+
+    def wait_for_refreshes(self, timeout=30):
+        """Chờ các lượt làm mới background ghi xong trước khi thoát"""
+        deadline = time.time() + timeout
+        with self._lock:
+            threads = list(self._refresh_threads)
+            self._refresh_threads = []
+        for thread in threads:
+            thread.join(max(0, deadline - time.time()))
+
+    def print_stats(self):
+        """In thống kê hit/miss của cache"""
+        total = self.stats['hit'] + self.stats['stale'] + self.stats['miss']
+        hit_rate = (self.stats['hit'] + self.stats['stale']) / total * 100 if total else 0
+        print(f"\n🗄️ Cache ({self.path}): {self.stats['hit']} hit, {self.stats['stale']} stale, "
+              f"{self.stats['miss']} miss ({hit_rate:.0f}% hit), "
+              f"{self.stats['refresh']} làm mới background, {self.stats['refresh_error']} lỗi làm mới"
+              + (f", {self.stats['fallback']} lần dùng dữ liệu cũ do upstream lỗi" if self.stats['fallback'] else ''))
@@ -0,0 +1,44 @@
+import time
+import uuid
+from datetime import datetime, timedelta
+
+# Múi giờ mặc định để xác định "ngày hôm qua" (giờ Việt Nam, UTC+7)
+DEFAULT_TIMEZONE = 'Asia/Ho_Chi_Minh'
+
+
+class RunContext:
+    """Thông tin cố định của một lần chạy: ngày cần lấy, múi giờ, run_id, đồng hồ
+
+    Tạo một lần ở đầu run và truyền cho mọi bước, để cả run dùng cùng một
+    ngày (không bị lệch khi chạy qua nửa đêm) và có thể chạy lại đúng một
+    ngày bất kỳ (target_date) hoặc với đồng hồ giả (clock) khi benchmark.
+    """
+
+    def __init__(self, target_date=None, timezone=DEFAULT_TIMEZONE, run_id=None, clock=None):
+        import pytz
+
+        self.timezone = timezone
+        self.tz = pytz.timezone(timezone)
+        # clock() trả về epoch giây, mặc định là time.time
+        self.clock = clock or time.time
+        self.started_at = self.now()
+        # Mặc định lấy ngày hôm qua theo múi giờ đã chọn
+        self.target_date = target_date or (self.started_at - timedelta(days=1)).date()
+        self.run_id = run_id or f"{self.started_at.strftime('%Y%m%dT%H%M%S')}-{uuid.uuid4().hex[:6]}"
+
+    def now(self):
+        """Thời điểm hiện tại theo clock của run, ở múi giờ của run"""
+        return datetime.fromtimestamp(self.clock(), self.tz)
+
+    @property
+    def date_str(self):
+        """Ngày cần lấy ở định dạng YYYY/M/D (không có số 0 đầu, như URL leaderboard)"""
+        return f"{self.target_date.year}/{self.target_date.month}/{self.target_date.day}"
+
+    def for_date(self, target_date):
+        """Context con cho một ngày khác (dùng chung run_id, múi giờ và clock)"""
+        return RunContext(target_date, self.timezone, self.run_id, self.clock)
+
+    def describe(self):
+        return (f"🕐 Thời gian hiện tại ({self.timezone}): {self.started_at.strftime('%Y-%m-%d %H:%M:%S')}\n"
+                f"📅 Ngày cần lấy dữ liệu: {self.date_str} (run {self.run_id})")
@@ -0,0 +1,253 @@
+import contextlib
+import json
+import os
+import statistics
+import time
+from datetime import datetime, timezone
+
+
+def _diff_totals(before, after):
+    """Chênh lệch số liệu HttpClient.totals() giữa hai thời điểm"""
+    diff = {key: after[key] - before[key] for key in ('requests', 'retries', 'errors', 'bytes')}
+    statuses = {}
+    for status, count in after['statuses'].items():
+        delta = count - before['statuses'].get(status, 0)
+        if delta:
+            statuses[status] = delta
+    diff['statuses'] = statuses
+    return diff
+
+
+def _label(value):
+    return str(value).replace('\\', '\\\\').replace('"', '\\"').replace('\n', ' ')
+
+
+def _quantile(values, q):
+    ordered = sorted(values)
+    return ordered[min(len(ordered) - 1, int(round(q * (len(ordered) - 1))))]
+
+
+class Phase:
+    """Số liệu của một phase; caller có thể cộng thêm docs / đặt status
+
+    Phase concurrent (chạy chồng lên phase khác, vd: các nhánh của pipeline)
+    chỉ có thời gian và status: số liệu HTTP / document khi đó lẫn giữa các
+    phase nên được tính cho phase bao ngoài.
+    """
+
+    def __init__(self, name, concurrent=False):
+        self.name = name
+        self.concurrent = concurrent
+        self.seconds = 0.0
+        self.status = 'ok'
+        self.error = None
+        self.docs = 0
+        self.http = {'requests': 0, 'retries': 0, 'errors': 0, 'bytes': 0, 'statuses': {}}
+
+    def to_dict(self):
+        return {
+            'phase': self.name,
+            'seconds': round(self.seconds, 4),
+            'status': self.status,
+            'error': self.error,
+            'docs_written': self.docs,
+            'concurrent': self.concurrent,
+            **self.http
+        }
+
+
+class RunMetrics:
+    """Đo từng phase của một lần chạy và xuất Prometheus textfile + JSON summary
+
+    Số byte, status code, retries lấy từ chênh lệch HttpClient.totals() trước
+    và sau phase (các phase chạy tuần tự nên không lẫn nhau, kể cả khi trong
+    phase có nhiều thread). Số document đã ghi lấy từ docs_counter() (vd:
+    Storage.written) cộng với phase.docs do caller tự cộng.
+
+    Các thao tác lặp lại nhiều lần (mỗi quote, mỗi lần ghi document) được ghi
+    bằng record() và xuất dạng count / p50 / p95 / p99 / max theo nhóm.
+    """
+
+    def __init__(self, job, run_id=None, http=None, docs_counter=None, output_dir=None):
+        self.job = job
+        self.run_id = run_id
+        self.http = http
+        self.docs_counter = docs_counter
+        self.output_dir = output_dir or os.getenv('METRICS_DIR', os.path.join('.cache', 'metrics'))
+        self.started_at = time.time()
+        self.finished_at = None
+        self.phases = []
+        self.items = {}
+        self.values = {}
+
+    def _http_totals(self):
+        if self.http is None:
+            return {'requests': 0, 'retries': 0, 'errors': 0, 'bytes': 0, 'statuses': {}}
+        return self.http.totals()
+
+    def _docs(self):
+        return self.docs_counter() if self.docs_counter else 0
+
+    @contextlib.contextmanager
+    def phase(self, name, concurrent=False):
+        """with metrics.phase('fx') as phase: ... (exception được ghi rồi raise lại)
+
+        concurrent=True cho phase chạy song song với phase khác (xem Phase).
+        """
+        phase = Phase(name, concurrent)
+        http_before = None if concurrent else self._http_totals()
+        docs_before = None if concurrent else self._docs()
+        start = time.perf_counter()
+        try:
+            yield phase
+        except Exception as e:
+            phase.status = 'error'
+            phase.error = str(e)
+            raise
+        finally:
+            phase.seconds = time.perf_counter() - start
+            if not concurrent:
+                phase.http = _diff_totals(http_before, self._http_totals())
+                phase.docs += self._docs() - docs_before
+            if phase.status == 'ok' and phase.http['errors']:
+                phase.status = 'partial'
+            self.phases.append(phase)
+
+    def record(self, group, key, seconds, status='ok'):
+        """Ghi một thao tác lẻ (vd: group='quote', key='BTC-USD')"""
+        self.items.setdefault(group, []).append({'key': key, 'seconds': round(seconds, 4), 'status': status})
+
+    def set_value(self, name, value):
+        """Ghi một số liệu của run (vd: crypto_coverage_ratio), xuất dạng job_run_value{name=...}"""
+        self.values[name] = value
+
+    def timed(self, group, key, func, *args):
+        """Gọi func(*args) và ghi thời gian vào group; kết quả rỗng tính là lỗi"""
+        start = time.perf_counter()
+        status = 'error'
+        try:
+            result = func(*args)
+            status = 'ok' if result else 'error'
+            return result
+        finally:
+            self.record(group, key, time.perf_counter() - start, status)
+
+    def item_summary(self):
+        summary = {}
+        for group, items in self.items.items():
+            seconds = [item['seconds'] for item in items]
+            summary[group] = {
+                'count': len(items),
+                'errors': sum(1 for item in items if item['status'] == 'error'),
+                'p50': round(statistics.median(seconds), 4),
+                'p95': round(_quantile(seconds, 0.95), 4),
+                'p99': round(_quantile(seconds, 0.99), 4),
+                'max': round(max(seconds), 4),
+                'total': round(sum(seconds), 4)
+            }
+        return summary
+
+    def to_dict(self):
+        finished_at = self.finished_at or time.time()
+        return {
+            'job': self.job,
+            'run_id': self.run_id,
+            'started_at': datetime.fromtimestamp(self.started_at, timezone.utc).isoformat(),
+            'finished_at': datetime.fromtimestamp(finished_at, timezone.utc).isoformat(),
+            'duration_seconds': round(finished_at - self.started_at, 4),
+            'success': all(phase.status != 'error' for phase in self.phases),
+            'phases': [phase.to_dict() for phase in self.phases],
+            'values': dict(self.values),
+            'items': self.item_summary(),
+            'item_details': self.items
+        }
+
+    def prometheus_text(self):
+        """Nội dung textfile cho node_exporter (textfile collector)"""
+        summary = self.to_dict()
+        lines = []
+
+        def metric(name, help_text, samples, metric_type='gauge'):
+            # Bỏ metric không có sample nào (HELP/TYPE đứng một mình)
+            if not samples:
+                return
+            lines.append(f"# HELP {name} {help_text}")
+            lines.append(f"# TYPE {name} {metric_type}")
+            for labels, value in samples:
+                label_text = ','.join(f'{key}="{_label(val)}"' for key, val in (('job', self.job), *labels))
+                lines.append(f"{name}{{{label_text}}} {value}")
+
+        metric('job_run_duration_seconds', 'Tổng thời gian của lần chạy gần nhất',
+               [((), summary['duration_seconds'])])
+        metric('job_run_success', '1 nếu lần chạy gần nhất không có phase lỗi',
+               [((), int(summary['success']))])
+        metric('job_run_finished_timestamp_seconds', 'Thời điểm kết thúc lần chạy gần nhất',
+               [((), round(self.finished_at or time.time(), 3))])
+
+        metric('job_run_value', 'Số liệu khác của lần chạy gần nhất (theo name)',
+               [((('name', name),), value) for name, value in sorted(summary['values'].items())])
+
+        metric('job_phase_duration_seconds', 'Thời gian của từng phase',
+               [((('phase', p['phase']),), p['seconds']) for p in summary['phases']])
+        metric('job_phase_success', '1 nếu phase không lỗi',
+               [((('phase', p['phase']),), int(p['status'] != 'error')) for p in summary['phases']])
+
+        # Số liệu HTTP / document chỉ có ở phase không chạy chồng lên phase khác
+        phases = [p for p in summary['phases'] if not p['concurrent']]
+        metric('job_phase_bytes_downloaded', 'Số byte tải về trong phase',
+               [((('phase', p['phase']),), p['bytes']) for p in phases])
+        metric('job_phase_http_retries', 'Số lần retry HTTP trong phase',
+               [((('phase', p['phase']),), p['retries']) for p in phases])
+        metric('job_phase_documents_written', 'Số document đã ghi trong phase',
+               [((('phase', p['phase']),), p['docs_written']) for p in phases])
+        metric('job_phase_http_responses', 'Số response HTTP theo status code',
+               [((('phase', p['phase']), ('status', status)), count)
+                for p in phases for status, count in sorted(p['statuses'].items())])
+
+        items = summary['items']
+        metric('job_item_count', 'Số thao tác lẻ theo nhóm (vd: quote)',
+               [((('group', group),), stats['count']) for group, stats in items.items()])
+        metric('job_item_errors', 'Số thao tác lẻ bị lỗi theo nhóm',
+               [((('group', group),), stats['errors']) for group, stats in items.items()])
+        metric('job_item_duration_seconds', 'Phân vị thời gian của thao tác lẻ theo nhóm',
+               [((('group', group), ('quantile', q)), stats[key])
+                for group, stats in items.items()
+                for q, key in (('0.5', 'p50'), ('0.95', 'p95'), ('0.99', 'p99'), ('1', 'max'))])
+        return '\n'.join(lines) + '\n'
+
+    def _write_atomic(self, path, content):
+        tmp_path = f"{path}.tmp"
+        with open(tmp_path, 'w', encoding='utf-8') as f:
+            f.write(content)
+        os.replace(tmp_path, path)
+
+    def print_summary(self):
+        summary = self.to_dict()
+        print(f"\n⏱️ Thời gian theo phase ({self.job}, tổng {summary['duration_seconds']:.2f}s):")
+        print(f"   {'phase':<26}{'time':>9}{'req':>6}{'KiB':>9}{'retry':>7}{'docs':>6}  status")
+        for phase in summary['phases']:
+            if phase['concurrent']:
+                print(f"   {'∥ ' + phase['phase']:<26}{phase['seconds']:>8.2f}s{'':>34}{phase['status']}")
+                continue
+            statuses = ','.join(f"{code}x{count}" for code, count in sorted(phase['statuses'].items()))
+            print(f"   {phase['phase']:<26}{phase['seconds']:>8.2f}s{phase['requests']:>6}"
+                  f"{phase['bytes'] / 1024:>9.1f}{phase['retries']:>7}{phase['docs_written']:>6}"
+                  f"  {phase['status']}{f' ({statuses})' if statuses else ''}")
+        for group, stats in summary['items'].items():
+            print(f"   • {group}: {stats['count']} lần, {stats['errors']} lỗi, "
+                  f"p50 {stats['p50'] * 1000:.0f}ms, p95 {stats['p95'] * 1000:.0f}ms, "
+                  f"p99 {stats['p99'] * 1000:.0f}ms, max {stats['max'] * 1000:.0f}ms")
+
+    def finish(self, print_summary=True):
+        """Kết thúc run: ghi {job}.prom và {job}.json vào output_dir, in bảng tóm tắt"""
+        self.finished_at = time.time()
+        if print_summary:
+            self.print_summary()
+        try:
+            os.makedirs(self.output_dir, exist_ok=True)
+            self._write_atomic(os.path.join(self.output_dir, f"{self.job}.prom"), self.prometheus_text())
+            self._write_atomic(os.path.join(self.output_dir, f"{self.job}.json"),
+                               json.dumps(self.to_dict(), ensure_ascii=False, indent=2))
+            print(f"📈 Metrics: {os.path.join(self.output_dir, self.job)}.prom / .json")
+        except OSError as e:
+            print(f"⚠️ Không ghi được metrics: {e}")
@@ -0,0 +1,182 @@
+import hashlib
+import json
+import os
+
+from change_detector import MANIFEST_COLLECTION, VOLATILE_FIELDS
+
+# Layout của dữ liệu crypto (CRYPTO_LAYOUT):
+#   'sharded': mỗi coin một document trong {collection}/cryptocurrencies/assets/{asset_id},
+#              document cryptocurrencies chỉ là summary / index
+#   'single':  mọi coin trong field data của document cryptocurrencies (mặc định)
+LAYOUTS = ('sharded', 'single')
+
+ASSETS_COLLECTION = 'assets'
+
+# Field của mỗi coin được chép vào index của document summary (đủ cho danh sách)
+SUMMARY_FIELDS = ('symbol', 'name', 'rank', 'current_price', 'change_percent')
+
+# Số ký tự hex của hash mỗi field trong manifest (giữ manifest nhỏ với 1000+ coin)
+HASH_WIDTH = 8
+MISSING_HASH = '-' * HASH_WIDTH
+
+
+def asset_id(yahoo_symbol):
+    """Document id của một coin (Yahoo symbol, '/' không hợp lệ trong id)"""
+    return yahoo_symbol.replace('/', '_')
+
+
+def field_hash(value):
+    canonical = json.dumps(value, sort_keys=True, ensure_ascii=False, separators=(',', ':'), default=str)
+    return hashlib.sha256(canonical.encode('utf-8')).hexdigest()[:HASH_WIDTH]
+
+
+def build_summary(assets, assets_path, source):
+    """Document summary cho layout sharded từ {asset_id: dữ liệu coin}
+
+    Gồm danh sách id theo thứ hạng (để client phân trang rồi đọc từng
+    asset) và index nhỏ các field trong SUMMARY_FIELDS.
+    """
+    ordered = sorted(assets, key=lambda key: assets[key].get('rank') or float('inf'))
+    return {
+        'layout': 'sharded',
+        'assets_path': assets_path,
+        'total_coins': len(assets),
+        'symbols': ordered,
+        'index': {key: {field: assets[key].get(field) for field in SUMMARY_FIELDS} for key in ordered},
+        'source': source
+    }
+
+
+class AssetUniverse:
+    """Các asset id đã ghi ở lần chạy trước, theo collection (JSON trên đĩa)
+
+    Dùng khi không có FieldManifest (chế độ replace, backend cục bộ): chỉ xóa
+    coin rời universe khi danh sách id thay đổi thay vì clear mỗi lần chạy.
+    """
+
+    def __init__(self, path=None):
+        self.path = path or os.getenv('ASSET_UNIVERSE_PATH', os.path.join('.cache', 'asset_universe.json'))
+
+    def _read(self):
+        try:
+            with open(self.path, encoding='utf-8') as f:
+                return json.load(f)
+        except (OSError, ValueError):
+            return {}
+
+    def load(self, collection):
+        """Tập id của collection, None nếu chưa biết"""
+        ids = self._read().get(collection)
+        return set(ids) if isinstance(ids, list) else None
+
+    def save(self, collection, ids):
+        universes = self._read()
+        universes[collection] = sorted(ids)
+        try:
+            directory = os.path.dirname(self.path)
+            if directory:
+                os.makedirs(directory, exist_ok=True)
+            tmp_path = f"{self.path}.tmp"
+            with open(tmp_path, 'w', encoding='utf-8') as f:
+                json.dump(universes, f)
+            os.replace(tmp_path, self.path)
+        except OSError as e:
+            print(f"⚠️ Không lưu được danh sách asset: {e}")
+
+
+class FieldManifest:
+    """Hash từng field của mỗi document đã ghi, để chỉ ghi field thay đổi
+
+    Lưu trong một document publish_manifests/{manifest_id}:
+      fields: danh sách tên field (chỉ thêm vào cuối, giữ nguyên vị trí)
+      hashes: {doc_id: chuỗi hash HASH_WIDTH ký tự nối theo thứ tự fields}
+    Đọc một lần đầu run, ghi lại một lần cuối run (chỉ khi có thay đổi).
+    Giống ChangeDetector, hash của document vừa ghi chỉ vào manifest khi
+    storage xác nhận đã ghi xong (commit).
+    """
+
+    def __init__(self, db, manifest_id, volatile_fields=VOLATILE_FIELDS):
+        self.manifest_ref = db.collection(MANIFEST_COLLECTION).document(manifest_id)
+        self.volatile_fields = volatile_fields
+        self._fields = None
+        self._hashes = None
+        # Hash từng field của document đã gửi cho storage nhưng chưa xác nhận ghi xong
+        self._pending = {}
+        self._dirty = False
+
+    def _load(self):
+        if self._hashes is None:
+            snapshot = self.manifest_ref.get()
+            data = (snapshot.to_dict() or {}) if snapshot.exists else {}
+            self._fields = list(data.get('fields', []))
+            self._hashes = dict(data.get('hashes', {}))
+        return self._hashes
+
+    def _field_hashes(self, data):
+        return {key: field_hash(value) for key, value in data.items() if key not in self.volatile_fields}
+
+    def _decode(self, encoded):
+        return {
+            field: encoded[index * HASH_WIDTH:(index + 1) * HASH_WIDTH]
+            for index, field in enumerate(self._fields)
+            if encoded[index * HASH_WIDTH:(index + 1) * HASH_WIDTH] not in ('', MISSING_HASH)
+        }
+
+    def known_ids(self):
+        return set(self._load())
+
+    def changed_fields(self, doc_id, data):
+        """Field cần ghi của document: None nếu chưa ghi lần nào (ghi cả document)
+
+        Field có trong lần ghi trước nhưng không còn trong data cũng được
+        trả về (bị xóa khỏi document).
+        """
+        previous = self._load().get(doc_id)
+        if previous is None:
+            return None
+        previous = self._decode(previous)
+        current = self._field_hashes(data)
+        return sorted(
+            {field for field, value in current.items() if previous.get(field) != value}
+            | {field for field in previous if field not in current}
+        )
+
+    def mark(self, doc_id, data):
+        self._pending[doc_id] = self._field_hashes(data)
+
+    def pending(self):
+        """Các document đã ghi (chưa xác nhận), lấy trước khi flush storage"""
+        return list(self._pending)
+
+    def commit(self, doc_ids, failed=()):
+        """Đưa hash của doc_ids (đã ghi xong) vào manifest
+
+        Document trong failed (storage báo bị bỏ) giữ hash cũ để lần chạy
+        sau ghi lại các field đó.
+        """
+        self._load()
+        for doc_id in failed:
+            self._pending.pop(doc_id, None)
+        for doc_id in doc_ids:
+            hashes = self._pending.pop(doc_id, None)
+            if hashes is None:
+                continue
+            for field in hashes:
+                if field not in self._fields:
+                    self._fields.append(field)
+            self._hashes[doc_id] = ''.join(hashes.get(field, MISSING_HASH) for field in self._fields)
+            self._dirty = True
+
+    def remove(self, doc_ids):
+        for doc_id in doc_ids:
+            self._pending.pop(doc_id, None)
+            if self._load().pop(doc_id, None) is not None:
+                self._dirty = True
+
+    def flush(self):
+        """Ghi manifest nếu có thay đổi"""
+        if not self._dirty:
+            return False
+        self.manifest_ref.set({'fields': self._fields, 'hashes': self._hashes})
+        self._dirty = False
+        return True
@@ -0,0 +1,121 @@
+import os
+import threading
+import uuid
+from datetime import datetime, timezone
+
+from firebase_admin import firestore
+
+from firestore_batch import BatchWriter
+
+# Collection chứa pointer (manifest) trỏ tới snapshot đang live của từng collection
+POINTER_COLLECTION = 'snapshots'
+
+
+class SnapshotPublisher:
+    """Publish dữ liệu theo snapshot có version thay vì xóa rồi ghi lại
+
+    Layout cho collection C:
+      - {C}_versions/{run_id}/docs/{doc_id}: documents của từng lần chạy
+      - snapshots/{C}: pointer {run_id, path, previous_run_id, ...}
+
+    Documents mới được ghi dưới run_id, sau đó pointer được đổi trong một
+    transaction. Reader luôn thấy trọn vẹn một snapshot; các version cũ
+    được dọn ở background.
+    """
+
+    def __init__(self, db, collection_name, keep_versions=None, batch_size=None):
+        self.db = db
+        self.collection_name = collection_name
+        self.keep_versions = max(1, keep_versions or int(os.getenv('SNAPSHOT_KEEP_VERSIONS', '2')))
+        self.batch_size = batch_size
+        self.versions_ref = db.collection(f"{collection_name}_versions")
+        self.pointer_ref = db.collection(POINTER_COLLECTION).document(collection_name)
+        self._gc_thread = None
+
+    @staticmethod
+    def new_run_id():
+        """run_id sắp xếp được theo thời gian"""
+        return f"{datetime.now(timezone.utc).strftime('%Y%m%dT%H%M%S')}-{uuid.uuid4().hex[:6]}"
+
+    def publish(self, documents, run_id=None):
+        """Ghi documents {doc_id: data} thành snapshot mới rồi flip pointer
+
+        Trả về run_id của snapshot vừa publish.
+        """
+        run_id = run_id or self.new_run_id()
+        version_ref = self.versions_ref.document(run_id)
+        docs_ref = version_ref.collection('docs')
+
+        writer = BatchWriter(self.db, self.batch_size)
+        for doc_id, data in documents.items():
+            writer.set(docs_ref.document(doc_id), data)
+        writer.set(version_ref, {
+            'run_id': run_id,
+            'doc_count': len(documents),
+            'created_at': firestore.SERVER_TIMESTAMP
+        })
+        writer.commit()
+        print(f"📦 Đã ghi snapshot {run_id} ({writer.summary()})")
+
+        previous_run_id = self._flip_pointer(run_id, docs_ref.id, len(documents))
+        print(f"🔀 Đã chuyển '{self.collection_name}' sang snapshot {run_id}"
+              f" (trước đó: {previous_run_id or 'không có'})")
+
+        self.collect_garbage_in_background(run_id)
+        return run_id
+
+    def _flip_pointer(self, run_id, docs_collection, doc_count):
+        """Đổi pointer sang run_id trong một transaction, trả về run_id cũ"""
+        pointer_ref = self.pointer_ref
+        path = f"{self.versions_ref.id}/{run_id}/{docs_collection}"
+
+        @firestore.transactional
+        def flip(transaction):
+            snapshot = pointer_ref.get(transaction=transaction)
+            previous = (snapshot.to_dict() or {}).get('run_id') if snapshot.exists else None
+            transaction.set(pointer_ref, {
+                'run_id': run_id,
+                'path': path,
+                'doc_count': doc_count,
+                'previous_run_id': previous,
+                'published_at': firestore.SERVER_TIMESTAMP
+            })
+            return previous
+
+        return flip(self.db.transaction())
+
+    def collect_garbage(self, current_run_id):
+        """Xóa các version cũ, giữ lại keep_versions version mới nhất"""
+        version_ids = sorted(ref.id for ref in self.versions_ref.list_documents())
+        keep = set(version_ids[-self.keep_versions:]) | {current_run_id}
+
+        writer = BatchWriter(self.db, self.batch_size)
+        removed = 0
+        for run_id in version_ids:
+            if run_id in keep:
+                continue
+            version_ref = self.versions_ref.document(run_id)
+            # Các coin của layout sharded nằm trong subcollection docs/cryptocurrencies/assets
+            writer.delete_collection(version_ref.collection('docs'), recursive=True)
+            writer.delete(version_ref)
+            removed += 1
+        writer.commit()
+
+        if removed:
+            print(f"🧹 Đã dọn {removed} snapshot cũ của '{self.collection_name}' ({writer.summary()})")
+        return removed
+
+    def collect_garbage_in_background(self, current_run_id):
+        def run():
+            try:
+                self.collect_garbage(current_run_id)
+            except Exception as e:
+                print(f"⚠️ Lỗi khi dọn snapshot cũ: {e}")
+
+        self._gc_thread = threading.Thread(target=run, daemon=True)
+        self._gc_thread.start()
+
+    def wait(self, timeout=60):
+        """Chờ lượt dọn dẹp background xong (gọi trước khi thoát)"""
+        if self._gc_thread is not None:
+            self._gc_thread.join(timeout)
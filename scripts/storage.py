@@ -0,0 +1,427 @@
+import atexit
+import json
+import os
+import sqlite3
+import threading
+import time
+import uuid
+from collections import deque
+from datetime import date, datetime, timezone
+from functools import cached_property
+
+from firestore_batch import BatchWriter
+
+# Các backend hỗ trợ, chọn qua STORAGE_BACKENDS (phân tách bằng dấu phẩy)
+BACKENDS = ('firestore', 'sqlite', 'jsonl', 'memory')
+
+
+def encode_value(value):
+    """Chuyển giá trị không phải JSON (datetime, sentinel của Firestore) sang JSON"""
+    if isinstance(value, (datetime, date)):
+        return value.isoformat()
+    # firestore.SERVER_TIMESTAMP: backend ngoài Firestore dùng thời điểm ghi
+    if type(value).__name__ == 'Sentinel':
+        return datetime.now(timezone.utc).isoformat()
+    return str(value)
+
+
+class Record:
+    """Một document cần ghi, dùng chung cho mọi backend
+
+    JSON chỉ được encode một lần (lười) rồi dùng lại cho mọi backend cần
+    dạng text (SQLite, JSON-lines); Firestore và memory dùng thẳng dict.
+
+    fields: field mask (list tên field) khi chỉ một phần document thay
+    đổi. data luôn là document đầy đủ: Firestore chỉ gửi các field trong
+    mask (set merge), các backend cục bộ vẫn ghi cả document.
+    """
+
+    def __init__(self, collection, doc_id, data, fields=None):
+        self.collection = collection
+        # Không có id thì tự sinh (giống document() không tham số của Firestore)
+        self.doc_id = doc_id or uuid.uuid4().hex[:20]
+        self.data = data
+        self.fields = fields
+
+    @cached_property
+    def encoded(self):
+        return json.dumps(self.data, ensure_ascii=False, default=encode_value)
+
+
+class FirestoreBackend:
+    name = 'firestore'
+
+    def __init__(self, db, batch_size=None):
+        self.db = db
+        self.batch_size = batch_size
+
+    def write_many(self, records):
+        writer = BatchWriter(self.db, self.batch_size)
+        for record in records:
+            doc_ref = self.db.collection(record.collection).document(record.doc_id)
+            if record.fields:
+                # Field không còn trong data bị xóa khỏi document
+                from firebase_admin.firestore import DELETE_FIELD
+                masked = {field: record.data[field] if field in record.data else DELETE_FIELD for field in record.fields}
+                writer.set(doc_ref, masked, merge=list(record.fields))
+            else:
+                writer.set(doc_ref, record.data)
+        writer.commit()
+        return len(records)
+
+    def clear(self, collection, keep=()):
+        writer = BatchWriter(self.db, self.batch_size)
+        deleted = writer.delete_collection(self.db.collection(collection), keep=keep)
+        print(f"🧹 [firestore] Đã xóa {deleted} documents trong '{collection}' ({writer.summary()})")
+        return deleted
+
+    def close(self):
+        pass
+
+
+class SQLiteBackend:
+    """Bảng documents(collection, doc_id, data, written_at), ghi đè theo id"""
+    name = 'sqlite'
+
+    def __init__(self, path=None):
+        self.path = path or os.getenv('STORAGE_SQLITE_PATH', os.path.join('.cache', 'storage.sqlite3'))
+        directory = os.path.dirname(self.path)
+        if directory:
+            os.makedirs(directory, exist_ok=True)
+        with self._connect() as conn:
+            conn.execute(
+                'CREATE TABLE IF NOT EXISTS documents ('
+                ' collection TEXT NOT NULL,'
+                ' doc_id TEXT NOT NULL,'
+                ' data TEXT NOT NULL,'
+                ' written_at REAL NOT NULL,'
+                ' PRIMARY KEY (collection, doc_id))'
+            )
+
+    def _connect(self):
+        return sqlite3.connect(self.path, timeout=10)
+
+    def write_many(self, records):
+        now = time.time()
+        with self._connect() as conn:
+            conn.executemany(
+                'INSERT OR REPLACE INTO documents (collection, doc_id, data, written_at) VALUES (?, ?, ?, ?)',
+                [(record.collection, record.doc_id, record.encoded, now) for record in records]
+            )
+        return len(records)
+
+    def clear(self, collection, keep=()):
+        keep = list(keep)
+        placeholders = ','.join('?' * len(keep))
+        query = 'DELETE FROM documents WHERE collection = ?'
+        if keep:
+            query += f' AND doc_id NOT IN ({placeholders})'
+        with self._connect() as conn:
+            return conn.execute(query, [collection, *keep]).rowcount
+
+    def read(self, collection, doc_id):
+        with self._connect() as conn:
+            row = conn.execute(
+                'SELECT data FROM documents WHERE collection = ? AND doc_id = ?', (collection, doc_id)
+            ).fetchone()
+        return json.loads(row[0]) if row else None
+
+    def close(self):
+        pass
+
+
+class JsonLinesBackend:
+    """Archive append-only: mỗi document một dòng trong {dir}/{collection}.jsonl
+
+    Archive giữ toàn bộ lịch sử nên clear() không xóa gì.
+    """
+    name = 'jsonl'
+
+    def __init__(self, directory=None):
+        self.directory = directory or os.getenv('STORAGE_JSONL_DIR', os.path.join('.cache', 'archive'))
+        os.makedirs(self.directory, exist_ok=True)
+        self._lock = threading.Lock()
+
+    def _path(self, collection):
+        safe_name = ''.join(char if char.isalnum() or char in '-_' else '_' for char in collection)
+        return os.path.join(self.directory, f"{safe_name}.jsonl")
+
+    def write_many(self, records):
+        written_at = datetime.now(timezone.utc).isoformat()
+        lines = {}
+        for record in records:
+            # Ghép chuỗi để dùng lại record.encoded, không encode lại data
+            lines.setdefault(record.collection, []).append(
+                f'{{"collection": {json.dumps(record.collection, ensure_ascii=False)}, '
+                f'"id": {json.dumps(record.doc_id)}, "written_at": "{written_at}", '
+                f'"data": {record.encoded}}}\n'
+            )
+        with self._lock:
+            for collection, collection_lines in lines.items():
+                with open(self._path(collection), 'a', encoding='utf-8') as f:
+                    f.writelines(collection_lines)
+        return len(records)
+
+    def clear(self, collection, keep=()):
+        return 0
+
+    def close(self):
+        pass
+
+
+class MemoryBackend:
+    """Lưu trong bộ nhớ {collection: {doc_id: data}} (test, benchmark, --no-db)"""
+    name = 'memory'
+
+    def __init__(self):
+        self.collections = {}
+        self._lock = threading.Lock()
+
+    def write_many(self, records):
+        with self._lock:
+            for record in records:
+                self.collections.setdefault(record.collection, {})[record.doc_id] = record.data
+        return len(records)
+
+    def clear(self, collection, keep=()):
+        with self._lock:
+            documents = self.collections.get(collection, {})
+            removed = [doc_id for doc_id in documents if doc_id not in keep]
+            for doc_id in removed:
+                del documents[doc_id]
+        return len(removed)
+
+    def close(self):
+        pass
+
+
+class WriteBehindBuffer:
+    """Đệm thao tác ghi của một backend và flush ở background thread
+
+    write_many() chỉ đưa record vào hàng đợi rồi trả về ngay. Thread nền
+    flush theo lô (max_batch) mỗi flush_interval giây hoặc khi hàng đợi đầy;
+    lô lỗi được thử lại với backoff, quá max_retries thì bỏ và ghi nhận
+    (collection, doc_id) của các record bị bỏ để flush() báo lỗi. Còn dữ
+    liệu chưa flush lúc thoát thì flush ở atexit.
+    """
+
+    def __init__(self, backend, max_batch=None, flush_interval=None, max_retries=None, retry_base=0.5):
+        self.backend = backend
+        self.name = backend.name
+        self.max_batch = max_batch or int(os.getenv('STORAGE_MAX_BATCH', '500'))
+        self.flush_interval = flush_interval or float(os.getenv('STORAGE_FLUSH_INTERVAL', '2'))
+        self.max_retries = max_retries if max_retries is not None else int(os.getenv('STORAGE_MAX_RETRIES', '5'))
+        self.retry_base = retry_base
+
+        self._queue = deque()
+        self._in_flight = 0
+        self._condition = threading.Condition()
+        self._stop = False
+        self._thread = None
+        self.stats = {'written': 0, 'flushes': 0, 'retries': 0, 'dropped': 0}
+        # Record bị bỏ từ lần flush() trước, và của lần flush() gần nhất
+        self._dropped = set()
+        self.dropped_keys = set()
+        atexit.register(self.close)
+
+    def _ensure_thread(self):
+        if self._thread is None:
+            self._thread = threading.Thread(target=self._run, name=f"write-behind-{self.name}", daemon=True)
+            self._thread.start()
+
+    def write_many(self, records):
+        with self._condition:
+            self._queue.extend(records)
+            self._ensure_thread()
+            if len(self._queue) >= self.max_batch:
+                self._condition.notify_all()
+        return len(records)
+
+    def _take_batch(self):
+        with self._condition:
+            while not self._queue and not self._stop:
+                self._condition.wait()
+            if not self._queue:
+                return []
+            if len(self._queue) < self.max_batch and not self._stop:
+                # Chờ gom thêm record (trừ khi có yêu cầu flush / dừng)
+                self._condition.wait(timeout=self.flush_interval)
+            batch = [self._queue.popleft() for _ in range(min(self.max_batch, len(self._queue)))]
+            self._in_flight = len(batch)
+            return batch
+
+    def _run(self):
+        while True:
+            batch = self._take_batch()
+            if not batch:
+                return
+
+            for attempt in range(self.max_retries + 1):
+                try:
+                    self.backend.write_many(batch)
+                    self.stats['written'] += len(batch)
+                    self.stats['flushes'] += 1
+                    break
+                except Exception as e:
+                    if attempt >= self.max_retries:
+                        with self._condition:
+                            self.stats['dropped'] += len(batch)
+                            self._dropped.update((record.collection, record.doc_id) for record in batch)
+                        print(f"❌ [{self.name}] Bỏ {len(batch)} documents sau {attempt + 1} lần ghi lỗi: {e}")
+                        break
+                    self.stats['retries'] += 1
+                    delay = min(30.0, self.retry_base * 2 ** attempt)
+                    print(f"⚠️ [{self.name}] Ghi lỗi ({e}), thử lại sau {delay:.1f}s")
+                    time.sleep(delay)
+
+            with self._condition:
+                self._in_flight = 0
+                self._condition.notify_all()
+
+    def flush(self, timeout=None):
+        """Chờ đến khi mọi record trong hàng đợi đã được ghi (hoặc bỏ)
+
+        True chỉ khi hàng đợi đã ghi hết và không record nào bị bỏ từ lần
+        flush() trước; (collection, doc_id) bị bỏ nằm trong dropped_keys.
+        """
+        deadline = time.time() + timeout if timeout else None
+        with self._condition:
+            self._condition.notify_all()
+            while self._queue or self._in_flight:
+                remaining = deadline - time.time() if deadline else None
+                if remaining is not None and remaining <= 0:
+                    return False
+                self._condition.notify_all()
+                self._condition.wait(timeout=min(remaining, 0.1) if remaining else 0.1)
+            self.dropped_keys, self._dropped = self._dropped, set()
+        return not self.dropped_keys
+
+    def clear(self, collection, keep=()):
+        # Flush trước để thao tác xóa không vượt lên trước các lần ghi đang chờ
+        self.flush()
+        return self.backend.clear(collection, keep)
+
+    def close(self):
+        self.flush()
+        with self._condition:
+            self._stop = True
+            self._condition.notify_all()
+        if self._thread is not None:
+            self._thread.join(timeout=5)
+        self.backend.close()
+
+
+class Storage:
+    """Ghi cùng một lần chạy vào một hoặc nhiều backend
+
+    Mỗi document chỉ được tạo Record (và encode JSON) một lần rồi chuyển cho
+    mọi backend.
+    """
+
+    def __init__(self, backends):
+        self.backends = list(backends)
+        self._accepted = 0
+        # (collection, doc_id) bị write-behind bỏ trong lần flush() gần nhất
+        self.dropped_keys = set()
+        self._lock = threading.Lock()
+
+    @property
+    def names(self):
+        return [backend.name for backend in self.backends]
+
+    @property
+    def written(self):
+        """Số document đã ghi xong ở mọi backend
+
+        Với backend write-behind chỉ tính record đã flush thành công, không
+        tính record còn trong hàng đợi hoặc đã bị bỏ.
+        """
+        with self._lock:
+            counts = [self._accepted]
+        counts.extend(backend.stats['written'] for backend in self.backends if isinstance(backend, WriteBehindBuffer))
+        return min(counts)
+
+    def write(self, collection, doc_id, data):
+        return self.write_many(collection, [(doc_id, data)])
+
+    def write_many(self, collection, documents):
+        """documents: list (doc_id, data) hoặc (doc_id, data, fields); doc_id None thì tự sinh"""
+        records = [Record(collection, *document) for document in documents]
+        for backend in self.backends:
+            backend.write_many(records)
+        with self._lock:
+            self._accepted += len(records)
+        return len(records)
+
+    def clear(self, collection, keep=()):
+        """Xóa documents của collection ở mọi backend; trả về số lớn nhất đã xóa"""
+        deleted = 0
+        for backend in self.backends:
+            deleted = max(deleted, backend.clear(collection, keep) or 0)
+        return deleted
+
+    def flush(self, timeout=None):
+        """Chờ các backend write-behind ghi xong
+
+        False nếu hết timeout hoặc có record bị bỏ kể từ lần flush() trước
+        (xem dropped_keys): caller không được coi dữ liệu đó là đã lưu.
+        """
+        done = True
+        dropped = set()
+        for backend in self.backends:
+            if isinstance(backend, WriteBehindBuffer):
+                done = backend.flush(timeout) and done
+                dropped.update(backend.dropped_keys)
+        self.dropped_keys = dropped
+        return done
+
+    def close(self):
+        for backend in self.backends:
+            backend.close()
+
+    def summary(self):
+        parts = []
+        for backend in self.backends:
+            if isinstance(backend, WriteBehindBuffer):
+                stats = backend.stats
+                parts.append(f"{backend.name}: {stats['written']} ghi, {stats['flushes']} lô, "
+                             f"{stats['retries']} retries, {stats['dropped']} bỏ")
+            else:
+                parts.append(backend.name)
+        return f"{self.written} documents → " + '; '.join(parts)
+
+
+def configured_backends():
+    """Tên các backend theo STORAGE_BACKENDS (mặc định 'firestore')"""
+    return [name.strip() for name in os.getenv('STORAGE_BACKENDS', 'firestore').split(',') if name.strip()]
+
+
+def open_storage(db=None, backends=None, write_behind=None, batch_size=None):
+    """Tạo Storage theo cấu hình (mặc định từ biến môi trường)
+
+    backends: list tên backend, mặc định STORAGE_BACKENDS (mặc định 'firestore').
+    Backend 'firestore' bị bỏ qua khi không có db. Trả về None nếu không còn
+    backend nào.
+    """
+    if backends is None:
+        backends = configured_backends()
+    if write_behind is None:
+        write_behind = os.getenv('STORAGE_WRITE_BEHIND', '0') == '1'
+
+    instances = []
+    for name in backends:
+        if name == 'firestore':
+            if db is None:
+                continue
+            backend = FirestoreBackend(db, batch_size)
+        elif name == 'sqlite':
+            backend = SQLiteBackend()
+        elif name == 'jsonl':
+            backend = JsonLinesBackend()
+        elif name == 'memory':
+            backend = MemoryBackend()
+        else:
+            raise ValueError(f"Storage backend không hợp lệ: {name} (hỗ trợ: {', '.join(BACKENDS)})")
+        instances.append(WriteBehindBuffer(backend) if write_behind else backend)
+
+    return Storage(instances) if instances else None
@@ -0,0 +1,232 @@
+import os
+import sqlite3
+import threading
+import time
+
+# Yahoo symbol đã biết của các coin phổ biến, theo CoinGecko id (ticker có thể trùng giữa nhiều coin)
+KNOWN_SYMBOLS = {
+    'bitcoin': 'BTC-USD',
+    'ethereum': 'ETH-USD',
+    'binancecoin': 'BNB-USD',
+    'solana': 'SOL-USD',
+    'cardano': 'ADA-USD',
+    'ripple': 'XRP-USD',
+    'polkadot': 'DOT-USD',
+    'dogecoin': 'DOGE-USD',
+    'avalanche-2': 'AVAX-USD',
+    'chainlink': 'LINK-USD',
+    'matic-network': 'MATIC-USD',
+    'litecoin': 'LTC-USD',
+    'bitcoin-cash': 'BCH-USD',
+    'stellar': 'XLM-USD',
+    'vechain': 'VET-USD',
+    'filecoin': 'FIL-USD',
+    'tron': 'TRX-USD',
+    'ethereum-classic': 'ETC-USD',
+    'cosmos': 'ATOM-USD',
+    'internet-computer': 'ICP-USD',
+    'uniswap': 'UNI-USD',
+    'algorand': 'ALGO-USD',
+    'hedera-hashgraph': 'HBAR-USD',
+    'aptos': 'APT-USD',
+    'near': 'NEAR-USD',
+    'optimism': 'OP-USD',
+    'arbitrum': 'ARB-USD',
+    'lido-dao': 'LDO-USD',
+    'rocket-pool': 'RPL-USD',
+    'maker': 'MKR-USD'
+}
+
+# Thời gian (giây) trước khi kiểm tra lại một symbol
+DEFAULT_OK_TTL = 30 * 86400    # Symbol đã xác nhận có trên Yahoo
+DEFAULT_BAD_TTL = 7 * 86400    # Symbol không có trên Yahoo (negative cache)
+
+
+def candidate_symbol(coin):
+    """Yahoo symbol dự đoán cho một coin của CoinGecko (dict có 'id', 'symbol')"""
+    return KNOWN_SYMBOLS.get(coin['id']) or f"{coin['symbol'].upper()}-USD"
+
+
+class SymbolIndex:
+    """Index CoinGecko id -> Yahoo symbol đã kiểm tra, lưu trên đĩa (SQLite)
+
+    Mỗi entry có status 'ok' (symbol có quote trên Yahoo) hoặc 'bad'
+    (không có) và thời điểm hết hạn. Coin trong KNOWN_SYMBOLS dùng luôn,
+    không cần kiểm tra. Coin chưa có trong index được kiểm tra ngay (batch
+    quote, vài request cho cả trăm symbol); entry hết hạn vẫn được dùng
+    theo status cũ và kiểm tra lại ở background. Nhờ vậy mỗi lần chạy chỉ
+    gửi request quote cho symbol đã biết là có trên Yahoo.
+    """
+
+    def __init__(self, path=None, ok_ttl=None, bad_ttl=None):
+        self.path = path or os.getenv('SYMBOL_INDEX_PATH', os.path.join('.cache', 'symbol_index.sqlite3'))
+        self.ok_ttl = ok_ttl or float(os.getenv('SYMBOL_OK_TTL', DEFAULT_OK_TTL))
+        self.bad_ttl = bad_ttl or float(os.getenv('SYMBOL_BAD_TTL', DEFAULT_BAD_TTL))
+
+        self._lock = threading.Lock()
+        self._refreshing = set()
+        self._refresh_threads = []
+        self.stats = {'known': 0, 'ok': 0, 'bad': 0, 'verified': 0, 'rejected': 0, 'unverified': 0, 'refresh': 0}
+
+        directory = os.path.dirname(self.path)
+        if directory:
+            os.makedirs(directory, exist_ok=True)
+        with self._connect() as conn:
+            conn.execute(
+                'CREATE TABLE IF NOT EXISTS symbols ('
+                ' coingecko_id TEXT PRIMARY KEY,'
+                ' yahoo_symbol TEXT NOT NULL,'
+                ' status TEXT NOT NULL,'
+                ' checked_at REAL NOT NULL,'
+                ' expires_at REAL NOT NULL)'
+            )
+
+    def _connect(self):
+        # Mỗi thao tác mở connection riêng để dùng an toàn từ nhiều thread
+        return sqlite3.connect(self.path, timeout=10)
+
+    def _count(self, key, amount=1):
+        with self._lock:
+            self.stats[key] += amount
+
+    def lookup_many(self, coingecko_ids):
+        """{coingecko_id: (yahoo_symbol, status, expires_at)} cho các id có trong index"""
+        coingecko_ids = list(coingecko_ids)
+        rows = {}
+        with self._connect() as conn:
+            # Giới hạn biến của SQLite cũ là 999
+            for start in range(0, len(coingecko_ids), 500):
+                chunk = coingecko_ids[start:start + 500]
+                placeholders = ','.join('?' * len(chunk))
+                for coingecko_id, yahoo_symbol, status, expires_at in conn.execute(
+                    'SELECT coingecko_id, yahoo_symbol, status, expires_at FROM symbols'
+                    f' WHERE coingecko_id IN ({placeholders})',
+                    chunk
+                ):
+                    rows[coingecko_id] = (yahoo_symbol, status, expires_at)
+        return rows
+
+    def mark_many(self, results):
+        """Ghi kết quả kiểm tra {coingecko_id: (yahoo_symbol, True/False)}"""
+        if not results:
+            return
+        now = time.time()
+        with self._connect() as conn:
+            conn.executemany(
+                'INSERT OR REPLACE INTO symbols (coingecko_id, yahoo_symbol, status, checked_at, expires_at)'
+                ' VALUES (?, ?, ?, ?, ?)',
+                [
+                    (coingecko_id, yahoo_symbol, 'ok' if valid else 'bad', now,
+                     now + (self.ok_ttl if valid else self.bad_ttl))
+                    for coingecko_id, (yahoo_symbol, valid) in results.items()
+                ]
+            )
+
+    def verify(self, candidates, verify_fn):
+        """Kiểm tra {coingecko_id: yahoo_symbol} bằng verify_fn và ghi vào index
+
+        verify_fn(symbols) trả về (tập symbol có trên Yahoo, tập symbol đã
+        kiểm tra được). Symbol chưa kiểm tra được (request lỗi) không bị
+        đánh dấu 'bad'. Trả về {coingecko_id: (yahoo_symbol, hợp lệ hay không)}
+        của các coin đã kiểm tra được.
+        """
+        if not candidates:
+            return {}
+        valid, checked = verify_fn(sorted(set(candidates.values())))
+        results = {
+            coingecko_id: (yahoo_symbol, yahoo_symbol in valid)
+            for coingecko_id, yahoo_symbol in candidates.items()
+            if yahoo_symbol in checked
+        }
+        self.mark_many(results)
+        return results
+
+    def resolve(self, coins, verify_fn):
+        """Yahoo symbol cho danh sách coin của CoinGecko
+
+        Trả về {coingecko_id: yahoo_symbol} chỉ gồm coin có symbol hợp lệ.
+        Coin mới được kiểm tra ngay; coin có entry hết hạn dùng status cũ
+        và được kiểm tra lại ở background.
+        """
+        now = time.time()
+        entries = self.lookup_many(coin['id'] for coin in coins if coin['id'] not in KNOWN_SYMBOLS)
+        resolved = {}
+        unknown = {}
+        expired = {}
+
+        for coin in coins:
+            coingecko_id = coin['id']
+            if coingecko_id in KNOWN_SYMBOLS:
+                resolved[coingecko_id] = KNOWN_SYMBOLS[coingecko_id]
+                self._count('known')
+                continue
+
+            entry = entries.get(coingecko_id)
+            if entry is None:
+                unknown[coingecko_id] = candidate_symbol(coin)
+                continue
+
+            yahoo_symbol, status, expires_at = entry
+            if status == 'ok':
+                resolved[coingecko_id] = yahoo_symbol
+                self._count('ok')
+            else:
+                self._count('bad')
+            if expires_at <= now:
+                expired[coingecko_id] = yahoo_symbol if status == 'ok' else candidate_symbol(coin)
+
+        if unknown:
+            results = self.verify(unknown, verify_fn)
+            verified = {coingecko_id: yahoo_symbol for coingecko_id, (yahoo_symbol, ok) in results.items() if ok}
+            resolved.update(verified)
+            self._count('verified', len(verified))
+            self._count('rejected', len(results) - len(verified))
+            self._count('unverified', len(unknown) - len(results))
+            if len(verified) < len(unknown):
+                print(f"🔎 Symbol index: {len(verified)}/{len(unknown)} coin mới có trên Yahoo"
+                      + (f", {len(unknown) - len(results)} chưa kiểm tra được" if len(results) < len(unknown) else ''))
+
+        if expired:
+            self._refresh_in_background(expired, verify_fn)
+
+        # Giữ thứ tự của coins
+        return {coin['id']: resolved[coin['id']] for coin in coins if coin['id'] in resolved}
+
+    def _refresh_in_background(self, candidates, verify_fn):
+        with self._lock:
+            candidates = {key: value for key, value in candidates.items() if key not in self._refreshing}
+            self._refreshing.update(candidates)
+        if not candidates:
+            return
+
+        def refresh():
+            try:
+                self.verify(candidates, verify_fn)
+                self._count('refresh', len(candidates))
+            except Exception as e:
+                print(f"⚠️ Lỗi khi kiểm tra lại symbol index: {e}")
+            finally:
+                with self._lock:
+                    self._refreshing.difference_update(candidates)
+
+        thread = threading.Thread(target=refresh, daemon=True)
+        thread.start()
+        with self._lock:
+            self._refresh_threads.append(thread)
+
+    def wait_for_refreshes(self, timeout=30):
+        """Chờ các lượt kiểm tra lại ở background ghi xong trước khi thoát"""
+        deadline = time.time() + timeout
+        with self._lock:
+            threads = list(self._refresh_threads)
+            self._refresh_threads = []
+        for thread in threads:
+            thread.join(max(0, deadline - time.time()))
+
+    def print_stats(self):
+        """In thống kê resolve symbol của lần chạy"""
+        stats = self.stats
+        print(f"🔎 Symbol index ({self.path}): {stats['known']} có sẵn, {stats['ok']} đã xác nhận, "
+              f"{stats['bad']} bỏ qua (không có trên Yahoo), {stats['verified']} mới hợp lệ, "
+              f"{stats['rejected']} mới không hợp lệ, {stats['unverified']} chưa kiểm tra được, "
+              f"{stats['refresh']} kiểm tra lại ở background")
@@ -0,0 +1,53 @@
+"""Cấu hình chung cho test: chạy offline với FakeTransport / FakeFirestore của benchmarks
+
+Chạy:
+    python -m pytest -q
+"""
+import os
+import sys
+
+import pytest
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, os.path.join(ROOT, 'scripts'))
+sys.path.insert(0, os.path.join(ROOT, 'benchmarks'))
+
+# Không có upstream thật để bảo vệ, không ghi lịch sử giá ra đĩa
+os.environ.setdefault('HTTP_RATE_LIMIT', '0')
+os.environ.setdefault('PRICE_HISTORY', '0')
+
+from fakes import FakeFirestore, FakeTransport  # noqa: E402
+
+
+@pytest.fixture(autouse=True)
+def isolated_paths(tmp_path, monkeypatch):
+    """Metrics, tỷ giá tốt gần nhất... ghi vào thư mục tạm của từng test"""
+    monkeypatch.setenv('METRICS_DIR', str(tmp_path / 'metrics'))
+    monkeypatch.setenv('FX_LAST_GOOD_PATH', str(tmp_path / 'fx_last_good.json'))
+    monkeypatch.setenv('SYMBOL_INDEX_PATH', str(tmp_path / 'symbol_index.sqlite3'))
+    monkeypatch.setenv('ASSET_UNIVERSE_PATH', str(tmp_path / 'asset_universe.json'))
+
+
+@pytest.fixture
+def make_tracker(tmp_path):
+    """Tạo CryptoTracker offline: transport giả, cache và Firestore giả mới"""
+    from crypto_tracker import CryptoTracker
+    from quote_cache import QuoteCache
+
+    trackers = []
+
+    def make(transport=None, **attributes):
+        tracker = CryptoTracker(use_db=False)
+        tracker.transport = (transport or FakeTransport()).install(tracker.http)
+        tracker.cache = QuoteCache(path=str(tmp_path / f'quote_cache_{len(trackers)}.sqlite3'))
+        tracker.history_enabled = False
+        tracker.use_db = True
+        tracker.db = FakeFirestore()
+        for name, value in attributes.items():
+            setattr(tracker, name, value)
+        trackers.append(tracker)
+        return tracker
+
+    yield make
+    for tracker in trackers:
+        tracker.close()
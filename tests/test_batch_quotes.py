@@ -0,0 +1,147 @@
+"""Batch quote /v7/finance/quote và fallback sang chart API từng symbol"""
+import json
+from urllib.parse import parse_qs, urlparse
+
+import pytest
+
+from fakes import FakeTransport
+
+
+class RecordingTransport(FakeTransport):
+    """FakeTransport ghi lại URL; batch quote bỏ các symbol trong omit, lỗi 500 nếu fail_batch,
+    401 (thiếu crumb) nếu unauthorized"""
+
+    def __init__(self, omit=(), fail_batch=False, unauthorized=False):
+        super().__init__()
+        self.omit = set(omit)
+        self.fail_batch = fail_batch
+        self.unauthorized = unauthorized
+        self.urls = []
+
+    def route(self, url):
+        with self._lock:
+            self.urls.append(url)
+        parsed = urlparse(url)
+        if parsed.path.endswith('/v7/finance/quote'):
+            if self.unauthorized:
+                return 401, b'{"finance": {"error": {"code": "Unauthorized"}}}', 'application/json'
+            if self.fail_batch:
+                return 500, b'{"error": "server error"}', 'application/json'
+            symbols = parse_qs(parsed.query)['symbols'][0].split(',')
+            body = {'quoteResponse': {'result': [
+                self.quote_for(symbol) for symbol in symbols if symbol not in self.omit
+            ], 'error': None}}
+            return 200, json.dumps(body).encode('utf-8'), 'application/json'
+        return super().route(url)
+
+    def batch_symbols(self):
+        return [
+            parse_qs(urlparse(url).query)['symbols'][0].split(',')
+            for url in self.urls if urlparse(url).path.endswith('/v7/finance/quote')
+        ]
+
+    def chart_symbols(self):
+        return [urlparse(url).path.rsplit('/', 1)[-1] for url in self.urls if '/v8/finance/chart/' in url]
+
+
+@pytest.fixture
+def batch_tracker(make_tracker):
+    def make(transport, batch_size=50):
+        tracker = make_tracker(transport, indicators_enabled=False, use_batch_quotes=True,
+                               batch_size=batch_size, yahoo_hedge_urls=[])
+        tracker.http.max_retries = 0
+        return tracker
+    return make
+
+
+def test_parse_batch_quote_matches_chart_fields(make_tracker):
+    tracker = make_tracker()
+    quote = tracker.transport.quote_for('BTC-USD')
+
+    data = tracker.parse_batch_quote('BTC-USD', quote)
+
+    assert data['symbol'] == 'BTC-USD'
+    assert data['current_price'] == quote['regularMarketPrice']
+    assert data['previous_close'] == quote['regularMarketPreviousClose']
+    assert data['change'] == pytest.approx(quote['regularMarketPrice'] - quote['regularMarketPreviousClose'])
+    assert data['change_percent'] == pytest.approx(data['change'] / data['previous_close'] * 100)
+    assert data['market_time'] == quote['regularMarketTime']
+
+
+def test_parse_batch_quote_names_indices_and_gold(make_tracker):
+    tracker = make_tracker()
+
+    index = tracker.parse_batch_quote('^GSPC', tracker.transport.quote_for('^GSPC'))
+    gold = tracker.parse_batch_quote('GC=F', tracker.transport.quote_for('GC=F'))
+
+    assert index['name'] == 'S&P 500'
+    assert (gold['name'], gold['symbol'], gold['currency']) == ('Spot Gold', 'XAU/USD', 'USD')
+
+
+def test_batch_quotes_are_chunked_by_batch_size(batch_tracker):
+    transport = RecordingTransport()
+    tracker = batch_tracker(transport, batch_size=2)
+    symbols = ['BTC-USD', 'ETH-USD', 'SOL-USD', 'ADA-USD', 'XRP-USD']
+
+    data = tracker.get_all_crypto_data(symbols)
+
+    assert list(data) == symbols
+    assert transport.batch_symbols() == [symbols[0:2], symbols[2:4], symbols[4:5]]
+    assert transport.chart_symbols() == []
+
+
+def test_symbols_missing_from_batch_fall_back_to_chart(batch_tracker):
+    transport = RecordingTransport(omit={'ETH-USD'})
+    tracker = batch_tracker(transport)
+
+    data = tracker.get_all_crypto_data(['BTC-USD', 'ETH-USD', 'SOL-USD'])
+
+    assert list(data) == ['BTC-USD', 'ETH-USD', 'SOL-USD']
+    assert transport.chart_symbols() == ['ETH-USD']
+    assert data['ETH-USD']['current_price']
+
+
+def test_failed_batch_falls_back_to_chart_for_whole_chunk(batch_tracker):
+    transport = RecordingTransport(fail_batch=True)
+    tracker = batch_tracker(transport)
+
+    data = tracker.get_all_crypto_data(['BTC-USD', 'ETH-USD'])
+
+    assert list(data) == ['BTC-USD', 'ETH-USD']
+    assert sorted(transport.chart_symbols()) == ['BTC-USD', 'ETH-USD']
+    assert tracker.failed_symbols == []
+
+
+def test_stock_indices_are_fetched_by_yahoo_symbol(batch_tracker):
+    transport = RecordingTransport()
+    tracker = batch_tracker(transport)
+
+    indices = tracker.get_all_stock_indices()
+
+    assert list(indices) == ['SP500', 'NASDAQ100', 'NASDAQ_COMPOSITE']
+    assert indices['SP500']['name'] == 'S&P 500'
+    assert transport.batch_symbols() == [['^GSPC', '^NDX', '^IXIC']]
+    # Cache dùng chung key Yahoo symbol với fetch_all_quotes
+    assert tracker.cache.lookup_many('price', ['^GSPC']).get('^GSPC')
+
+
+def test_batch_quotes_are_opt_in(make_tracker, monkeypatch):
+    monkeypatch.delenv('YAHOO_BATCH_QUOTES', raising=False)
+
+    assert make_tracker().use_batch_quotes is False
+
+
+def test_unauthorized_batch_skips_remaining_chunks(batch_tracker):
+    transport = RecordingTransport(unauthorized=True)
+    tracker = batch_tracker(transport, batch_size=2)
+    symbols = ['BTC-USD', 'ETH-USD', 'SOL-USD', 'ADA-USD', 'XRP-USD']
+
+    data = tracker.get_all_crypto_data(symbols)
+
+    assert list(data) == symbols
+    assert transport.batch_symbols() == [symbols[0:2]]
+    assert sorted(transport.chart_symbols()) == sorted(symbols)
+
+    # Lần sau (trong TTL) không gửi batch nữa
+    assert list(tracker.get_all_crypto_data(['DOT-USD', 'LTC-USD'])) == ['DOT-USD', 'LTC-USD']
+    assert len(transport.batch_symbols()) == 1
@@ -0,0 +1,94 @@
+"""Manifest hash của chế độ upsert chỉ ghi nhận document đã thực sự được lưu"""
+from change_detector import MANIFEST_COLLECTION, ChangeDetector, payload_hash
+from fakes import FakeFirestore
+from storage import FirestoreBackend, SQLiteBackend, Storage, WriteBehindBuffer
+
+
+class FlakyFirestoreBackend(FirestoreBackend):
+    """FirestoreBackend lỗi khi ghi document có id trong fail_ids"""
+
+    def __init__(self, db, fail_ids=()):
+        super().__init__(db)
+        self.fail_ids = set(fail_ids)
+
+    def write_many(self, records):
+        if any(record.doc_id in self.fail_ids for record in records):
+            raise RuntimeError('write failed')
+        return super().write_many(records)
+
+
+def write_behind(backend):
+    return WriteBehindBuffer(backend, max_batch=1, flush_interval=0.01, max_retries=0)
+
+
+def manifest_hashes(db, tracker):
+    return (db.documents.get(f"{MANIFEST_COLLECTION}/{tracker.collection_name}") or {}).get('hashes', {})
+
+
+def test_commit_keeps_old_hash_for_failed_documents():
+    db = FakeFirestore()
+    detector = ChangeDetector(db, 'collection')
+    detector.mark_written('a', {'value': 1})
+    detector.mark_written('b', {'value': 2})
+
+    detector.commit(detector.pending(), failed={'b'})
+    detector.flush()
+
+    assert db.documents['publish_manifests/collection']['hashes'] == {'a': payload_hash({'value': 1})}
+    assert detector.written == ['a'] and detector.failed == ['b']
+
+
+def test_dropped_write_is_retried_on_next_run(make_tracker):
+    db = FakeFirestore()
+    backend = FlakyFirestoreBackend(db, fail_ids={'stock_indices'})
+    tracker = make_tracker(publish_mode='upsert')
+    tracker.db = db
+    tracker.storage = Storage([write_behind(backend)])
+
+    assert tracker.save_to_firestore('stock_indices', {'value': 1})
+    assert tracker.save_to_firestore('commodities', {'value': 2})
+    tracker.flush_change_detector()
+
+    hashes = manifest_hashes(db, tracker)
+    assert 'commodities' in hashes and 'stock_indices' not in hashes
+
+    # Lần chạy sau: backend đã ổn, document ghi lỗi phải được ghi lại
+    backend.fail_ids.clear()
+    tracker.change_detector = None
+    assert tracker.save_to_firestore('stock_indices', {'value': 1})
+    assert tracker.save_to_firestore('commodities', {'value': 2})
+    tracker.flush_change_detector()
+
+    assert tracker.change_detector.written == ['stock_indices']
+    assert tracker.change_detector.skipped == ['commodities']
+    assert 'stock_indices' in manifest_hashes(db, tracker)
+
+
+def test_no_manifest_without_firestore_backend(make_tracker, tmp_path):
+    db = FakeFirestore()
+    tracker = make_tracker(publish_mode='upsert')
+    tracker.db = db
+    tracker.storage = Storage([SQLiteBackend(str(tmp_path / 'storage.sqlite3'))])
+
+    assert tracker.save_to_firestore('stock_indices', {'value': 1})
+    tracker.flush_change_detector()
+
+    assert tracker.get_change_detector() is None
+    assert db.reads == 0 and db.writes == 0
+
+
+def test_summary_counts_only_the_current_run(make_tracker):
+    db = FakeFirestore()
+    tracker = make_tracker(publish_mode='upsert')
+    tracker.db = db
+    tracker.storage = Storage([FirestoreBackend(db)])
+
+    assert tracker.refresh('indices')
+    first = tracker.change_detector
+    assert first.written
+
+    assert tracker.refresh('indices')
+    detector = tracker.change_detector
+    assert detector is first
+    assert len(detector.written) + len(detector.skipped) == 2
+    assert 'stock_indices' in detector.skipped and 'stock_indices' not in detector.written
@@ -0,0 +1,103 @@
+"""BatchWriter: chunk tối đa 500 thao tác, xóa collection theo trang"""
+import pytest
+
+from fakes import FakeFirestore
+from firestore_batch import MAX_BATCH_OPS, BatchWriter
+
+
+class PagedCollection:
+    """Bọc FakeCollection, ghi lại page_size của list_documents"""
+
+    def __init__(self, collection):
+        self.collection = collection
+        self.page_sizes = []
+
+    def list_documents(self, page_size=None):
+        self.page_sizes.append(page_size)
+        return self.collection.list_documents(page_size=page_size)
+
+
+def fill(db, collection, count):
+    for index in range(count):
+        db.documents[f"{collection}/doc-{index:04d}"] = {'index': index}
+
+
+def test_writes_are_committed_in_chunks_of_500():
+    db = FakeFirestore()
+    writer = BatchWriter(db)
+    collection = db.collection('products')
+
+    for index in range(1201):
+        writer.set(collection.document(f"doc-{index:04d}"), {'index': index})
+    writer.commit()
+
+    assert db.batch_sizes == [500, 500, 201]
+    assert writer.rpc_count == 3
+    assert writer.doc_count == 1201
+    assert len(db.documents) == 1201
+
+
+def test_chunk_size_is_capped_at_firestore_limit():
+    writer = BatchWriter(FakeFirestore(), chunk_size=2000)
+
+    assert writer.chunk_size == MAX_BATCH_OPS
+
+
+@pytest.mark.parametrize('chunk_size, expected', [(100, [100, 100, 50]), (250, [250])])
+def test_custom_chunk_size(chunk_size, expected):
+    db = FakeFirestore()
+    writer = BatchWriter(db, chunk_size=chunk_size)
+    collection = db.collection('products')
+
+    for index in range(250):
+        writer.set(collection.document(f"doc-{index}"), {'index': index})
+    writer.commit()
+
+    assert db.batch_sizes == expected
+
+
+def test_commit_without_pending_ops_sends_nothing():
+    db = FakeFirestore()
+    writer = BatchWriter(db)
+
+    writer.commit()
+
+    assert db.commits == 0
+    assert writer.rpc_count == 0
+
+
+def test_delete_collection_pages_and_batches_deletes():
+    db = FakeFirestore()
+    fill(db, 'products', 1201)
+    fill(db, 'other', 3)
+    collection = PagedCollection(db.collection('products'))
+    writer = BatchWriter(db)
+
+    deleted = writer.delete_collection(collection)
+
+    assert deleted == 1201
+    assert collection.page_sizes == [MAX_BATCH_OPS]
+    assert db.batch_sizes == [500, 500, 201]
+    # 3 commit + 3 trang list_documents
+    assert writer.rpc_count == 6
+    assert sorted(db.documents) == ['other/doc-0000', 'other/doc-0001', 'other/doc-0002']
+
+
+def test_delete_collection_keeps_listed_ids():
+    db = FakeFirestore()
+    fill(db, 'products', 10)
+    writer = BatchWriter(db)
+
+    deleted = writer.delete_collection(db.collection('products'), keep={'doc-0003', 'doc-0007'})
+
+    assert deleted == 8
+    assert sorted(db.documents) == ['products/doc-0003', 'products/doc-0007']
+
+
+def test_delete_empty_collection_counts_one_list_rpc():
+    db = FakeFirestore()
+    writer = BatchWriter(db)
+
+    assert writer.delete_collection(db.collection('products')) == 0
+    assert db.commits == 0
+    assert writer.rpc_count == 1
@@ -0,0 +1,104 @@
+"""HttpClient: hedged request gửi một lần, chờ token / backoff không vượt quá deadline"""
+import time
+
+import pytest
+
+from fakes import FakeTransport
+from http_client import DeadlineExceeded, HttpClient, TokenBucket
+
+PRIMARY = 'https://query1.finance.yahoo.com/v8/finance/chart/BTC-USD'
+BACKUP = 'https://query2.finance.yahoo.com/v8/finance/chart/BTC-USD'
+
+
+class UnavailableTransport(FakeTransport):
+    """Mọi request đều trả 503 kèm Retry-After"""
+
+    def __init__(self, retry_after='5'):
+        super().__init__()
+        self.retry_after = retry_after
+
+    def route(self, url):
+        return 503, b'{"error": "unavailable"}', 'application/json'
+
+    def send(self, request, **kwargs):
+        response = super().send(request, **kwargs)
+        response.headers['Retry-After'] = self.retry_after
+        return response
+
+
+def client(transport, **kwargs):
+    http = HttpClient(rate_limits=kwargs.pop('rate_limits', {}), **kwargs)
+    transport.install(http)
+    return http
+
+
+def test_hedged_attempts_are_not_retried():
+    transport = UnavailableTransport(retry_after='0')
+    http = client(transport, max_retries=3)
+
+    response = http.get_hedged([PRIMARY, BACKUP])
+
+    assert response.status_code == 503
+    assert transport.requests == 2
+    assert http.totals()['retries'] == 0
+    http.close()
+
+
+def test_hedge_latency_excludes_token_wait():
+    transport = FakeTransport()
+    host = 'query1.finance.yahoo.com'
+    http = client(transport, rate_limits={host: (20.0, 1)})
+    http.hedge_initial_delay = 0.02
+    http.limiter(host).tokens = 0.0
+
+    start = time.perf_counter()
+    response = http.get_hedged([PRIMARY, BACKUP])
+
+    assert response.status_code == 200
+    # Chờ token (~50ms) xảy ra trước khi tính hedge delay: không gửi bản sao
+    assert time.perf_counter() - start >= 0.04
+    assert http.hedge_stats['hedged'] == 0
+    assert http._latencies[host].percentile(50, min_samples=1) < 0.02
+    http.close()
+
+
+def test_token_wait_past_deadline_raises_without_sleeping():
+    now = [100.0]
+    sleeps = []
+
+    def sleep(seconds):
+        sleeps.append(seconds)
+        now[0] += seconds
+
+    bucket = TokenBucket(1.0, 1, clock=lambda: now[0], sleep=sleep)
+    bucket.tokens = 0.0
+
+    with pytest.raises(DeadlineExceeded):
+        bucket.acquire(deadline=now[0] + 0.5)
+    assert sleeps == []
+
+    assert bucket.acquire(deadline=now[0] + 2) == 1.0
+    assert sleeps == [1.0]
+
+
+def test_backoff_longer_than_deadline_returns_last_response():
+    transport = UnavailableTransport(retry_after='5')
+    http = client(transport, max_retries=5)
+
+    start = time.monotonic()
+    response = http.get(PRIMARY, deadline=start + 1)
+
+    assert response.status_code == 503
+    assert transport.requests == 1
+    assert time.monotonic() - start < 0.5
+    http.close()
+
+
+def test_request_after_deadline_is_not_sent():
+    transport = FakeTransport()
+    http = client(transport)
+
+    with pytest.raises(DeadlineExceeded):
+        http.get(PRIMARY, deadline=time.monotonic() - 1)
+    assert transport.requests == 0
+    http.close()
@@ -0,0 +1,53 @@
+"""Chỉ báo kỹ thuật: tắt mặc định, series lưu kèm quote trong cache giá"""
+from crypto_tracker import CACHED_SERIES_FIELD, CryptoTracker
+from fakes import FakeTransport
+
+
+class CountingTransport(FakeTransport):
+    """FakeTransport đếm số request chart API"""
+
+    def __init__(self):
+        super().__init__()
+        self.chart_requests = 0
+
+    def route(self, url):
+        if '/v8/finance/chart/' in url:
+            with self._lock:
+                self.chart_requests += 1
+        return super().route(url)
+
+
+def test_indicators_are_opt_in(monkeypatch):
+    monkeypatch.delenv('INDICATORS', raising=False)
+    tracker = CryptoTracker(use_db=False)
+    try:
+        assert tracker.indicators_enabled is False
+    finally:
+        tracker.close()
+
+
+def test_cached_quotes_reuse_cached_series(make_tracker):
+    transport = CountingTransport()
+    tracker = make_tracker(transport, indicators_enabled=True, yahoo_hedge_urls=[])
+    symbols = ['BTC-USD', 'ETH-USD']
+
+    first = tracker.get_all_crypto_data(symbols)
+    requests = transport.chart_requests
+    second = tracker.get_all_crypto_data(symbols)
+
+    assert requests == 2
+    # Lần hai lấy quote và series từ cache: không gọi chart API
+    assert transport.chart_requests == requests
+    assert [second[symbol]['indicators'] for symbol in symbols] == [first[symbol]['indicators'] for symbol in symbols]
+    assert all(CACHED_SERIES_FIELD not in quote for quote in second.values())
+
+
+def test_series_field_is_dropped_when_indicators_are_off(make_tracker):
+    transport = CountingTransport()
+    tracker = make_tracker(transport, indicators_enabled=True, yahoo_hedge_urls=[])
+    tracker.get_all_crypto_data(['BTC-USD'])
+
+    tracker.indicators_enabled = False
+    quote = tracker.get_all_crypto_data(['BTC-USD'])['BTC-USD']
+
+    assert CACHED_SERIES_FIELD not in quote and 'indicators' not in quote
@@ -0,0 +1,80 @@
+"""Pipeline tổng quan: hàng hóa qua fetch_quotes, symbol lỗi riêng theo nhánh"""
+import json
+from urllib.parse import parse_qs, unquote, urlparse
+
+from fakes import FakeTransport
+
+
+class FailingTransport(FakeTransport):
+    """FakeTransport không trả quote cho các symbol trong fail (batch bỏ qua, chart 404)"""
+
+    def __init__(self, fail=()):
+        super().__init__()
+        self.fail = set(fail)
+        self.urls = []
+
+    def route(self, url):
+        with self._lock:
+            self.urls.append(url)
+        parsed = urlparse(url)
+        if parsed.path.endswith('/v7/finance/quote'):
+            symbols = parse_qs(parsed.query)['symbols'][0].split(',')
+            body = {'quoteResponse': {'result': [
+                self.quote_for(symbol) for symbol in symbols if symbol not in self.fail
+            ], 'error': None}}
+            return 200, json.dumps(body).encode('utf-8'), 'application/json'
+        if '/v8/finance/chart/' in parsed.path and unquote(parsed.path.rsplit('/', 1)[-1]) in self.fail:
+            return 404, b'{"chart": {"result": null}}', 'application/json'
+        return super().route(url)
+
+
+def test_commodities_use_batch_and_cache(make_tracker):
+    transport = FailingTransport()
+    tracker = make_tracker(transport, yahoo_hedge_urls=[], use_batch_quotes=True)
+
+    first = tracker.get_all_commodities()
+    requests = len(transport.urls)
+    second = tracker.get_all_commodities()
+
+    assert list(first) == ['GOLD']
+    assert (first['GOLD']['name'], first['GOLD']['symbol']) == ('Spot Gold', 'XAU/USD')
+    assert all('/v7/finance/quote' in url for url in transport.urls)
+    assert len(transport.urls) == requests and second == first
+
+
+def test_failures_go_to_caller_list(make_tracker):
+    tracker = make_tracker(FailingTransport(fail={'^NDX'}), yahoo_hedge_urls=[])
+    tracker.http.max_retries = 0
+    failed = []
+
+    indices = tracker.get_all_stock_indices(failed)
+
+    assert list(indices) == ['SP500', 'NASDAQ_COMPOSITE']
+    assert failed == ['^NDX']
+    assert tracker.failed_symbols == []
+
+
+def test_stale_quote_is_not_a_failure(make_tracker):
+    tracker = make_tracker(FailingTransport(), yahoo_hedge_urls=[])
+    tracker.get_all_stock_indices()
+    tracker.cache.ttls['price'] = 0
+    tracker.transport.fail.add('^NDX')
+    tracker.http.max_retries = 0
+    failed = []
+
+    indices = tracker.get_all_stock_indices(failed)
+
+    assert indices['NASDAQ100']['stale'] is True
+    assert failed == []
+
+
+def test_pipeline_merges_branch_failures(make_tracker):
+    tracker = make_tracker(FailingTransport(fail={'^NDX', 'GC=F'}), yahoo_hedge_urls=[],
+                           pipeline_enabled=True, top_limit=5)
+    tracker.http.max_retries = 0
+
+    tracker.full_market_overview()
+
+    assert sorted(tracker.failed_symbols) == ['GC=F', '^NDX']
+    assert set(tracker.metrics.values) >= {'pipeline_crypto_seconds', 'pipeline_indices_seconds',
+                                           'pipeline_commodities_seconds'}
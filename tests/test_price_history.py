@@ -0,0 +1,70 @@
+"""Lịch sử giá: compaction theo symbol và publish qua storage"""
+import os
+import time
+
+from fakes import FakeFirestore
+from price_history import PriceHistoryStore
+from storage import FirestoreBackend, MemoryBackend, Storage
+
+DAY = 86400
+
+
+def old_partitions(store, resolution='1m'):
+    base = os.path.join(store.root, resolution)
+    partitions = {symbol: sorted(os.listdir(os.path.join(base, symbol))) for symbol in store.symbols(resolution)}
+    return {symbol: days for symbol, days in partitions.items() if days}
+
+
+def test_compact_only_touches_given_symbols(tmp_path):
+    store = PriceHistoryStore(root=str(tmp_path))
+    old = time.time() - 10 * DAY
+    store.append('BTC-USD', old, 100.0)
+    store.append('ETH-USD', old, 10.0)
+
+    compacted = store.compact(symbols=['BTC-USD'])
+
+    assert compacted == 1
+    assert list(old_partitions(store)) == ['ETH-USD']
+    assert store.symbols('1h') == ['BTC-USD']
+
+
+def test_append_quotes_returns_symbols_with_new_points(tmp_path):
+    store = PriceHistoryStore(root=str(tmp_path))
+    now = int(time.time())
+    quotes = {'BTC-USD': {'current_price': 1.0, 'market_time': now}, 'ETH-USD': {'current_price': None}}
+
+    assert store.append_quotes(quotes) == ['BTC-USD']
+    assert store.append_quotes(quotes) == []
+
+
+def history_tracker(make_tracker, tmp_path, storage):
+    tracker = make_tracker(publish_mode='upsert', history_enabled=True)
+    tracker._history = PriceHistoryStore(root=str(tmp_path / 'history'))
+    tracker.storage = storage
+    tracker.history.append('BTC-USD', time.time() - 60, 100.0)
+    return tracker
+
+
+def test_publish_history_goes_through_storage(make_tracker, tmp_path):
+    backend = MemoryBackend()
+    tracker = history_tracker(make_tracker, tmp_path, Storage([backend]))
+
+    assert tracker.publish_history(['BTC-USD', 'ETH-USD']) == 1
+    assert list(backend.collections['price_history']) == ['BTC-USD']
+    assert backend.collections['price_history']['BTC-USD']['points'] == 1
+
+
+def test_unchanged_history_is_not_rewritten(make_tracker, tmp_path):
+    db = FakeFirestore()
+    tracker = history_tracker(make_tracker, tmp_path, Storage([FirestoreBackend(db)]))
+    tracker.db = db
+
+    assert tracker.publish_history(['BTC-USD']) == 1
+    writes = db.writes
+    tracker.history_detector = None
+    assert tracker.publish_history(['BTC-USD']) == 0
+    # Chỉ đọc manifest, không ghi lại chuỗi không đổi
+    assert db.writes == writes
+
+    tracker.history.append('BTC-USD', time.time(), 101.0)
+    assert tracker.publish_history(['BTC-USD']) == 1
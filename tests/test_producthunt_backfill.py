@@ -0,0 +1,90 @@
+"""Backfill Product Hunt: lỗi khi lưu không checkpoint ngày đó, rate limit qua token bucket của HttpClient,
+số ngày đang tải bị giới hạn"""
+import threading
+from datetime import date
+
+from fakes import FakeTransport
+from http_client import TokenBucket
+from producthunt_backfill import ProductHuntBackfill
+from producthunt_scraper import ProductHuntScraper
+from storage import MemoryBackend, Storage
+
+
+class FailingStorage(Storage):
+    """Storage raise khi ghi document có id trong fail_ids"""
+
+    def __init__(self, fail_ids):
+        super().__init__([MemoryBackend()])
+        self.fail_ids = set(fail_ids)
+
+    def write(self, collection, doc_id, data):
+        if doc_id in self.fail_ids:
+            raise RuntimeError('write failed')
+        return super().write(collection, doc_id, data)
+
+
+class CountingBackfill(ProductHuntBackfill):
+    """Ghi lại số ngày đã tải mà chưa xử lý xong (HTML đang được giữ)"""
+
+    def __init__(self, *args, **kwargs):
+        super().__init__(*args, **kwargs)
+        self.fetched = 0
+        self.processed = 0
+        self.max_held = 0
+        self._lock = threading.Lock()
+
+    def fetch_day(self, day):
+        content = super().fetch_day(day)
+        with self._lock:
+            self.fetched += 1
+            self.max_held = max(self.max_held, self.fetched - self.processed)
+        return content
+
+    def process_day(self, day, future):
+        count = super().process_day(day, future)
+        with self._lock:
+            self.processed += 1
+        return count
+
+
+def make_backfill(tmp_path, storage, rate=0, backfill_class=ProductHuntBackfill):
+    scraper = ProductHuntScraper(use_db=False)
+    FakeTransport().install(scraper.http)
+    scraper.storage = storage
+    return backfill_class(scraper=scraper, state_path=str(tmp_path / 'state.json'),
+                          workers=2, rate=rate, save_to_db=True)
+
+
+def test_save_error_marks_day_failed(tmp_path):
+    backfill = make_backfill(tmp_path, FailingStorage({'2025-07-15'}))
+
+    stats = backfill.run(date(2025, 7, 14), date(2025, 7, 16))
+
+    assert stats['failed'] == ['2025-07-15']
+    assert stats['completed'] == 2
+    assert not backfill.state.is_done(date(2025, 7, 15))
+    assert backfill.state.is_done(date(2025, 7, 14)) and backfill.state.is_done(date(2025, 7, 16))
+
+
+def test_rate_uses_http_client_token_bucket(tmp_path):
+    backfill = make_backfill(tmp_path, Storage([MemoryBackend()]), rate=2)
+
+    limiter = backfill.scraper.http.limiter('www.producthunt.com')
+
+    assert isinstance(limiter, TokenBucket)
+    assert (limiter.rate, limiter.burst) == (2, 1)
+
+
+def test_zero_rate_disables_limit(tmp_path):
+    backfill = make_backfill(tmp_path, Storage([MemoryBackend()]), rate=0)
+
+    assert backfill.scraper.http.limiter('www.producthunt.com') is None
+
+
+def test_days_in_flight_are_bounded(tmp_path):
+    backfill = make_backfill(tmp_path, Storage([MemoryBackend()]), backfill_class=CountingBackfill)
+
+    stats = backfill.run(date(2025, 7, 1), date(2025, 7, 20))
+
+    assert stats['completed'] == 20
+    assert backfill.max_held <= backfill.workers * 2
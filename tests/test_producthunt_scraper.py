@@ -0,0 +1,151 @@
+"""ProductHuntScraper: document sản phẩm và đường trích xuất dữ liệu"""
+import os
+import subprocess
+import sys
+from datetime import date
+
+import pytest
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+PRODUCT = {
+    'rank': 1, 'date': '2025/7/15', 'description': 'd', 'title': 't', 'image': None,
+    'link': 'https://www.producthunt.com/posts/t', 'topics': [], 'votes': 10
+}
+
+
+@pytest.fixture
+def scraper(monkeypatch):
+    from producthunt_scraper import ProductHuntScraper
+    from run_context import RunContext
+
+    monkeypatch.delenv('PH_EMBEDDED_JSON', raising=False)
+    return ProductHuntScraper(use_db=False, context=RunContext(target_date=date(2025, 7, 15)))
+
+
+def apollo_state(ranks, extra_posts=0):
+    """State Apollo với connection leaderboard gồm các Post theo thứ tự ranks (None = thiếu rank)"""
+    cache = {'ROOT_QUERY': {'__typename': 'Query', 'leaderboardDailyPosts({"day":15})': {
+        '__typename': 'PostConnection',
+        'edges': [{'__typename': 'PostEdge', 'node': {'__ref': f"Post:{index}"}} for index in range(len(ranks))]
+    }}}
+    for index, rank in enumerate(ranks):
+        cache[f"Post:{index}"] = {'__typename': 'Post', 'name': f"Post {index}", 'slug': f"post-{index}",
+                                  'dailyRank': rank, 'votesCount': 100 - index}
+    # Post khác trong cache (ví dụ gợi ý, sản phẩm liên quan) không thuộc leaderboard
+    for index in range(extra_posts):
+        cache[f"Post:x{index}"] = {'__typename': 'Post', 'name': f"Other {index}", 'dailyRank': 1}
+    cache['ROOT_QUERY']['viewer'] = {'__typename': 'Viewer', 'featured': [{'__ref': 'Post:x0'}]} if extra_posts else None
+    return {'props': {'pageProps': {'apolloState': cache}}}
+
+
+FIXTURES_DIR = os.path.join(ROOT, 'benchmarks', 'fixtures')
+
+
+def test_embedded_json_is_default(scraper, monkeypatch):
+    from producthunt_scraper import ProductHuntScraper
+
+    assert scraper.use_embedded_json is True
+    monkeypatch.setenv('PH_EMBEDDED_JSON', '0')
+    assert ProductHuntScraper(use_db=False).use_embedded_json is False
+
+
+def test_page_without_state_falls_back_to_dom(scraper):
+    with open(os.path.join(FIXTURES_DIR, 'leaderboard_2025-7-15.html'), 'rb') as f:
+        products = scraper.parse_products(f.read())
+
+    assert scraper.extraction_path == 'dom'
+    assert products
+
+
+def test_posts_follow_leaderboard_edges(scraper):
+    products = scraper.extract_products_from_state(apollo_state([2, 1, 3], extra_posts=2))
+
+    assert [product['title'] for product in products] == ['Post 0', 'Post 1', 'Post 2']
+    assert [product['rank'] for product in products] == [2, 1, 3]
+    assert products[0]['link'] == 'https://www.producthunt.com/posts/post-0'
+
+
+def test_missing_rank_falls_back_to_dom(scraper):
+    assert scraper.extract_products_from_state(apollo_state([1, None, 3])) == []
+
+
+def test_state_without_leaderboard_connection_is_ignored(scraper):
+    state = apollo_state([1, 2])
+    del state['props']['pageProps']['apolloState']['ROOT_QUERY']['leaderboardDailyPosts({"day":15})']
+
+    assert scraper.extract_products_from_state(state) == []
+
+
+def test_json_path_reads_whole_leaderboard(scraper):
+    products = scraper.extract_products_from_state(apollo_state(list(range(1, 31))))
+
+    assert len(products) == 30
+    assert products[-1]['rank'] == 30
+
+
+def test_local_backend_does_not_import_firebase():
+    """--no-db / backend cục bộ không được import firebase_admin chỉ để lấy SERVER_TIMESTAMP"""
+    code = (
+        "import sys\n"
+        "from datetime import date\n"
+        "from producthunt_scraper import ProductHuntScraper\n"
+        "from run_context import RunContext\n"
+        "from storage import MemoryBackend, Storage\n"
+        "scraper = ProductHuntScraper(use_db=False, context=RunContext(target_date=date(2025, 7, 15)))\n"
+        "scraper.storage = Storage([MemoryBackend()])\n"
+        f"assert scraper.save_to_firestore([{PRODUCT!r}])\n"
+        "print('firebase_admin' in sys.modules)\n"
+    )
+    result = subprocess.run(
+        [sys.executable, '-c', code], cwd=os.path.join(ROOT, 'scripts'),
+        capture_output=True, text=True, check=True
+    )
+    assert result.stdout.strip().splitlines()[-1] == 'False'
+
+
+def test_created_at_is_local_time_without_firestore():
+    from producthunt_scraper import ProductHuntScraper
+    from run_context import RunContext
+
+    scraper = ProductHuntScraper(use_db=False, context=RunContext(target_date=date(2025, 7, 15)))
+
+    created_at = scraper.build_document(PRODUCT)['createdAt']
+
+    assert created_at.tzinfo is not None
+
+
+def recording_scraper(monkeypatch, **kwargs):
+    """Scraper mà _run chỉ ghi lại context của từng run"""
+    from producthunt_scraper import ProductHuntScraper
+
+    scraper = ProductHuntScraper(use_db=False, **kwargs)
+    contexts = []
+    monkeypatch.setattr(scraper, '_run', lambda *args: contexts.append(scraper.context))
+    return scraper, contexts
+
+
+def test_run_uses_context_from_constructor(monkeypatch):
+    from run_context import RunContext
+
+    context = RunContext(target_date=date(2025, 7, 15))
+    scraper, contexts = recording_scraper(monkeypatch, context=context)
+
+    scraper.run(save_to_db=False, save_to_file=False)
+    scraper.run(save_to_db=False, save_to_file=False)
+
+    assert contexts == [context, context]
+
+
+def test_each_run_gets_a_new_context_by_default(monkeypatch):
+    from run_context import RunContext
+
+    scraper, contexts = recording_scraper(monkeypatch)
+    given = RunContext(target_date=date(2025, 7, 15))
+
+    scraper.run(save_to_db=False, save_to_file=False)
+    scraper.run(save_to_db=False, save_to_file=False, context=given)
+    scraper.run(save_to_db=False, save_to_file=False)
+
+    assert contexts[1] is given
+    assert len({id(context) for context in contexts}) == 3
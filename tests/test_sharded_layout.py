@@ -0,0 +1,114 @@
+"""Layout sharded: xóa coin rời universe chỉ khi universe đổi, field bị bỏ được xóa khỏi document"""
+from crypto_tracker import CRYPTO_ASSETS_DOCUMENT
+from storage import FirestoreBackend, MemoryBackend, Storage, WriteBehindBuffer
+
+
+class CountingStorage(Storage):
+    """Storage ghi lại các lần clear"""
+
+    def __init__(self, backends):
+        super().__init__(backends)
+        self.clears = []
+
+    def clear(self, collection, keep=()):
+        self.clears.append(sorted(keep))
+        return super().clear(collection, keep)
+
+
+class FlakyFirestoreBackend(FirestoreBackend):
+    """FirestoreBackend lỗi khi fail=True"""
+
+    def __init__(self, db):
+        super().__init__(db)
+        self.fail = False
+
+    def write_many(self, records):
+        if self.fail:
+            raise RuntimeError('write failed')
+        return super().write_many(records)
+
+
+def coin(price, **extra):
+    return {'symbol': 'BTC', 'current_price': price, **extra}
+
+
+def test_clear_runs_only_when_universe_changes(make_tracker):
+    tracker = make_tracker(publish_mode='replace')
+    tracker.storage = CountingStorage([MemoryBackend()])
+
+    assert tracker.save_crypto_assets({'BTC-USD': coin(1), 'ETH-USD': coin(2)})
+    assert tracker.save_crypto_assets({'BTC-USD': coin(3), 'ETH-USD': coin(4)})
+    assert tracker.save_crypto_assets({'BTC-USD': coin(5), 'ETH-USD': coin(6), 'SOL-USD': coin(7)})
+    assert tracker.storage.clears == [['BTC-USD', 'ETH-USD']]
+
+    assert tracker.save_crypto_assets({'BTC-USD': coin(5), 'SOL-USD': coin(7)})
+    assert tracker.storage.clears[-1] == ['BTC-USD', 'SOL-USD']
+
+
+def test_universe_is_remembered_across_runs(make_tracker):
+    first = make_tracker(publish_mode='replace')
+    first.storage = CountingStorage([MemoryBackend()])
+    first.save_crypto_assets({'BTC-USD': coin(1)})
+
+    second = make_tracker(publish_mode='replace')
+    second.storage = CountingStorage([MemoryBackend()])
+    second.save_crypto_assets({'BTC-USD': coin(2)})
+
+    assert second.storage.clears == []
+
+
+def test_removed_field_is_deleted_not_nulled(make_tracker):
+    tracker = make_tracker(publish_mode='upsert')
+    tracker.storage = Storage([FirestoreBackend(tracker.db)])
+    path = f"{tracker.collection_name}/{CRYPTO_ASSETS_DOCUMENT}/BTC-USD"
+
+    assert tracker.save_crypto_assets({'BTC-USD': coin(1, note='x')})
+    tracker.flush_change_detector()
+    assert tracker.db.documents[path]['note'] == 'x'
+
+    assert tracker.save_crypto_assets({'BTC-USD': coin(2)})
+    document = tracker.db.documents[path]
+    assert 'note' not in document
+    assert document['current_price'] == 2
+
+
+def test_no_asset_manifest_without_firestore_backend(make_tracker):
+    tracker = make_tracker(publish_mode='upsert')
+    tracker.storage = Storage([MemoryBackend()])
+
+    assert tracker.save_crypto_assets({'BTC-USD': coin(1)})
+
+    assert tracker.get_asset_manifest() is None
+    assert tracker.db.reads == 0 and tracker.db.writes == 0
+
+
+def test_dropped_asset_write_is_retried_on_next_run(make_tracker):
+    tracker = make_tracker(publish_mode='upsert')
+    backend = FlakyFirestoreBackend(tracker.db)
+    tracker.storage = Storage([WriteBehindBuffer(backend, max_batch=1, flush_interval=0.01, max_retries=0)])
+    path = f"{tracker.collection_name}/{CRYPTO_ASSETS_DOCUMENT}/BTC-USD"
+
+    assert tracker.save_crypto_assets({'BTC-USD': coin(1)})
+    tracker.flush_change_detector()
+
+    # Lần ghi giá mới bị write-behind bỏ: manifest phải giữ hash cũ
+    backend.fail = True
+    assert tracker.save_crypto_assets({'BTC-USD': coin(2)})
+    tracker.flush_change_detector()
+    assert tracker.db.documents[path]['current_price'] == 1
+
+    backend.fail = False
+    assert tracker.save_crypto_assets({'BTC-USD': coin(2)})
+    tracker.flush_change_detector()
+    assert tracker.db.documents[path]['current_price'] == 2
+
+
+def test_single_layout_is_default(make_tracker, monkeypatch):
+    monkeypatch.delenv('CRYPTO_LAYOUT', raising=False)
+    tracker = make_tracker()
+
+    documents = tracker.build_documents({'BTC-USD': coin(1)}, {'BTC-USD': {'rank': 1}}, {}, {})
+
+    assert tracker.crypto_layout == 'single'
+    assert CRYPTO_ASSETS_DOCUMENT not in documents
+    assert documents['cryptocurrencies']['data']['BTC-USD']['current_price'] == 1
@@ -0,0 +1,26 @@
+"""SnapshotPublisher: dọn version cũ gồm cả subcollection của layout sharded"""
+from fakes import FakeFirestore
+from snapshot_publisher import SnapshotPublisher
+
+
+def write_version(db, collection, run_id, coins):
+    base = f"{collection}_versions/{run_id}"
+    db.documents[base] = {'run_id': run_id}
+    db.documents[f"{base}/docs/market_overview"] = {'crypto_count': len(coins)}
+    db.documents[f"{base}/docs/cryptocurrencies"] = {'layout': 'sharded'}
+    for symbol in coins:
+        db.documents[f"{base}/docs/cryptocurrencies/assets/{symbol}"] = {'symbol': symbol}
+
+
+def test_garbage_collection_deletes_nested_assets():
+    db = FakeFirestore()
+    publisher = SnapshotPublisher(db, 'prices', keep_versions=1)
+    for run_id in ('run-1', 'run-2', 'run-3'):
+        write_version(db, 'prices', run_id, ['BTC-USD', 'ETH-USD'])
+    # Document cha không có dữ liệu vẫn được list (như Firestore)
+    del db.documents['prices_versions/run-2/docs/cryptocurrencies']
+
+    assert publisher.collect_garbage('run-3') == 2
+
+    assert 'prices_versions/run-3/docs/cryptocurrencies/assets/BTC-USD' in db.documents
+    assert not [path for path in db.documents if 'run-1' in path or 'run-2' in path]
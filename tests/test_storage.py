@@ -0,0 +1,60 @@
+"""Storage / WriteBehindBuffer: chỉ báo thành công khi dữ liệu đã thực sự được ghi"""
+from storage import MemoryBackend, Storage, WriteBehindBuffer
+
+
+class FailingBackend(MemoryBackend):
+    """MemoryBackend lỗi khi ghi document có id trong fail_ids"""
+
+    def __init__(self, fail_ids=()):
+        super().__init__()
+        self.fail_ids = set(fail_ids)
+
+    def write_many(self, records):
+        if any(record.doc_id in self.fail_ids for record in records):
+            raise RuntimeError('write failed')
+        return super().write_many(records)
+
+
+def buffered(backend):
+    return WriteBehindBuffer(backend, max_batch=1, flush_interval=0.01, max_retries=1, retry_base=0.001)
+
+
+def test_flush_reports_written_records():
+    backend = MemoryBackend()
+    storage = Storage([buffered(backend)])
+
+    storage.write('products', 'a', {'value': 1})
+
+    assert storage.flush() is True
+    assert storage.written == 1
+    assert backend.collections['products'] == {'a': {'value': 1}}
+    storage.close()
+
+
+def test_flush_fails_when_records_were_dropped():
+    storage = Storage([buffered(FailingBackend({'bad'}))])
+
+    storage.write('products', 'good', {'value': 1})
+    storage.write('products', 'bad', {'value': 2})
+
+    assert storage.flush() is False
+    assert storage.dropped_keys == {('products', 'bad')}
+    assert storage.written == 1
+
+    # Lần flush sau chỉ tính record bị bỏ từ lần flush trước
+    storage.write('products', 'next', {'value': 3})
+    assert storage.flush() is True
+    assert storage.dropped_keys == set()
+    storage.close()
+
+
+def test_written_does_not_count_queued_records():
+    buffer = WriteBehindBuffer(MemoryBackend(), max_batch=100, flush_interval=60)
+    storage = Storage([MemoryBackend(), buffer])
+
+    storage.write_many('products', [('a', {}), ('b', {})])
+
+    assert storage.written == 0
+    assert storage.flush() is True
+    assert storage.written == 2
+    storage.close()